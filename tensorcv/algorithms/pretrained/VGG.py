@@ -57,7 +57,9 @@ class BaseVGG(BaseModel):
                  is_load=False,
                  pre_train_path=None,
                  is_rescale=False,
-                 trainable=False):
+                 trainable=False,
+                 trainable_head=None,
+                 cache_layer=None):
         """ 
         Args:
             num_class (int): number of image classes
@@ -65,6 +67,20 @@ class BaseVGG(BaseModel):
             im_height, im_width (int): size of input image
                                Can be unknown when testing.
             learning_rate (float): learning rate of training
+            trainable (bool): whether conv layers are trainable
+            trainable_head (bool): whether fc layers are trainable.
+                               Default to be the same as trainable.
+            cache_layer (str): 'pool5', 'conv_out' or 'conv5_4' (same
+                               as 'conv_out'). If not None, 
+                               fc layers can be fed by the cached 
+                               activations of this layer, which are 
+                               used as training input instead of images 
+                               (see dataflow.FeatureCache). 
+                               Conv layers have to be frozen.
+                               Validation data (FeedInference) are
+                               still images and labels, which 
+                               requires input_mode 'feed'.
+                               Not supported by VGG19_FCN.
         """
 
         self.learning_rate = learning_rate
@@ -74,6 +90,16 @@ class BaseVGG(BaseModel):
         self.num_class = num_class
         self._is_rescale = is_rescale
         self._trainable = trainable
+        if trainable_head is None:
+            trainable_head = trainable
+        self._trainable_head = trainable_head
+
+        if cache_layer is not None:
+            assert cache_layer in ['pool5', 'conv_out', 'conv5_4'],\
+            'cache_layer has to be pool5, conv_out or conv5_4!'
+            assert not trainable,\
+            'conv layers have to be frozen when cache_layer is used!'
+        self._cache_layer = cache_layer
 
         self.layer = {}
 
@@ -97,6 +123,54 @@ class BaseVGG(BaseModel):
         self.set_train_placeholder([self.image, self.label])
         self.set_prediction_placeholder(self.image)
 
+    def get_cache_feature(self):
+        """ Inputs and frozen activations for caching.
+
+        Returns:
+            (list, tf.tensor): placeholders of the frozen layers 
+            and the activations to be cached.
+        """
+        return [self.image], self.layer[self._cache_layer]
+
+    def get_inference_placeholder(self):
+        if self._cache_layer is None:
+            return super(BaseVGG, self).get_inference_placeholder()
+        # images instead of cached features. Label placeholder is taken
+        # from train placeholders, which may be replaced by train input.
+        train_plhs = self.get_train_placeholder()
+        # fc layers take the batch of queue or tensor input if 
+        # cache_feature is replaced
+        assert train_plhs[0] is self.cache_feature,\
+        'Images cannot be used for inference with cache_layer and '\
+        'input_mode queue or tensor. Use input_mode feed instead!'
+        return [self.image] + train_plhs[1:]
+
+    def _create_cache_input(self, conv_output):
+        """ Input of fc layers which can be fed by cached activations.
+
+        If the cached activations are not fed, fc layers take the 
+        output of conv layers as usual (e.g. for prediction).
+        """
+        cache_layer = self.layer[self._cache_layer]
+        self.cache_feature = tf.placeholder_with_default(
+            cache_layer, shape=cache_layer.get_shape(), name='cache_feature')
+        self.set_train_placeholder([self.cache_feature, self.label])
+        if self._cache_layer == 'pool5':
+            return self.cache_feature
+        return max_pool(self.cache_feature, 'pool5_cache', padding='SAME')
+
+    def _load_pre_train(self):
+        """ Pre-trained parameters used to initialize variables.
+
+        Parameters are only loaded when variables are created. When 
+        the model is built again with variables reused (e.g. towers or 
+        the loop of steps_per_run), initializers are not used, so an 
+        empty dict is returned instead of loading the file again.
+        """
+        if not self._is_load or tf.get_variable_scope().reuse:
+            return {}
+        return np.load(self._pre_train_path, encoding='latin1').item()
+
 
 class VGG19(BaseVGG):
 
@@ -120,9 +194,7 @@ class VGG19(BaseVGG):
                 red - VGG_MEAN[2],
             ])
 
-        data_dict = {}
-        if self._is_load:
-            data_dict = np.load(self._pre_train_path, encoding='latin1').item() 
+        data_dict = self._load_pre_train()
 
         self._create_conv(input_bgr, data_dict)
 
@@ -192,14 +264,15 @@ class VGG19(BaseVGG):
                 red - VGG_MEAN[2],
             ])
 
-        data_dict = {}
-        if self._is_load:
-            data_dict = np.load(self._pre_train_path, encoding='latin1').item()  
+        data_dict = self._load_pre_train()
 
         conv_output = self._create_conv(input_bgr, data_dict)
+        if self._cache_layer is not None:
+            conv_output = self._create_cache_input(conv_output)
         
         arg_scope = tf.contrib.framework.arg_scope
-        with arg_scope([fc], trainable=self._trainable, data_dict=data_dict):
+        with arg_scope([fc], trainable=self._trainable_head, 
+                       data_dict=data_dict):
             fc6 = fc(conv_output, 4096, 'fc6', nl=tf.nn.relu)
             dropout_fc6 = dropout(fc6, keep_prob, self.is_training)
 
@@ -215,6 +288,12 @@ class VGG19(BaseVGG):
 
 class VGG19_FCN(VGG19):
 
+    def __init__(self, *args, **kwargs):
+        super(VGG19_FCN, self).__init__(*args, **kwargs)
+        # fc layers of FCN are conv layers taking inputs of any size
+        assert self._cache_layer is None,\
+        'cache_layer is not supported by VGG19_FCN!'
+
     def _create_model(self):
 
         with tf.name_scope('input'):
@@ -235,14 +314,13 @@ class VGG19_FCN(VGG19):
                 red - VGG_MEAN[2],
             ])
 
-        data_dict = {}
-        if self._is_load:
-            data_dict = np.load(self._pre_train_path, encoding='latin1').item()
+        data_dict = self._load_pre_train()
 
         conv_outptu = self._create_conv(input_bgr, data_dict)
 
         arg_scope = tf.contrib.framework.arg_scope
-        with arg_scope([conv], trainable=self._trainable, data_dict=data_dict):
+        with arg_scope([conv], trainable=self._trainable_head, 
+                       data_dict=data_dict):
 
             fc6 = conv(conv_outptu, 7, 4096, 'fc6',
                        nl=tf.nn.relu, padding='VALID')
@@ -6,4 +6,6 @@ from .summary import *
 from .inference import *
 from .inferencer import *
 from .monitors import *
-from .debug import *
\ No newline at end of file
+from .debug import *
+from .profile import *
+from .exporter import *
\ No newline at end of file
@@ -14,6 +14,9 @@ def assert_type(v, tp):
 class Callback(object):
     """ base class for callbacks """
 
+    # only run on the chief worker in distributed training
+    chief_only = False
+
     def setup_graph(self, trainer):
         self.trainer = trainer
         self._setup_graph()
@@ -26,9 +29,33 @@ class Callback(object):
     def epochs_completed(self):
         return self.trainer.epochs_completed
 
+    @property
+    def steps_per_run(self):
+        """ number of training steps run by each session.run """
+        try:
+            return self.trainer.steps_per_run
+        except AttributeError:
+            return 1
+
+    def is_step_due(self, periodic):
+        """ Whether a step divisible by periodic is run by the last 
+        session.run, which runs steps_per_run steps. """
+        step = self.global_step
+        return step // periodic != (step - self.steps_per_run) // periodic
+
     def _setup_graph(self):
         pass
 
+    def get_run_trigger(self):
+        """ TriggerSpec of before_run and after_run, or None to
+        run them at every step. """
+        return None
+
+    def get_step_trigger(self):
+        """ TriggerSpec of trigger_step, or None to trigger 
+        at every step. """
+        return None
+
     def before_run(self, rct):
         fetch = self._before_run(rct)
         if fetch is None:
@@ -4,6 +4,7 @@
 import tensorflow as tf
 
 from .base import Callback
+from .trigger import TriggerSpec
 from ..utils.common import get_tensors_by_names
 
 __all__ = ['CheckScalar']
@@ -33,8 +34,11 @@ class CheckScalar(Callback):
     def _setup_graph(self):
         self._tensors = get_tensors_by_names(self._tensors)
 
+    def get_run_trigger(self):
+        return TriggerSpec(every_k_steps=self._periodic)
+
     def _before_run(self, _):
-        if self.global_step % self._periodic == 0:
+        if self.is_step_due(self._periodic):
             return tf.train.SessionRunArgs(fetches = self._tensors)
         else:
             return None
@@ -0,0 +1,169 @@
+# File: exporter.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import threading
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+from .monitors import TrainingMonitor, parse_scalars
+
+__all__ = ['MetricsServer']
+
+def get_rss_bytes():
+    """ Resident set size of this process in bytes, or None """
+    try:
+        import psutil
+        return psutil.Process(os.getpid()).memory_info().rss
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')\
+                .replace('\n', '\\n')
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+        body = self.server.monitor.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class MetricsServer(TrainingMonitor):
+    """ Serve training metrics in Prometheus text format at
+    http://host:port/metrics from a background thread.
+
+    Exported metrics: global step, epoch, images/sec, data wait
+    fraction of steps (feed input only), number of batches in queue 
+    before session.run (queue and tensor input only),
+    checkpoint latency (from ModelSaver), resident memory and
+    the last value of every scalar summary (e.g. losses).
+
+    Scalars of summaries are parsed by the training thread and only 
+    the last value of each tag is kept, so summaries emitted rarely
+    (e.g. profile/* and checkpoint/*) are not lost between scrapes and
+    scraping does not block training.
+    Timing metrics are updated every report_secs of TrainConfig.
+    """
+    def __init__(self, port=0, host='127.0.0.1', prefix='tensorcv'):
+        """
+        Args:
+            port (int): port of server. 0 for any free port, which is
+                printed when the server starts.
+            host (str): address of server. Default to be localhost only.
+            prefix (str): prefix of metric names
+        """
+        self._port = port
+        self._host = host
+        self._prefix = prefix
+        # last value of each scalar tag
+        self._scalars = {}
+        self._render_lock = threading.Lock()
+        self._server = None
+
+    @property
+    def port(self):
+        return self._port
+
+    def _before_train(self):
+        self._server = _ThreadingHTTPServer((self._host, self._port),
+                                            _MetricsHandler)
+        self._server.monitor = self
+        self._port = self._server.server_address[1]
+        self._server_thread = threading.Thread(
+            target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        print('[MetricsServer] serving metrics at http://{}:{}/metrics'
+              .format(self._host, self._port))
+
+    def _after_train(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server_thread.join()
+            self._server = None
+
+    def process_summary(self, summary):
+        # setting items of dict is thread safe
+        for tag, value in parse_scalars(summary):
+            self._scalars[tag] = value
+
+    def _get_queue_size(self):
+        try:
+            return self.trainer._train_input.queue_size()
+        except Exception:
+            # not QueueInput or session has been closed
+            return None
+
+    def _get_gauges(self, scalars):
+        gauges = [('global_step', 'Number of training steps',
+                   self.global_step),
+                  ('epoch', 'Number of completed epochs',
+                   self.epochs_completed),
+                  ('images_per_sec', 'Training images per second',
+                   scalars.get('profile/images_per_sec')),
+                  ('queue_size', 'Number of batches in input queue',
+                   self._get_queue_size()),
+                  ('checkpoint_save_seconds',
+                   'Seconds training waits for the last checkpoint',
+                   scalars.get('checkpoint/save_secs')),
+                  ('checkpoint_write_seconds',
+                   'Seconds of the last background checkpoint write',
+                   scalars.get('checkpoint/write_secs')),
+                  ('resident_memory_bytes', 'Resident memory of process',
+                   get_rss_bytes())]
+        queue_size = scalars.get('profile/input_queue_size/p50')
+        if queue_size is not None:
+            gauges.append(('input_queue_size_before_run',
+                           'Median number of batches in queue before '
+                           'session.run. 0 means waiting for data',
+                           queue_size))
+        data_wait = scalars.get('profile/data_wait/p50')
+        step_time = scalars.get('profile/step/p50')
+        if data_wait is not None and step_time:
+            gauges.append(('data_wait_fraction',
+                           'Fraction of step time waiting for data',
+                           data_wait / step_time))
+        return gauges
+
+    def render(self):
+        """ Metrics in Prometheus text format """
+        with self._render_lock:
+            # copy, since scalars are updated by the training thread
+            scalars = dict(self._scalars)
+            lines = []
+            for name, help_str, value in self._get_gauges(scalars):
+                if value is None:
+                    continue
+                name = '{}_{}'.format(self._prefix, name)
+                lines += ['# HELP {} {}'.format(name, help_str),
+                          '# TYPE {} gauge'.format(name),
+                          '{} {}'.format(name, float(value))]
+            name = '{}_scalar'.format(self._prefix)
+            lines += ['# HELP {} Last value of scalar summary'.format(name),
+                      '# TYPE {} gauge'.format(name)]
+            for tag in sorted(scalars):
+                lines.append('{}{{tag="{}"}} {}'.format(
+                    name, escape_label(tag), float(scalars[tag])))
+        return '\n'.join(lines) + '\n'
@@ -5,7 +5,7 @@ import numpy as np
 import tensorflow as tf
 
 from .base import Callback
-from .hooks import Callback2Hook
+from .hooks import CallbackScheduler
 
 __all__ = ['Callbacks']
 
@@ -26,8 +26,17 @@ class Callbacks(Callback):
             for cb in self.cbs:
                 cb.setup_graph(self.trainer)
 
-    def get_hooks(self):
-        return [Callback2Hook(cb) for cb in self.cbs]
+    def get_hooks(self, timer=None):
+        """
+        Args:
+            timer (StepTimer): record time of each callback if not None 
+        """
+        names = [cb.__class__.__name__ for cb in self.cbs]
+        # callbacks of the same class are distinguished by index
+        names = [name if names.count(name) == 1
+                 else '{}_{}'.format(name, names[:idx].count(name))
+                 for idx, name in enumerate(names)]
+        return [CallbackScheduler(self.cbs, timer=timer, names=names)]
 
     def _before_train(self):
         for cb in self.cbs:
@@ -55,9 +64,23 @@ class Callbacks(Callback):
         for cb in self.cbs:
             cb.trigger_epoch()
 
+    def _get_step_cbs(self):
+        """ callbacks implementing trigger_step with their TriggerSpec """
+        try:
+            return self._step_cbs
+        except AttributeError:
+            self._step_cbs = [
+                (cb, cb.get_step_trigger()) for cb in self.cbs
+                if type(cb)._trigger_step is not Callback._trigger_step
+                or type(cb).trigger_step is not Callback.trigger_step]
+            return self._step_cbs
+
     def _trigger_step(self):
-        for cb in self.cbs:
-            cb.trigger_step()
+        for cb, trigger in self._get_step_cbs():
+            if trigger is None or\
+                trigger.check(cb.global_step, cb.epochs_completed,
+                              cb.steps_per_run):
+                cb.trigger_step()
 
     # def trigger(self):
     #   self._trigger()
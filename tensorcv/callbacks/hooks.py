@@ -3,8 +3,9 @@ import tensorflow as tf
 from .base import Callback
 from .inferencer import InferencerBase
 from ..predicts.predictions import PredictionBase
+from ..utils.session import merge_run_options
 
-__all__ = ['Callback2Hook', 'Infer2Hook', 'Prediction2Hook']
+__all__ = ['Callback2Hook', 'CallbackScheduler', 'Infer2Hook', 'Prediction2Hook']
 
 def assert_type(v, tp):
     assert isinstance(v, tp), \
@@ -12,14 +13,113 @@ def assert_type(v, tp):
 
 class Callback2Hook(tf.train.SessionRunHook):
     """ """   
-    def __init__(self, cb):
+    def __init__(self, cb, timer=None, name=None):
+        """
+        Args:
+            timer (StepTimer): record time of before_run and after_run
+                if it is not None
+            name (str): name used in timer. Default to be class name.
+        """
         self.cb = cb
+        self._timer = timer
+        if name is None:
+            name = cb.__class__.__name__
+        self._before_name = 'callback/{}/before_run'.format(name)
+        self._after_name = 'callback/{}/after_run'.format(name)
 
     def before_run(self, rct):
-        return self.cb.before_run(rct)
+        if self._timer is None:
+            return self.cb.before_run(rct)
+        with self._timer.timeit(self._before_name):
+            return self.cb.before_run(rct)
 
     def after_run(self, rct, val):
-        self.cb.after_run(rct, val)
+        if self._timer is None:
+            self.cb.after_run(rct, val)
+        else:
+            with self._timer.timeit(self._after_name):
+                self.cb.after_run(rct, val)
+
+def uses_session_run(cb):
+    """ Whether before_run or after_run of cb is overridden """
+    for method in ['before_run', '_before_run', 'after_run', '_after_run']:
+        if getattr(type(cb), method) is not getattr(Callback, method):
+            return True
+    return False
+
+class CallbackScheduler(tf.train.SessionRunHook):
+    """ Run before_run and after_run of a list of callbacks as one hook.
+
+    At each step, only the callbacks due by their get_run_trigger()
+    are called, and their SessionRunArgs are merged into one, so 
+    callbacks fetching tensors every k steps (e.g. TrainSummary) 
+    cost nothing at the other steps. Callbacks which do not implement 
+    before_run and after_run are never called.
+    """
+    def __init__(self, cbs, timer=None, names=None):
+        """
+        Args:
+            cbs (list): list of Callback
+            timer (StepTimer): record time of before_run and after_run
+                of each callback if it is not None
+            names (list): names of callbacks used in timer. 
+                Default to be class names.
+        """
+        if names is None:
+            names = [cb.__class__.__name__ for cb in cbs]
+        self._timer = timer
+        self._entries = [(cb, cb.get_run_trigger(),
+                          'callback/{}/before_run'.format(name),
+                          'callback/{}/after_run'.format(name))
+                         for cb, name in zip(cbs, names)
+                         if uses_session_run(cb)]
+        self._due = []
+
+    def _call(self, name, fnc, *args):
+        if self._timer is None:
+            return fnc(*args)
+        with self._timer.timeit(name):
+            return fnc(*args)
+
+    def before_run(self, rct):
+        self._due = []
+        fetches = []
+        feed_dict = {}
+        options = None
+        for cb, trigger, before_name, after_name in self._entries:
+            if trigger is not None and\
+                not trigger.check(cb.global_step, cb.epochs_completed,
+                                  cb.steps_per_run):
+                continue
+            args = self._call(before_name, cb.before_run, rct)
+            fetch_idx = None
+            if args is not None:
+                if args.fetches is not None:
+                    fetch_idx = len(fetches)
+                    fetches.append(args.fetches)
+                if args.feed_dict:
+                    for key in args.feed_dict:
+                        if key in feed_dict:
+                            raise RuntimeError(
+                                'Same tensor is fed by multiple callbacks: {}'
+                                .format(key))
+                    feed_dict.update(args.feed_dict)
+                options = merge_run_options(options, args.options)
+            self._due.append((cb, after_name, fetch_idx))
+        if not self._due:
+            return None
+        return tf.train.SessionRunArgs(fetches=fetches,
+                                       feed_dict=feed_dict or None,
+                                       options=options)
+
+    def after_run(self, rct, val):
+        for cb, after_name, fetch_idx in self._due:
+            results = None if fetch_idx is None else val.results[fetch_idx]
+            cb_val = tf.train.SessionRunValues(
+                results=results, options=val.options,
+                run_metadata=val.run_metadata)
+            self._call(after_name, cb.after_run, rct, cb_val)
+        self._due = []
 
 class Infer2Hook(tf.train.SessionRunHook):
 	
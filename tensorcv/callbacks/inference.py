@@ -3,18 +3,21 @@
 
 import scipy.misc
 import os
+import threading
 from abc import ABCMeta
 
 import numpy as np
 import tensorflow as tf
 
 from .base import Callback
+from .trigger import TriggerSpec
 from .group import Callbacks
 from .inputs import FeedInput
 from ..dataflow.base import DataFlow
 from ..dataflow.randoms import RandomVec
 from .hooks import Callback2Hook, Infer2Hook
 from ..utils.sesscreate import ReuseSessionCreator
+from ..utils.default import get_default_session_config
 from .inferencer import InferencerBase
 
 __all__ = ['FeedInference', 'GANInference', 'FeedInferenceBatch']
@@ -24,17 +27,35 @@ def assert_type(v, tp):
     "Expect " + str(tp) + ", but " + str(v.__class__) + " is given!"
 
 class InferenceBase(Callback):
-    """ base class for Inference """
+    """ base class for Inference 
+
+    The hooked session for inference is created once and reused.
+    If run_async is True, inference runs in a background thread
+    while training goes on. Values of global variables are copied by
+    one session.run on the training thread (in the same way as async
+    ModelSaver) and loaded into a separate local session of the same
+    graph, so one inference uses a single version of weights even
+    though training keeps updating them. Results are reported to 
+    monitors at the step inference is done. Inference is skipped if 
+    the last one is not done yet.
+    """
+    chief_only = True
+
     def __init__(self, inputs=None, periodic=1, 
                  inferencers=None, extra_cbs=None,
-                 infer_batch_size=None):
+                 infer_batch_size=None, run_async=False):
         """
         Args:
             extra_cbs (list[Callback])
+            run_async (bool): run inference on a snapshot of weights
+                in a background thread
         """
         self._inputs = inputs
         self._periodic = periodic
         self._infer_batch_size = infer_batch_size
+        self._run_async = run_async
+        self._infer_thread = None
+        self._infer_error = None
 
         assert inferencers is not None or extra_cbs is not None,\
         "Inferencers and extra_cbs cannot be both None!"
@@ -63,6 +84,15 @@ class InferenceBase(Callback):
 
         for infer in self._inference_list:
             infer.setup_inferencer()
+
+        if self._run_async:
+            self._snapshot_vars = tf.global_variables()
+            # initializers of variables are used to load the snapshot,
+            # so no op is added after the graph is finalized
+            self._load_ops = [v.initializer for v in self._snapshot_vars]
+            self._load_inputs = [op.inputs[1] for op in self._load_ops]
+            self._local_init_ops = [v.initializer 
+                                    for v in tf.local_variables()]
    
     def setup_inference(self):
         self._setup_inference()
@@ -90,34 +120,99 @@ class InferenceBase(Callback):
                 + [Infer2Hook(infer) for infer in self._inference_list])
         
     def _create_infer_sess(self):
-        self.sess = self.trainer.sess
-        infer_hooks = self.get_infer_hooks()
-        self.hooked_sess = tf.train.MonitoredSession(
-            session_creator = ReuseSessionCreator(self.sess), 
-            hooks = infer_hooks)
+        try:
+            return self.hooked_sess
+        except AttributeError:
+            if self._run_async:
+                # variables of a session are not shared with the
+                # training session
+                self.sess = tf.Session(graph=self.trainer.sess.graph,
+                                       config=get_default_session_config())
+                self.sess.run(self._local_init_ops)
+            else:
+                self.sess = self.trainer.sess
+            for infer in self._inference_list:
+                infer.set_session(self.sess)
+            infer_hooks = self.get_infer_hooks()
+            self.hooked_sess = tf.train.MonitoredSession(
+                session_creator = ReuseSessionCreator(self.sess), 
+                hooks = infer_hooks)
+            return self.hooked_sess
+
+    def get_step_trigger(self):
+        return TriggerSpec(every_k_steps=self._periodic)
 
     def _trigger_step(self):
-        if self.global_step % self._periodic == 0:
+        if self.is_step_due(self._periodic):
+            if self._is_inferring():
+                print('[{}] inference at step {} is skipped since the '
+                      'last one is not done.'.format(
+                       self.__class__.__name__, self.global_step))
+                return
+            self._create_infer_sess()
+            # feed of model is got on training thread
+            self.model.set_is_training(False)
+            model_feed = self._get_model_feed()
+            if self._run_async:
+                # snapshot of weights taken on the training thread
+                values = tf.get_default_session().run(self._snapshot_vars)
+                self._infer_thread = threading.Thread(
+                    target=self._run_inference, args=(model_feed, values))
+                self._infer_thread.daemon = True
+                self._infer_thread.start()
+            else:
+                self._run_inference(model_feed)
+
+    def _is_inferring(self):
+        if self._infer_thread is not None\
+            and not self._infer_thread.is_alive():
+            self._wait_for_inference()
+        return self._infer_thread is not None
+
+    def _wait_for_inference(self):
+        if self._infer_thread is not None:
+            self._infer_thread.join()
+            self._infer_thread = None
+        if self._infer_error is not None:
+            error, self._infer_error = self._infer_error, None
+            raise error
+
+    def _load_snapshot(self, values):
+        self.sess.run(self._load_ops,
+                      feed_dict=dict(zip(self._load_inputs, values)))
+
+    def _run_inference(self, model_feed, values=None):
+        try:
+            if values is not None:
+                self._load_snapshot(values)
             for infer in self._inference_list:
                 infer.before_inference()
-
-            self._create_infer_sess()
-            self.inference_step()
-
+            self.inference_step(model_feed)
             for infer in self._inference_list:
                 infer.after_inference()
+        except Exception as e:
+            if not self._run_async:
+                raise
+            self._infer_error = e
 
-    def inference_step(self):
-        # TODO to be modified
-        self.model.set_is_training(False)
+    def inference_step(self, model_feed):
         self._cbs.before_inference()
-        self._inference_step()
+        self._inference_step(model_feed)
 
-    def _inference_step(self, extra_feed):
-        self.hooked_sess.run(fetches = [], feed_dict = extra_feed)
+    def _get_model_feed(self):
+        return self.model.get_graph_feed()
+
+    def _inference_step(self, model_feed):
+        self.hooked_sess.run(fetches = [], feed_dict = model_feed)
 
     def _after_train(self):
+        self._wait_for_inference()
         self._cbs.after_train()
+        if self._run_async:
+            try:
+                self.sess.close()
+            except AttributeError:
+                pass
 
         
 class FeedInference(InferenceBase):
@@ -127,7 +222,7 @@ class FeedInference(InferenceBase):
     """
     def __init__(self, inputs, periodic=1, 
                  inferencers=[], extra_cbs=None,
-                 infer_batch_size=None):
+                 infer_batch_size=None, run_async=False):
         assert_type(inputs, DataFlow)
 
         # inferencers.append(InferImages('default', prefix = 'gen'))
@@ -135,14 +230,14 @@ class FeedInference(InferenceBase):
                                             periodic=periodic, 
                                             inferencers=inferencers,
                                             extra_cbs=extra_cbs,
-                                            infer_batch_size=infer_batch_size)
+                                            infer_batch_size=infer_batch_size,
+                                            run_async=run_async)
 
     def _setup_inference(self):
-        placeholders = self.model.get_train_placeholder()
+        placeholders = self.model.get_inference_placeholder()
         self._extra_cbs.append(FeedInput(self._inputs, placeholders))
 
-    def _inference_step(self):
-        model_feed = self.model.get_graph_feed()
+    def _inference_step(self, model_feed):
         while self._inputs.epochs_completed <= 0:
             self.hooked_sess.run(fetches = [], feed_dict = model_feed)
         self._inputs.reset_epochs_completed(0)
@@ -152,28 +247,29 @@ class FeedInferenceBatch(FeedInference):
     def __init__(self, inputs, periodic=1, 
                  batch_count=10,
                  inferencers=[], extra_cbs=None,
-                 infer_batch_size=None):
+                 infer_batch_size=None, run_async=False):
         self._batch_count = batch_count
         super(FeedInferenceBatch, self).__init__(inputs=inputs, 
                                                 periodic=periodic, 
                                                 inferencers=inferencers, 
                                                 extra_cbs=extra_cbs,
-                                                infer_batch_size=infer_batch_size)
-    def _inference_step(self):
-        model_feed = self.model.get_graph_feed()
+                                                infer_batch_size=infer_batch_size,
+                                                run_async=run_async)
+    def _inference_step(self, model_feed):
         for i in range(self._batch_count):
             self.hooked_sess.run(fetches=[], feed_dict=model_feed)
 
 
 class GANInference(InferenceBase):
     def __init__(self, inputs=None, periodic=1, 
-                 inferencers=None, extra_cbs=None):
+                 inferencers=None, extra_cbs=None, run_async=False):
         if inputs is not None:
             assert_type(inputs, RandomVec)
         super(GANInference, self).__init__(inputs=inputs, 
                                            periodic=periodic, 
                                            inferencers=inferencers, 
-                                           extra_cbs=extra_cbs)
+                                           extra_cbs=extra_cbs,
+                                           run_async=run_async)
 
     def _setup_inference(self):
         if self._inputs is not None:
@@ -181,11 +277,12 @@ class GANInference(InferenceBase):
             rand_vec_phs = self.model.get_random_vec_placeholder()
             self._extra_cbs.append(FeedInput(self._inputs, rand_vec_phs))
 
-    def _inference_step(self):
+    def _get_model_feed(self):
         if self._inputs is None:
-            model_feed = self.model.get_graph_feed()
-        else:
-            model_feed = {}
+            return self.model.get_graph_feed()
+        return {}
+
+    def _inference_step(self, model_feed):
         # while self._inputs.epochs_completed <= 0:
         self.hooked_sess.run(fetches=[], feed_dict=model_feed)
         # self._inputs.reset_epochs_completed(0)
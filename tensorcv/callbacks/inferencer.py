@@ -9,8 +9,10 @@ import tensorflow as tf
 from .base import Callback
 from ..utils.common import get_tensors_by_names, check_dir, match_tensor_save_name
 from ..utils.viz import *
+from ..utils.writer import *
 
-__all__ = ['InferencerBase', 'InferImages', 'InferScalars', 'InferOverlay', 'InferMat']
+__all__ = ['InferencerBase', 'InferImages', 'InferScalars', 'InferOverlay', 'InferMat',
+           'StreamingInferencer', 'InferAccuracy', 'InferConfusionMatrix']
 
 class InferencerBase(Callback):
 
@@ -45,6 +47,13 @@ class InferencerBase(Callback):
 
     def after_inference(self):
         self._after_inference()
+        # wait for results saved in background
+        try:
+            writer = self._writer
+        except AttributeError:
+            return
+        if writer is not None:
+            writer.drain()
 
         # if re is not None:
         #     for key, val in re.items():
@@ -55,13 +64,51 @@ class InferencerBase(Callback):
     def _after_inference(self):
         return None
 
+    @property
+    def sess(self):
+        """ Session inference runs in. Default to be the training
+        session. """
+        try:
+            return self._sess
+        except AttributeError:
+            return self.trainer.sess
+
+    def set_session(self, sess):
+        self._sess = sess
+
+    @property
+    def writer(self):
+        """ ResultWriter for saving results in background.
+        Default to be the writer shared by all inferencers. """
+        try:
+            if self._writer is not None:
+                return self._writer
+        except AttributeError:
+            pass
+        self._writer = get_default_writer()
+        return self._writer
+
 
 
 class InferImages(InferencerBase):
-    def __init__(self, im_name, prefix=None, color=False, tanh=False):
+    def __init__(self, im_name, prefix=None, color=False, tanh=False,
+                 file_format='png', compress_level=None, writer=None):
+        """
+        Args:
+            file_format (str): 'png', or 'npy' and 'npz' for saving
+                raw batch results
+            compress_level (int): png compression level from 0 to 9
+            writer (ResultWriter): writer for saving in background.
+                Default to be the shared writer.
+        """
+        assert file_format in IMAGE_FORMATS, \
+        'file_format has to be one of {}'.format(IMAGE_FORMATS)
         self._names, self._prefix = match_tensor_save_name(im_name, prefix)
         self._color = color
         self._tanh = tanh
+        self._file_format = file_format
+        self._compress_level = compress_level
+        self._writer = writer
 
     def _setup_inference(self, default_dirs=None):
         try:
@@ -71,27 +118,28 @@ class InferImages(InferencerBase):
             raise AttributeError('summary_dir is not set in infer_dir.py!')
 
     def _before_inference(self):
-        self._result_list = []
+        # index of batch in the current inference
+        self._local_step = 0
         
     def _get_fetch(self, val):
-        self._result_list.append(val.results)
-        # self._result_im = val.results
+        # each batch is processed once it is fetched, 
+        # so memory does not grow with the number of batches
+        self._process_batch(val.results, self._local_step)
+        self._local_step += 1
 
-    def _after_inference(self):
+    def _process_batch(self, result_im, local_step):
         # TODO add process_image to monitors
-        # batch_size = len(self._result_im[0])
-        batch_size = len(self._result_list[0][0])
-        grid_size = self._get_grid_size(batch_size)
-        # grid_size = [8, 8] if batch_size == 64 else [6, 6]
-        local_step = 0
-        for result_im in self._result_list:
-            for im, save_name in zip(result_im, self._prefix): 
-                save_merge_images(im, [grid_size, grid_size], 
-                    self._save_dir + save_name + '_step_' + str(self.global_step) +\
-                    '_b_' + str(local_step) + '.png',
-                    color = self._color,
-                    tanh = self._tanh)
-            local_step += 1
+        grid_size = self._get_grid_size(len(result_im[0]))
+        for im, save_name in zip(result_im, self._prefix): 
+            self.writer.write(save_merge_result, im, [grid_size, grid_size], 
+                self._save_dir + save_name + '_step_' + str(self.global_step) +\
+                '_b_' + str(local_step),
+                color = self._color,
+                tanh = self._tanh,
+                file_format=self._file_format,
+                compress_level=self._compress_level)
+
+    def _after_inference(self):
         return None
 
     def _get_grid_size(self, batch_size):
@@ -102,7 +150,8 @@ class InferImages(InferencerBase):
             return self._grid_size
 
 class InferOverlay(InferImages):
-    def __init__(self, im_name, prefix=None, color=False, tanh=False):
+    def __init__(self, im_name, prefix=None, color=False, tanh=False,
+                 file_format='png', compress_level=None, writer=None):
         if not isinstance(im_name, list):
             im_name = [im_name]
         assert len(im_name) == 2,\
@@ -111,43 +160,94 @@ class InferOverlay(InferImages):
         super(InferOverlay, self).__init__(im_name=im_name,
                                            prefix=prefix,
                                            color=color,
-                                           tanh=tanh)
+                                           tanh=tanh,
+                                           file_format=file_format,
+                                           compress_level=compress_level,
+                                           writer=writer)
         self._overlay_prefix = '{}_{}'.format(self._prefix[0], self._prefix[1])
 
-    def _after_inference(self):
-        # TODO add process_image to monitors
-        # batch_size = len(self._result_im[0])
-        batch_size = len(self._result_list[0][0])
-        grid_size = self._get_grid_size(batch_size)
-        # grid_size = [8, 8] if batch_size == 64 else [6, 6]
-        local_step = 0
-        for result_im in self._result_list:
-            overlay_im_list = []
-            for im_1, im_2 in zip(result_im[0], result_im[1]):
-                overlay_im = image_overlay(im_1, im_2, color = self._color)
-                overlay_im_list.append(overlay_im)
-                save_merge_images(np.squeeze(overlay_im_list), [grid_size, grid_size], 
-                self._save_dir + self._overlay_prefix + '_step_' +str(self.global_step) +\
-                '_b_' + str(local_step) + '.png',
-                color = False, tanh = self._tanh)
-            local_step += 1
-        return None
+    def _process_batch(self, result_im, local_step):
+        grid_size = self._get_grid_size(len(result_im[0]))
+        overlay_ims = batch_image_overlay(result_im[0], result_im[1],
+                                          color = self._color)
+        self.writer.write(save_merge_result, np.squeeze(overlay_ims),
+            [grid_size, grid_size], 
+            self._save_dir + self._overlay_prefix + '_step_' +str(self.global_step) +\
+            '_b_' + str(local_step),
+            color = False, tanh = self._tanh,
+            file_format=self._file_format,
+            compress_level=self._compress_level)
 
 class InferMat(InferImages):
-    def __init__(self, infer_save_name, mat_name, prefix=None):
+    def __init__(self, infer_save_name, mat_name, prefix=None,
+                 file_format='mat', writer=None):
+        """
+        Args:
+            file_format (str): 'mat' or 'npz'
+        """
+        assert file_format in ARRAY_FORMATS, \
+        'file_format has to be one of {}'.format(ARRAY_FORMATS)
         self._infer_save_name = str(infer_save_name)
         super(InferMat, self).__init__(im_name = mat_name, prefix=prefix, 
-                                        color=False, tanh=False)
+                                        color=False, tanh=False, writer=writer)
+        self._file_format = file_format
+
+    def _process_batch(self, batch_result, idx):
+        save_path = os.path.join(self._save_dir, 
+            '{}_step_{}_b_{}'.format(self._infer_save_name, self.global_step, idx))
+        self.writer.write(save_arrays, save_path,
+                          {name: np.squeeze(val) for name, val 
+                           in zip(self._prefix, batch_result)},
+                          file_format=self._file_format)
+
+class StreamingInferencer(InferencerBase):
+    """ Base class of inferencers accumulating results of batches 
+    inside the graph by local variables (in the same way as tf.metrics). 
+
+    Only the accumulate op is run for each batch and final values are 
+    fetched once after inference, so memory does not grow with the size
+    of dataset.
+    """
+    def _setup_inference(self, default_dirs=None):
+        with tf.variable_scope(None, 
+                               default_name=self.__class__.__name__) as scope:
+            self._final_values, update_ops = self._create_metrics(self._names)
+        local_vars = tf.get_collection(tf.GraphKeys.LOCAL_VARIABLES,
+                                       scope=scope.name + '/')
+        self._update_op = tf.group(*update_ops)
+        self._reset_op = tf.variables_initializer(local_vars)
+
+    def _create_metrics(self, tensors):
+        """ 
+        Args:
+            tensors (list): tensors of _names
+
+        Returns:
+            list of final value tensors and list of update ops
+        """
+        raise NotImplementedError()
+
+    def _put_fetch(self):
+        return self._update_op
+
+    def _before_inference(self):
+        self.sess.run(self._reset_op)
+
     def _after_inference(self):
-        for idx, batch_result in enumerate(self._result_list):
-            save_path = os.path.join(self._save_dir, 
-                '{}_step_{}_b_{}.mat'.format(self._infer_save_name, self.global_step, idx))
-                               # self._infer_save_name + '_b_' + str(idx) + str(self.global_step) + '.mat')
-            scipy.io.savemat(save_path, {name: np.squeeze(val) for name, val 
-              in zip(self._prefix, batch_result)})
-        return None
+        self._process_values(self.sess.run(self._final_values))
 
-class InferScalars(InferencerBase):
+    def _process_values(self, values):
+        pass
+
+    def _report_scalars(self, summary_names, values):
+        for key, val in zip(summary_names, values):
+            s = tf.Summary()
+            s.value.add(tag=key, simple_value=val)
+            self.trainer.monitors.process_summary(s)
+            print('[infer] '+ key + ': ' + str(val))
+
+class InferScalars(StreamingInferencer):
+    """ Report means of scalar tensors over all the inference batches """
     def __init__(self, scaler_names, summary_names=None):
         if not isinstance(scaler_names, list): 
             scaler_names = [scaler_names]
@@ -161,25 +261,80 @@ class InferScalars(InferencerBase):
             "length of scaler_names and summary_names has to be the same!"
             self._summary_names = summary_names 
         
-    def _before_inference(self):
-        self.result_list = [[] for i in range(0, len(self._names))]
+    def _create_metrics(self, tensors):
+        metrics = [tf.metrics.mean(tensor) for tensor in tensors]
+        return [value for value, _ in metrics], [op for _, op in metrics]
+
+    def _process_values(self, values):
+        self._report_scalars(self._summary_names, values)
+
+class InferAccuracy(StreamingInferencer):
+    """ Report accuracy of predictions over all the inference batches """
+    def __init__(self, label_name, prediction_name, summary_name='accuracy'):
+        """
+        Args:
+            label_name (str): name of label tensor
+            prediction_name (str): name of tensor of predicted labels
+                with the same shape as label
+            summary_name (str): tag of accuracy reported to monitors
+        """
+        self._names = [label_name, prediction_name]
+        self._summary_name = summary_name
+
+    def _create_metrics(self, tensors):
+        accuracy, update_op = tf.metrics.accuracy(tensors[0], tensors[1])
+        return [accuracy], [update_op]
+
+    def _process_values(self, values):
+        self._report_scalars([self._summary_name], values)
+
+class InferConfusionMatrix(StreamingInferencer):
+    """ Save confusion matrix over all the inference batches
+    to infer_dir and report accuracy to monitors. Rows are labels and
+    columns are predictions.
+    """
+    def __init__(self, label_name, prediction_name, num_classes,
+                 save_name='confusion_matrix', summary_name='accuracy'):
+        """
+        Args:
+            label_name (str): name of label tensor
+            prediction_name (str): name of tensor of predicted labels
+                with the same shape as label
+            num_classes (int): number of classes
+            save_name (str): prefix of saved file 
+            summary_name (str): tag of accuracy reported to monitors
+        """
+        self._names = [label_name, prediction_name]
+        self._num_classes = num_classes
+        self._save_name = save_name
+        self._summary_name = summary_name
 
-    def _get_fetch(self, val):
-        for i,v in enumerate(val.results):
-            self.result_list[i] += v,
-
-    def _after_inference(self):
-        """ process after get_fetch """
-        summary_dict = {name: np.mean(val) for name, val 
-                        in zip(self._summary_names, self.result_list)}
-        if summary_dict is not None:
-            for key, val in summary_dict.items():
-                s = tf.Summary()
-                s.value.add(tag=key, simple_value=val)
-                self.trainer.monitors.process_summary(s)
-                print('[infer] '+ key + ': ' + str(val))
-        # return {name: np.mean(val) for name, val 
-        #       in zip(self._summary_names, self.result_list)}
+    def _setup_inference(self, default_dirs=None):
+        try:
+            self._save_dir = os.path.join(self.trainer.default_dirs.infer_dir)
+            check_dir(self._save_dir)
+        except AttributeError:
+            raise AttributeError('summary_dir is not set in infer_dir.py!')
+        super(InferConfusionMatrix, self)._setup_inference(default_dirs)
+
+    def _create_metrics(self, tensors):
+        total = tf.Variable(
+            tf.zeros([self._num_classes, self._num_classes], dtype=tf.int64),
+            trainable=False, name='total',
+            collections=[tf.GraphKeys.LOCAL_VARIABLES, 
+                         tf.GraphKeys.METRIC_VARIABLES])
+        batch_matrix = tf.confusion_matrix(
+            tf.reshape(tensors[0], [-1]), tf.reshape(tensors[1], [-1]),
+            num_classes=self._num_classes, dtype=tf.int64)
+        return [total.read_value()], [tf.assign_add(total, batch_matrix)]
+
+    def _process_values(self, values):
+        matrix = values[0]
+        save_path = os.path.join(self._save_dir, '{}_step_{}.txt'.format(
+            self._save_name, self.global_step))
+        np.savetxt(save_path, matrix, fmt='%d')
+        accuracy = float(np.trace(matrix)) / max(np.sum(matrix), 1)
+        self._report_scalars([self._summary_name], [accuracy])
 
 # TODO to be modified
 # class BinaryClassificationStats(InferencerBase):
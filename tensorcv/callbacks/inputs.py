@@ -3,18 +3,83 @@
 
 import scipy.misc
 import os
+import threading
+import time
 
 import tensorflow as tf
+from tensorflow.contrib import graph_editor
 
 from .base import Callback
 from ..dataflow.base import DataFlow
 
-__all__ = ['FeedInput']
+__all__ = ['FeedInput', 'TensorInput', 'QueueInput']
 
 def assert_type(v, tp):
     assert isinstance(v, tp), \
     "Expect " + str(tp) + ", but " + str(v.__class__) + " is given!"
 
+def reroute_placeholders(tensors, placeholders):
+    """ Make all the ops consuming placeholders consume tensors instead.
+
+    Each tensor is wrapped by tf.placeholder_with_default, so the
+    graph still can be fed (used by inference callbacks).
+
+    Args:
+        tensors (list): list of tensors with the same dtypes as placeholders
+        placeholders (list): list of placeholders to be replaced
+
+    Returns:
+        list of new input tensors which can be fed
+    """
+    assert len(tensors) == len(placeholders), \
+    "[reroute_placeholders] length of tensors {} is not equal to \
+    length of placeholders {}".format(len(tensors), len(placeholders))
+
+    new_inputs = []
+    for tensor, plh in zip(tensors, placeholders):
+        tensor.set_shape(plh.get_shape())
+        new_input = tf.placeholder_with_default(
+            tensor, shape=plh.get_shape(), 
+            name=plh.op.name + '_default')
+        graph_editor.reroute_ts([new_input], [plh])
+        new_inputs.append(new_input)
+    return new_inputs
+
+def get_queue_size_op(tensors):
+    """ Size op of the queue tensors are dequeued from, or None if
+    tensors are not dequeued from a queue.
+    """
+    op = tensors[0].op
+    if not op.type.startswith('QueueDequeue'):
+        return None
+    queue = tf.QueueBase([tensor.dtype for tensor in tensors], None, None,
+                         op.inputs[0])
+    return queue.size()
+
+def dequeue_again(tensors):
+    """ Create a new dequeue op of the queue tensors are dequeued from,
+    e.g. to take a new batch inside tf.while_loop.
+
+    Args:
+        tensors (list): outputs of the same dequeue op
+
+    Returns:
+        list of outputs of the new dequeue op in the same order
+    """
+    op = tensors[0].op
+    assert op.type.startswith('QueueDequeue') and\
+        all(tensor.op is op for tensor in tensors), \
+    "[dequeue_again] tensors have to be outputs of one dequeue op!"
+    new_op = tf.get_default_graph().create_op(
+        op.type, list(op.inputs), [out.dtype for out in op.outputs],
+        name=op.name.split('/')[-1], attrs=dict(op.node_def.attr))
+    new_tensors = []
+    for tensor in tensors:
+        new_tensor = new_op.outputs[tensor.value_index]
+        new_tensor.set_shape(tensor.get_shape())
+        new_tensors.append(new_tensor)
+    return new_tensors
+
 class FeedInput(Callback):
     """ input using feed """
     def __init__(self, dataflow, placeholders):
@@ -25,6 +90,23 @@ class FeedInput(Callback):
             print(type(placeholders))
             placeholders = [placeholders]
         self.placeholders = placeholders   
+        # time of waiting for batches since the last pop_input_stats()
+        self.wait_time = 0
+        # batches in queue before the runs since the last
+        # pop_input_stats() (inputs inside the graph only)
+        self._queue_sizes = []
+        self._size_op = None
+
+    def setup_graph(self, trainer):
+        # input may be setup by trainer before the other callbacks
+        # (e.g. for steps_per_run)
+        try:
+            if self._is_setup:
+                return
+        except AttributeError:
+            pass
+        super(FeedInput, self).setup_graph(trainer)
+        self._is_setup = True
 
     # def _setup_graph(self):
     #     pass
@@ -35,11 +117,26 @@ class FeedInput(Callback):
     def _before_train(self):
         self.dataflow.before_read_setup()
 
+    def dataflow_state(self):
+        """ state_dict() of dataflow """
+        return self.dataflow.state_dict()
+
+    def get_loop_batch(self):
+        """ New tensors of the next batch created in the current graph 
+        context (e.g. inside tf.while_loop). Only for inputs inside
+        the graph.
+        """
+        raise NotImplementedError(
+            '[{}] batches are fed by python. Use input from tensors '
+            'or queue instead.'.format(self.__class__.__name__))
+
     def _before_inference(self):
         self._before_train()
 
     def _before_run(self, _):
+        start_time = time.time()
         cur_batch = self.dataflow.next_batch()
+        self.wait_time += time.time() - start_time
         
         # assert len(cur_batch) == len(self.placeholders), \
         # "[FeedInput] lenght of input {} is not equal to length of placeholders {}"\
@@ -51,15 +148,190 @@ class FeedInput(Callback):
     def _after_train(self):
         self.dataflow.after_reading()
 
+    def pop_input_stats(self):
+        """ Statistics of input since the last call, added to the 
+        step timer of trainer at the end of each step.
+
+        Returns:
+            dict: 'data_wait': seconds of waiting for batches fed by
+            python. For inputs inside the graph, waiting is part of
+            session.run, so 'input_queue_size': the smallest number
+            of batches in queue before a run of the step, is returned
+            instead (0 means training waited for data).
+        """
+        if self._queue_sizes:
+            stats = {'input_queue_size': min(self._queue_sizes)}
+        elif self.placeholders_fed:
+            stats = {'data_wait': self.wait_time}
+        else:
+            stats = {}
+        self.wait_time = 0
+        self._queue_sizes = []
+        return stats
+
+    @property
+    def placeholders_fed(self):
+        """ Whether batches are fed by python """
+        return True
+
+    def _fetch_queue_size(self):
+        if self._size_op is None:
+            return None
+        return tf.train.SessionRunArgs(fetches=self._size_op)
+
+    def _record_queue_size(self, val):
+        if self._size_op is not None and val is not None:
+            self._queue_sizes.append(int(val.results))
+
+class TensorInput(FeedInput):
+    """ input from tensors produced by the dataflow inside the graph
+
+    The model is built on the batch tensors of dataflow 
+    (e.g. DataFromTfrecord), so batches never leave the TF runtime.
+    Must be setup after the training graph is created and before the
+    other callbacks.
+    """
+    def __init__(self, dataflow, placeholders):
+        assert hasattr(dataflow, 'get_batch_tensors'),\
+        "[TensorInput] dataflow has to provide batch tensors!"
+        super(TensorInput, self).__init__(dataflow, placeholders)
+
+    def _setup_graph(self):
+        tensors = self.dataflow.get_batch_tensors()
+        if not isinstance(tensors, list):
+            tensors = [tensors]
+        self.model_placeholders = self.placeholders
+        self.batch_tensors = tensors
+        # batch queue of dataflow (not ordered with dequeue)
+        self._size_op = get_queue_size_op(tensors)
+        self.placeholders = reroute_placeholders(tensors, self.placeholders)
+        self.trainer.model.set_train_placeholder(self.placeholders)
+
+    @property
+    def placeholders_fed(self):
+        return False
+
+    def get_loop_batch(self):
+        return dequeue_again(self.batch_tensors)
+
+    def _before_run(self, _):
+        return self._fetch_queue_size()
+
+    def _after_run(self, rct, val):
+        self._record_queue_size(val)
+        # one batch is consumed by every training step
+        for k in range(0, self.steps_per_run):
+            self.dataflow.count_batch()
+
+class QueueInput(FeedInput):
+    """ input from a FIFOQueue filled by a background thread 
 
+    The model is built on the dequeued tensors, and batches of any
+    python dataflow are enqueued by a separate thread, so the training
+    step does not wait for reading and feeding data.
+    Must be setup after the training graph is created and before the
+    other callbacks.
 
+    Note that epochs_completed of dataflow is ahead of the training 
+    by at most capacity batches.
+    """
+    def __init__(self, dataflow, placeholders, capacity=50):
+        self._capacity = capacity
+        # dataflow is read by the enqueue thread
+        self._read_lock = threading.Lock()
+        super(QueueInput, self).__init__(dataflow, placeholders)
 
+    def _setup_graph(self):
+        with tf.name_scope('input_queue'):
+            self._queue = tf.FIFOQueue(
+                self._capacity, [plh.dtype for plh in self.placeholders])
+            self._size_op = self._queue.size()
+            # size fetched with train op is the size before dequeue
+            with tf.control_dependencies([self._size_op]):
+                dequeue_data = self._queue.dequeue(name='dequeue')
+            if not isinstance(dequeue_data, list):
+                dequeue_data = [dequeue_data]
+            self._feed_plhs = self.placeholders
+            self.model_placeholders = self._feed_plhs
+            self.batch_tensors = dequeue_data
+            self.placeholders = reroute_placeholders(dequeue_data,
+                                                     self._feed_plhs)
+            # enqueue op has to be created after reroute
+            self._enqueue_op = self._queue.enqueue(self._feed_plhs,
+                                                   name='enqueue')
+            self._close_op = self._queue.close(cancel_pending_enqueues=True)
+        self.trainer.model.set_train_placeholder(self.placeholders)
 
+    def _before_train(self):
+        self.dataflow.before_read_setup()
+        self._stop_event = threading.Event()
+        self._enqueue_error = None
+        self._thread = threading.Thread(target=self._enqueue_loop, 
+                                        args=(self.trainer.sess,))
+        self._thread.daemon = True
+        self._thread.start()
 
+    def _enqueue_loop(self, sess):
+        with sess.as_default():
+            try:
+                while not self._stop_event.is_set():
+                    with self._read_lock:
+                        cur_batch = self.dataflow.next_batch()
+                    feed = dict(zip(self._feed_plhs, cur_batch))
+                    sess.run(self._enqueue_op, feed_dict=feed)
+            except (tf.errors.CancelledError, tf.errors.OutOfRangeError):
+                pass
+            except Exception as e:
+                # raised in the training thread by _before_run
+                self._enqueue_error = e
+                print('**[error]** [QueueInput] reading data failed: '
+                      '{!r}'.format(e))
+                try:
+                    # training step waiting for dequeue fails instead of
+                    # blocking forever
+                    sess.run(self._close_op)
+                except Exception:
+                    pass
 
+    def get_loop_batch(self):
+        batch = self._queue.dequeue()
+        if not isinstance(batch, list):
+            batch = [batch]
+        for tensor, plh in zip(batch, self._feed_plhs):
+            tensor.set_shape(plh.get_shape())
+        return batch
 
+    def dataflow_state(self):
+        """ state_dict() of dataflow, taken between two batches read
+        by the enqueue thread. Dataflow is ahead of training by the
+        batches in queue.
+        """
+        with self._read_lock:
+            return self.dataflow.state_dict()
 
-    
+    def queue_size(self):
+        """ number of batches currently in queue """
+        return self.trainer.sess.run(self._size_op)
 
+    def check_error(self):
+        """ Raise the error of reading data in background if any """
+        if self._enqueue_error is not None:
+            raise self._enqueue_error
 
-    
+    @property
+    def placeholders_fed(self):
+        return False
+
+    def _before_run(self, _):
+        self.check_error()
+        return self._fetch_queue_size()
+
+    def _after_run(self, rct, val):
+        self.check_error()
+        self._record_queue_size(val)
+
+    def _after_train(self):
+        self._stop_event.set()
+        self.trainer.sess.run(self._close_op)
+        self._thread.join()
+        self.dataflow.after_reading()
@@ -1,11 +1,23 @@
 import os
+import io
+import csv
+import json
+import time
+import socket
+import threading
+import queue
+from collections import deque
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 import tensorflow as tf
 
 from .base import Callback
 from ..utils.common import check_dir
 
-__all__ = ['TrainingMonitor','Monitors','TFSummaryWriter']
+__all__ = ['TrainingMonitor','Monitors','TFSummaryWriter','ScalarWriter']
 
 def assert_type(v, tp):
     assert isinstance(v, tp), \
@@ -32,7 +44,31 @@ class Monitors(TrainingMonitor):
         for mon in self.mons:
             mon.process_summary(summary)
 
+    def get_history(self, tag):
+        """ Recent (global_step, value) of scalar tag recorded by 
+        the first monitor keeping history (e.g. ScalarWriter). """
+        for mon in self.mons:
+            try:
+                return mon.get_history(tag)
+            except AttributeError:
+                pass
+        return []
+
 class TFSummaryWriter(TrainingMonitor):
+    chief_only = True
+
+    def __init__(self, async_write=True, max_queue=100):
+        """
+        Args:
+            async_write (bool): write summaries to event files by a 
+                background thread, so training thread does not wait
+                for parsing and writing.
+            max_queue (int): maximum number of summaries waiting for 
+                writing. Training waits when the queue is full.
+        """
+        self._async_write = async_write
+        self._max_queue = max_queue
+        self._write_thread = None
 
     def _setup_graph(self):
         try:
@@ -45,9 +81,187 @@ class TFSummaryWriter(TrainingMonitor):
     def _before_train(self):
         # default to write graph
         self._writer.add_graph(self.trainer.sess.graph)
+        if self._async_write:
+            self._queue = queue.Queue(maxsize=self._max_queue)
+            self._write_thread = threading.Thread(target=self._write_loop)
+            self._write_thread.daemon = True
+            self._write_thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._writer.add_summary(*item)
 
     def _after_train(self):
+        if self._write_thread is not None:
+            self._queue.put(None)
+            self._write_thread.join()
+            self._write_thread = None
         self._writer.close()
 
     def process_summary(self, summary):
-        self._writer.add_summary(summary, self.global_step)
+        if self._write_thread is not None:
+            self._queue.put((summary, self.global_step))
+        else:
+            self._writer.add_summary(summary, self.global_step)
+
+
+def parse_scalars(summary):
+    """ (tag, value) of scalars in summary
+
+    Args:
+        summary (tf.Summary or bytes): summary or serialized summary
+    """
+    if not isinstance(summary, tf.Summary):
+        summary = tf.Summary.FromString(summary)
+    return [(value.tag, value.simple_value) for value in summary.value
+            if value.WhichOneof('value') == 'simple_value']
+
+def append_lines(file_path, lines, header=None):
+    """ Append lines to file_path by a single write under file lock,
+    so lines from concurrent runs are not interleaved. 
+    header is written first if the file is empty.
+    """
+    with open(file_path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if header is not None and os.fstat(f.fileno()).st_size == 0:
+                lines = [header] + lines
+            f.write(''.join(lines))
+            f.flush()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+class ScalarWriter(TrainingMonitor):
+    """ Write scalars (e.g. losses and step timing from the trainer)
+    to a JSONL or CSV file.
+
+    Scalars are buffered in memory and appended in batches by a 
+    background thread. Each line records wall time, run name, 
+    global step, tag and value, so runs can share one file.
+    The recent values of each tag are kept for callbacks
+    (e.g. trainer.monitors.get_history('loss')).
+    """
+    def __init__(self, file_path=None, file_format='jsonl', run_name=None,
+                 history_size=100, flush_secs=5, max_buffer=1000):
+        """
+        Args:
+            file_path (str): path of output file. Default to be
+                metrics.jsonl or metrics.csv in summary_dir.
+            file_format (str): 'jsonl' or 'csv'
+            run_name (str): name of this run in the file. 
+                Default to be hostname-pid.
+            history_size (int): number of recent values kept for each tag
+            flush_secs (float): write buffered scalars every 
+                flush_secs seconds
+            max_buffer (int): write buffered scalars once there are 
+                max_buffer of them
+        """
+        assert file_format in ['jsonl', 'csv'], \
+        "file_format has to be 'jsonl' or 'csv'!"
+        self._file_path = file_path
+        self._file_format = file_format
+        if run_name is None:
+            run_name = '{}-{}'.format(socket.gethostname(), os.getpid())
+        self._run_name = run_name
+        self._history_size = history_size
+        self._flush_secs = flush_secs
+        self._max_buffer = max_buffer
+
+        self._history = {}
+        self._history_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._write_thread = None
+
+    def _setup_graph(self):
+        if self._file_path is None:
+            try:
+                summary_dir = self.trainer.default_dirs.summary_dir
+            except AttributeError:
+                raise AttributeError('summary_dir is not set in config.py!')
+            check_dir(summary_dir)
+            self._file_path = os.path.join(
+                summary_dir, 'metrics.{}'.format(self._file_format))
+        self._write_thread = threading.Thread(target=self._write_loop)
+        self._write_thread.daemon = True
+        self._write_thread.start()
+
+    def process_summary(self, summary):
+        # parsing is done by the write thread
+        self._queue.put((summary, self.global_step, time.time()))
+
+    def _write_loop(self):
+        rows = []
+        last_flush = time.time()
+        while True:
+            try:
+                item = self._queue.get(timeout=self._flush_secs)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self._write_rows(rows)
+                return
+            if item:
+                rows.extend(self._add_summary(*item))
+            if rows and (len(rows) >= self._max_buffer
+                         or time.time() - last_flush >= self._flush_secs):
+                self._write_rows(rows)
+                rows = []
+                last_flush = time.time()
+
+    def _add_summary(self, summary, global_step, wall_time):
+        rows = []
+        for tag, value in parse_scalars(summary):
+            rows.append((wall_time, global_step, tag, value))
+            with self._history_lock:
+                try:
+                    history = self._history[tag]
+                except KeyError:
+                    history = self._history[tag] =\
+                        deque(maxlen=self._history_size)
+                history.append((global_step, value))
+        return rows
+
+    def _write_rows(self, rows):
+        if not rows:
+            return
+        if self._file_format == 'jsonl':
+            lines = [json.dumps({'time': wall_time, 'run': self._run_name,
+                                 'step': step, 'tag': tag, 'value': value})
+                     + '\n' for wall_time, step, tag, value in rows]
+            append_lines(self._file_path, lines)
+        else:
+            lines = [self._csv_line([wall_time, self._run_name, step,
+                                     tag, value])
+                     for wall_time, step, tag, value in rows]
+            append_lines(self._file_path, lines, header=self._csv_line(
+                ['time', 'run', 'step', 'tag', 'value']))
+
+    def _csv_line(self, row):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator='\n').writerow(row)
+        return buf.getvalue()
+
+    def _after_train(self):
+        if self._write_thread is not None:
+            self._queue.put(None)
+            self._write_thread.join()
+            self._write_thread = None
+
+    def get_history(self, tag):
+        """ List of recent (global_step, value) of tag """
+        with self._history_lock:
+            return list(self._history.get(tag, []))
+
+    def get_last(self, tag):
+        """ Latest value of tag, or None if not recorded """
+        history = self.get_history(tag)
+        return history[-1][1] if history else None
+
+    def get_tags(self):
+        with self._history_lock:
+            return list(self._history.keys())
@@ -0,0 +1,166 @@
+# File: profile.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import re
+
+import tensorflow as tf
+from tensorflow.python.client import timeline
+
+from .base import Callback
+from .trigger import TriggerSpec
+from ..models.layers import LAYER_SCOPE_KEY
+from ..utils.common import check_dir
+
+__all__ = ['ProfileCallback']
+
+# name component of gradient ops, e.g. gradients/ or gradients_1/
+GRAD_SCOPE = re.compile(r'(^|/)gradients(_\d+)?/')
+
+class ProfileCallback(Callback):
+    """ Profile training steps by layers.
+
+    Every periodic steps, the training step is run with FULL_TRACE.
+    Time and memory of ops are aggregated by the layers created by
+    models.layers (conv, dconv, fc and batch_norm) and written to
+    a table profile-step.txt in output_dir, together with a Chrome
+    trace timeline-step.json (open in chrome://tracing).
+    Gradient ops are counted as backward time of their layers.
+    """
+    def __init__(self, periodic=100, output_dir=None, show_flops=True):
+        """
+        Args:
+            periodic (int): profile every periodic steps
+            output_dir (str): directory for profiles. Default to be
+                summary_dir of trainer.
+            show_flops (bool): count FLOPs of layers by tf.profiler
+        """
+        self._periodic = periodic
+        self._output_dir = output_dir
+        self._show_flops = show_flops
+
+    def _setup_graph(self):
+        if self._output_dir is None:
+            try:
+                self._output_dir = self.trainer.default_dirs.summary_dir
+            except AttributeError:
+                raise AttributeError('summary_dir is not set in config.py!')
+        check_dir(self._output_dir)
+
+        self._layers = {}
+        for layer in tf.get_collection(LAYER_SCOPE_KEY):
+            layer_type, scope = layer.split(':', 1)
+            self._layers[scope] = layer_type
+        # match the inner layer first
+        self._scopes = sorted(self._layers.keys(), key=len, reverse=True)
+
+    def get_run_trigger(self):
+        return TriggerSpec(every_k_steps=self._periodic)
+
+    def _before_run(self, _):
+        if self.is_step_due(self._periodic):
+            return tf.train.SessionRunArgs(
+                fetches=[],
+                options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE))
+        return None
+
+    def _after_run(self, _, val):
+        if val.run_metadata is None or\
+            not val.run_metadata.step_stats.dev_stats:
+            return
+        if not self.is_step_due(self._periodic):
+            return
+        run_metadata = val.run_metadata
+        stats = self._aggregate(run_metadata.step_stats)
+        if self._show_flops:
+            self._add_flops(stats, run_metadata)
+        self._write_table(stats)
+        self._write_timeline(run_metadata.step_stats)
+        self._report(stats)
+
+    def _match_layer(self, op_name):
+        """ Returns (layer scope, is_backward) """
+        is_backward = GRAD_SCOPE.search(op_name) is not None
+        name = GRAD_SCOPE.sub(r'\1', op_name)
+        for scope in self._scopes:
+            if name.startswith(scope + '/') or name == scope:
+                return scope, is_backward
+        return '(other)', is_backward
+
+    def _get_layer_stat(self, stats, scope):
+        try:
+            return stats[scope]
+        except KeyError:
+            stats[scope] = {'forward': 0, 'backward': 0,
+                            'bytes': 0, 'flops': 0}
+            return stats[scope]
+
+    def _aggregate(self, step_stats):
+        stats = {}
+        for dev_stats in step_stats.dev_stats:
+            for node_stats in dev_stats.node_stats:
+                # node name may have a suffix as name:op_type
+                op_name = node_stats.node_name.split(':')[0]
+                scope, is_backward = self._match_layer(op_name)
+                layer_stat = self._get_layer_stat(stats, scope)
+                key = 'backward' if is_backward else 'forward'
+                layer_stat[key] += node_stats.all_end_rel_micros
+                layer_stat['bytes'] += sum(
+                    out.tensor_description.allocation_description.\
+                    requested_bytes for out in node_stats.output)
+        return stats
+
+    def _add_flops(self, stats, run_metadata):
+        try:
+            opts = tf.profiler.ProfileOptionBuilder(
+                tf.profiler.ProfileOptionBuilder.float_operation())\
+                .with_empty_output().build()
+            prof = tf.profiler.profile(self.trainer.sess.graph,
+                                       run_meta=run_metadata,
+                                       cmd='scope', options=opts)
+        except Exception:
+            return
+        nodes = list(prof.children)
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.children)
+            if node.float_ops > 0:
+                scope, _ = self._match_layer(node.name)
+                self._get_layer_stat(stats, scope)['flops'] += node.float_ops
+
+    def _write_table(self, stats):
+        lines = ['Profile of step {}'.format(self.global_step),
+                 '{:<48}{:<12}{:>12}{:>12}{:>12}{:>12}'.format(
+                     'layer', 'type', 'fwd (ms)', 'bwd (ms)',
+                     'MFLOPs', 'MB')]
+        total = sum(s['forward'] + s['backward'] for s in stats.values())
+        for scope, stat in sorted(
+                stats.items(),
+                key=lambda item: item[1]['forward'] + item[1]['backward'],
+                reverse=True):
+            lines.append('{:<48}{:<12}{:>12.3f}{:>12.3f}{:>12.2f}{:>12.2f}'
+                         .format(scope, self._layers.get(scope, ''),
+                                 stat['forward'] / 1e3,
+                                 stat['backward'] / 1e3,
+                                 stat['flops'] / 1e6,
+                                 stat['bytes'] / 2.**20))
+        lines.append('total op time: {:.3f} ms'.format(total / 1e3))
+
+        file_path = os.path.join(self._output_dir,
+                                 'profile-{}.txt'.format(self.global_step))
+        with open(file_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def _write_timeline(self, step_stats):
+        trace = timeline.Timeline(step_stats=step_stats)
+        file_path = os.path.join(self._output_dir,
+                                 'timeline-{}.json'.format(self.global_step))
+        with open(file_path, 'w') as f:
+            f.write(trace.generate_chrome_trace_format(show_memory=True))
+
+    def _report(self, stats):
+        s = tf.Summary()
+        for scope, stat in stats.items():
+            s.value.add(tag='profile_layer/{}/ms'.format(scope),
+                        simple_value=(stat['forward'] + stat['backward']) / 1e3)
+        self.trainer.monitors.process_summary(s)
@@ -1,21 +1,61 @@
 import scipy.misc
 import os
-import os
+import threading
+import time
 
 import numpy as np
 import tensorflow as tf
+from tensorflow.python.ops import io_ops
 
 from .base import Callback
+from .trigger import TriggerSpec
 from ..utils.common import check_dir
+from ..utils.checkpoint import set_base_checkpoint, save_train_state
 
 __all__ = ['ModelSaver']
 
 class ModelSaver(Callback):
+    chief_only = True
+
     def __init__(self, max_to_keep=5,
                  keep_checkpoint_every_n_hours=0.5,
                  periodic=1,
                  checkpoint_dir=None,
-                 var_collections=tf.GraphKeys.GLOBAL_VARIABLES):
+                 var_collections=tf.GraphKeys.GLOBAL_VARIABLES,
+                 async_save=False,
+                 trainable_only=False,
+                 base_checkpoint=None,
+                 save_state=True):
+        """
+        Args:
+            async_save (bool): save checkpoints without blocking training.
+                Variables are copied to host memory by one session.run,
+                then written and fsynced by a background thread.
+                At most one checkpoint is in flight and the last one is
+                flushed when training ends. Meta graph is not saved in
+                this mode.
+            trainable_only (bool): save delta checkpoints, which do not
+                include frozen variables of the model (variables not
+                written by training, e.g. pre-trained VGG layers with
+                trainable=False). Variables updated during training
+                (e.g. moving averages of batch_norm and optimizer
+                slots) are still saved. See
+                utils.checkpoint.get_frozen_variables().
+            base_checkpoint (str): checkpoint or .npy pre-trained file
+                containing the frozen variables. Required if
+                trainable_only is True. It is recorded in checkpoint_dir
+                and used by utils.checkpoint.restore_checkpoint().
+            save_state (bool): save global step and state of dataflow
+                in a .state file next to each checkpoint, so training
+                can be resumed from the same position of data.
+                With input_mode='queue', dataflow may be ahead of
+                training by at most queue_capacity batches.
+        """
+        if trainable_only:
+            assert base_checkpoint is not None,\
+            'base_checkpoint is required for saving trainable variables only!'
+        self._trainable_only = trainable_only
+        self._base_checkpoint = base_checkpoint
 
         self._periodic = periodic
 
@@ -26,6 +66,13 @@ class ModelSaver(Callback):
             var_collections = [var_collections]
         self.var_collections = var_collections
 
+        self._async_save = async_save
+        self._save_state = save_state
+        self._state_paths = []
+        self._write_thread = None
+        self._write_error = None
+        self._write_secs = None
+
     def _setup_graph(self):
         try:
             checkpoint_dir = os.path.join(self.trainer.default_dirs.checkpoint_dir)
@@ -33,13 +80,160 @@ class ModelSaver(Callback):
         except AttributeError:
             raise AttributeError('checkpoint_dir is not set in config_path!')
 
+        self._checkpoint_dir = checkpoint_dir
         self._save_path = os.path.join(checkpoint_dir, 'model')
-        self._saver = tf.train.Saver()
+        self._var_list = self._get_var_list()
+        if self._trainable_only:
+            set_base_checkpoint(checkpoint_dir, self._base_checkpoint)
+        if self._async_save:
+            self._setup_async_writer()
+        else:
+            self._saver = tf.train.Saver(
+                var_list=self._var_list,
+                max_to_keep=self._max_to_keep,
+                keep_checkpoint_every_n_hours=\
+                    self._keep_checkpoint_every_n_hours)
+
+    def _get_var_list(self):
+        var_list = []
+        for key in self.var_collections:
+            var_list.extend([v for v in tf.get_collection(key)
+                             if v not in var_list])
+        if self._trainable_only:
+            frozen_vars = self.trainer.frozen_variables
+            var_list = [v for v in var_list if v not in frozen_vars]
+        return var_list
+
+    def _setup_async_writer(self):
+        """ Separate graph writing values of variables to checkpoint
+        files, so it can run in parallel with training.
+        """
+        write_graph = tf.Graph()
+        with write_graph.as_default():
+            self._prefix_plh = tf.placeholder(tf.string, [])
+            self._value_plhs = [tf.placeholder(v.dtype.base_dtype,
+                                               shape=v.get_shape())
+                                for v in self._var_list]
+            # same keys as tf.train.Saver
+            self._write_op = io_ops.save_v2(
+                self._prefix_plh,
+                [v.op.name for v in self._var_list],
+                [''] * len(self._var_list),
+                self._value_plhs)
+        self._write_sess = tf.Session(graph=write_graph)
+        self._last_checkpoints = []
+        self._next_keep_time = time.time()\
+            + self._keep_checkpoint_every_n_hours * 3600
+
+    def get_step_trigger(self):
+        return TriggerSpec(every_k_steps=self._periodic)
 
     def _trigger_step(self):
-        if self.global_step % self._periodic == 0:
-            self._saver.save(tf.get_default_session(), self._save_path, 
-                            global_step = self.global_step)
-        
+        if self.is_step_due(self._periodic):
+            start_time = time.time()
+            if self._async_save:
+                self._save_async(tf.get_default_session(), self.global_step)
+            else:
+                save_path = self._saver.save(
+                    tf.get_default_session(), self._save_path, 
+                    global_step = self.global_step)
+                self._save_train_state(save_path, self._get_train_state())
+            # time training waits for saving
+            self._report_time('checkpoint/save_secs',
+                              time.time() - start_time)
+
+    def _report_time(self, tag, secs):
+        s = tf.Summary()
+        s.value.add(tag=tag, simple_value=secs)
+        self.trainer.monitors.process_summary(s)
+
+    def _get_train_state(self):
+        if not self._save_state:
+            return None
+        return {'global_step': self.global_step,
+                'dataflow': self.trainer.get_dataflow_state()}
+
+    def _save_train_state(self, save_path, state):
+        if state is None:
+            return
+        save_train_state(save_path, state)
+        # remove states of checkpoints deleted by saver
+        self._state_paths.append(save_path)
+        for path in list(self._state_paths):
+            if not tf.gfile.Exists(path + '.index'):
+                if tf.gfile.Exists(path + '.state'):
+                    tf.gfile.Remove(path + '.state')
+                self._state_paths.remove(path)
+        # checkpoints kept by keep_checkpoint_every_n_hours are not
+        # deleted by saver, so their states are not tracked anymore
+        if self._max_to_keep:
+            self._state_paths = self._state_paths[-self._max_to_keep:]
+
+    def _save_async(self, sess, global_step):
+        self._wait_for_write()
+        if self._write_secs is not None:
+            self._report_time('checkpoint/write_secs', self._write_secs)
+            self._write_secs = None
+        values = sess.run(self._var_list)
+        state = self._get_train_state()
+        self._write_thread = threading.Thread(
+            target=self._write_checkpoint, args=(values, state, global_step))
+        self._write_thread.daemon = True
+        self._write_thread.start()
+
+    def _wait_for_write(self):
+        if self._write_thread is not None:
+            self._write_thread.join()
+            self._write_thread = None
+        if self._write_error is not None:
+            error, self._write_error = self._write_error, None
+            raise error
+
+    def _write_checkpoint(self, values, state, global_step):
+        try:
+            start_time = time.time()
+            prefix = '{}-{}'.format(self._save_path, global_step)
+            feed = dict(zip(self._value_plhs, values))
+            feed[self._prefix_plh] = prefix
+            self._write_sess.run(self._write_op, feed_dict=feed)
+            if state is not None:
+                save_train_state(prefix, state)
+            for file_name in tf.gfile.Glob(prefix + '.*'):
+                fsync_file(file_name)
+            self._update_checkpoint_state(prefix)
+            self._write_secs = time.time() - start_time
+        except Exception as e:
+            self._write_error = e
+
+    def _update_checkpoint_state(self, prefix):
+        """ Rotate checkpoints in the same way as tf.train.Saver """
+        self._last_checkpoints.append((prefix, time.time()))
+        while self._max_to_keep and\
+            len(self._last_checkpoints) > self._max_to_keep:
+            old_prefix, save_time = self._last_checkpoints.pop(0)
+            if save_time > self._next_keep_time:
+                self._next_keep_time += \
+                    self._keep_checkpoint_every_n_hours * 3600
+                continue
+            for file_name in tf.gfile.Glob(old_prefix + '.*'):
+                tf.gfile.Remove(file_name)
+        tf.train.update_checkpoint_state(
+            self._checkpoint_dir, prefix,
+            all_model_checkpoint_paths=[
+                p for p, _ in self._last_checkpoints])
 
+    def _after_train(self):
+        if self._async_save:
+            self._wait_for_write()
+            self._write_sess.close()
 
+def fsync_file(file_name):
+    """ fsync local file. Remote file systems are skipped. """
+    try:
+        fd = os.open(file_name, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
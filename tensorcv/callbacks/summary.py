@@ -1,36 +1,99 @@
 import scipy.misc
 import os
+import time
+import math
 
 import numpy as np
 import tensorflow as tf
 
 from .base import Callback
+from .trigger import TriggerSpec
 
 __all__ = ['TrainSummary']
 
 class TrainSummary(Callback):
+	""" Write summaries of training steps to monitors.
+
+	Non-histogram summaries (e.g. scalars and images) and histograms
+	are fetched at separate cadences and only at the steps they are
+	due, together with the training step, so activations and gradients
+	are not computed again. Serialized summaries are passed to 
+	monitors without being parsed on the training thread.
+	"""
+	chief_only = True
+
 	def __init__(self, 
 		         key=None,
-		         periodic=1):
-
-	    self.periodic = periodic
-	    if not key is None and not isinstance(key, list):
-	    	key = [key]
-	    self._key = key
+		         periodic=1,
+		         histogram_periodic=None,
+		         min_secs=0,
+		         histogram_sample=None):
+		"""
+		Args:
+			key (str or list): summary collections
+			periodic (int): fetch non-histogram summaries every 
+				periodic steps
+			histogram_periodic (int): fetch histogram summaries every
+				histogram_periodic steps. Default to be periodic.
+			min_secs (float): minimum wall-clock seconds between 
+				two fetches of the same kind of summaries
+			histogram_sample (int): number of histograms randomly 
+				sampled for each fetch. Default to fetch all.
+		"""
+		self.periodic = periodic
+		if histogram_periodic is None:
+			histogram_periodic = periodic
+		self._periodic = {'scalar': periodic, 'histogram': histogram_periodic}
+		self._min_secs = min_secs
+		self._histogram_sample = histogram_sample
+		if not key is None and not isinstance(key, list):
+			key = [key]
+		self._key = key
 
 	def _setup_graph(self):
-		self.summary_list = tf.summary.merge(
-			 [tf.summary.merge_all(key) for key in self._key])
-		# self.all_summary = tf.summary.merge_all(self._key)
+		summary_list = []
+		for key in self._key:
+			summary_list.extend([s for s in tf.get_collection(key)
+			                     if s not in summary_list])
+		self._summaries = {
+			'scalar': [s for s in summary_list 
+			           if s.op.type != 'HistogramSummary'],
+			'histogram': [s for s in summary_list 
+			              if s.op.type == 'HistogramSummary']}
+		self._last_time = {'scalar': 0, 'histogram': 0}
+		self._rng = np.random.RandomState()
 		
-	def _before_run(self, _):
-		if self.global_step % self.periodic == 0:
-			return tf.train.SessionRunArgs(fetches = self.summary_list)
-		else:
-			None
+	def _is_due(self, kind):
+		if not self._summaries[kind]:
+			return False
+		if not self.is_step_due(self._periodic[kind]):
+			return False
+		return time.time() - self._last_time[kind] >= self._min_secs
 
-	def _after_run(self, _, val):
-		if val.results is not None:
-			self.trainer.monitors.process_summary(val.results)
+	def get_run_trigger(self):
+		# steps at which either kind of summaries may be due
+		return TriggerSpec(every_k_steps=math.gcd(
+			self._periodic['scalar'], self._periodic['histogram']))
 
+	def _before_run(self, _):
+		fetches = {}
+		for kind in ['scalar', 'histogram']:
+			if self._is_due(kind):
+				self._last_time[kind] = time.time()
+				fetches[kind] = self._summaries[kind]
+		if 'histogram' in fetches and self._histogram_sample is not None\
+			and self._histogram_sample < len(fetches['histogram']):
+			idxs = self._rng.choice(len(fetches['histogram']), 
+			                        self._histogram_sample, replace=False)
+			fetches['histogram'] = [fetches['histogram'][idx] for idx in idxs]
+		if fetches:
+			return tf.train.SessionRunArgs(fetches=fetches)
+		return None
 
+	def _after_run(self, _, val):
+		if not val.results:
+			return
+		# concatenation of serialized Summary protos is a merged Summary
+		summary = b''.join([s for results in val.results.values()
+		                    for s in results])
+		self.trainer.monitors.process_summary(summary)
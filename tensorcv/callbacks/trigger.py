@@ -2,13 +2,14 @@ import scipy.misc
 import os
 from abc import ABCMeta
 import os
+import time
 
 import numpy as np
 import tensorflow as tf
 
 from .base import ProxyCallback, Callback
 
-__all__ = ['PeriodicTrigger']
+__all__ = ['PeriodicTrigger', 'TriggerSpec']
 
 def assert_type(v, tp):
     assert isinstance(v, tp), \
@@ -32,7 +33,7 @@ class PeriodicTrigger(ProxyCallback):
 	def _trigger_step(self):
 		if self._k_step is None:
 			return
-		if self.global_step % self._k_step == 0:
+		if self.is_step_due(self._k_step):
 			self.cb.trigger()
 
 	def _trigger_epoch(self):
@@ -40,3 +41,51 @@ class PeriodicTrigger(ProxyCallback):
 			return
 		if self.epochs_completed % self._k_epoch == 0:
 			self.cb.trigger()
+
+class TriggerSpec(object):
+	""" When a callback is due, used by Callbacks to skip callbacks 
+	which are not due at the current step. 
+
+	A callback is due if any of the conditions is met.
+	"""
+	def __init__(self, every_k_steps=None, every_k_epochs=None, 
+		         every_k_secs=None):
+		"""
+		Args:
+			every_k_steps (int): due at steps divisible by every_k_steps
+			every_k_epochs (int): due at the first step after epochs 
+				divisible by every_k_epochs are completed
+			every_k_secs (float): due if every_k_secs seconds have passed
+				since the last time it is due
+		"""
+		self._k_step = every_k_steps
+		self._k_epoch = every_k_epochs
+		self._k_secs = every_k_secs
+		self._last_epoch = None
+		self._last_time = 0
+
+	def is_due(self, global_step, epochs_completed, num_steps=1):
+		""" num_steps (int): number of steps run by the last session.run """
+		if self._k_step is not None and global_step // self._k_step\
+			!= (global_step - num_steps) // self._k_step:
+			return True
+		if self._k_epoch is not None\
+			and epochs_completed != self._last_epoch\
+			and epochs_completed % self._k_epoch == 0:
+			return True
+		if self._k_secs is not None\
+			and time.time() - self._last_time >= self._k_secs:
+			return True
+		return False
+
+	def fire(self, epochs_completed):
+		""" record the callback is triggered """
+		self._last_epoch = epochs_completed
+		self._last_time = time.time()
+
+	def check(self, global_step, epochs_completed, num_steps=1):
+		""" Returns whether it is due and record if it is """
+		if self.is_due(global_step, epochs_completed, num_steps):
+			self.fire(epochs_completed)
+			return True
+		return False
@@ -5,5 +5,6 @@ from .base import *
 from .image import * 
 from .matlab import * 
 from .randoms import * 
+from .cache import *
 # from .dataset import *
 from .normalization import *
@@ -39,6 +39,12 @@ class ArgumentDataflow(DataFlow):
     def reset_state(self):
         self._dataflow.reset_state()
 
+    def state_dict(self):
+        return self._dataflow.state_dict()
+
+    def load_state_dict(self, state):
+        self._dataflow.load_state_dict(state)
+
     def after_reading(self):
         self._dataflow.after_reading()
 
@@ -64,6 +64,48 @@ class DataFlow(object):
     def size(self):
         raise NotImplementedError()
 
+    def get_data_list(self):
+        raise NotImplementedError()
+
+    def set_data_list(self, new_data_list):
+        raise NotImplementedError()
+
+    def shard(self, num_shards, shard_id):
+        """ Only keep the shard_id-th of num_shards disjoint parts of data.
+        Used for splitting data among workers in distributed training.
+
+        Args:
+            num_shards (int): number of shards
+            shard_id (int): index of shard to be kept
+        """
+        assert 0 <= shard_id < num_shards
+        data_list = self.get_data_list()
+        assert len(set(len(data) for data in data_list)) <= 1, \
+        'All the lists of get_data_list() have to be the same length!'
+        self.set_data_list([np.array(data)[shard_id::num_shards]
+                            for data in data_list])
+
+    def state_dict(self):
+        """ State of reading data, used for resuming training.
+
+        Returns:
+            dict: picklable state
+        """
+        state = {'epochs_completed': self._epochs_completed}
+        state.update(self._get_state())
+        return state
+
+    def load_state_dict(self, state):
+        """ Continue reading from state returned by state_dict() """
+        self._epochs_completed = state['epochs_completed']
+        self._load_state(state)
+
+    def _get_state(self):
+        return {}
+
+    def _load_state(self, state):
+        pass
+
     def reset_state(self):
         self._reset_state()
 
@@ -77,6 +119,12 @@ class RNGDataFlow(DataFlow):
     def _reset_state(self):
         self.rng = get_rng(self)
 
+    def _get_state(self):
+        return {'rng_state': self.rng.get_state()}
+
+    def _load_state(self, state):
+        self.rng.set_state(state['rng_state'])
+
     def _suffle_file_list(self):
         idxs = np.arange(self.size())
         self.rng.shuffle(idxs)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: cache.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+
+import numpy as np
+import tensorflow as tf
+
+from .base import RNGDataFlow, DataFlow
+from ..utils.utils import assert_type, check_dir
+
+__all__ = ['FeatureCache']
+
+
+class FeatureCache(RNGDataFlow):
+    """ Dataflow of cached activations of a frozen model prefix.
+
+    During the first epoch, batches are read from the input dataflow and
+    the first feed_len components of each batch are replaced by the
+    activations of the frozen layers (computed once by the default
+    session). Activations and the rest of components (e.g. labels) are
+    cached in RAM or in .npy files on disk. Later epochs read batches
+    directly from the cache, so the frozen layers are never run again.
+
+    The model has to implement get_cache_feature(), which returns
+    the input placeholders of the frozen layers and the activation
+    tensor to be cached, and use the activation as its training input
+    (e.g. VGG19 with cache_layer='pool5').
+
+    Note that data augmentation of input dataflow is only applied once,
+    and samples which are not read in the first epoch are not cached.
+    """
+    def __init__(self, dataflow, model,
+                 feed_len=1,
+                 cache_dir=None,
+                 cache_name='feature_cache',
+                 dtype=np.float32,
+                 shuffle=True):
+        """
+        Args:
+            dataflow (DataFlow): input dataflow
+            model (ModelDes): model implements get_cache_feature()
+            feed_len (int): number of components of a batch fed to
+                the frozen layers
+            cache_dir (str): directory for saving cache. Cache is kept
+                in RAM if it is None. An existed complete cache in
+                cache_dir will be reused.
+            cache_name (str): prefix of cache file names
+            dtype: type of cached activations
+            shuffle (bool): shuffle cached data every epoch
+        """
+        assert_type(dataflow, DataFlow)
+        assert hasattr(model, 'get_cache_feature'),\
+        '[FeatureCache] model has to implement get_cache_feature()!'
+        self._dataflow = dataflow
+        self._model = model
+        self._feed_len = feed_len
+        self._dtype = dtype
+        self._shuffle = shuffle
+
+        if cache_dir is not None:
+            check_dir(cache_dir)
+            self._cache_path = os.path.join(cache_dir, cache_name)
+        else:
+            self._cache_path = None
+
+        self._cache = None
+        self._fill_list = None
+        self._data_id = 0
+
+        self.setup(epoch_val=0, batch_size=1)
+        self._load_cache()
+
+        try:
+            self.im_size = dataflow.im_size
+            self.num_channels = dataflow.num_channels
+        except AttributeError:
+            pass
+
+    @property
+    def is_cached(self):
+        return self._cache is not None
+
+    def set_batch_size(self, batch_size):
+        self._batch_size = batch_size
+        try:
+            self._dataflow.set_batch_size(batch_size)
+        except AttributeError:
+            pass
+
+    def size(self):
+        if self.is_cached:
+            return len(self._cache[0])
+        return self._dataflow.size()
+
+    def before_read_setup(self, **kwargs):
+        if not self.is_cached:
+            self._dataflow.before_read_setup(**kwargs)
+            self._is_reading = True
+
+    def after_reading(self):
+        try:
+            if self._is_reading:
+                self._dataflow.after_reading()
+                self._is_reading = False
+        except AttributeError:
+            pass
+
+    def next_batch(self):
+        if self.is_cached:
+            return self._next_cached_batch()
+
+        batch_data = self._dataflow.next_batch()
+        feats = self._get_features(batch_data[:self._feed_len])
+        batch_data = [feats] + list(batch_data[self._feed_len:])
+        self._add_to_cache(batch_data)
+
+        if self._dataflow.epochs_completed > 0:
+            self._finish_cache()
+            self._epochs_completed += 1
+        return batch_data
+
+    def _next_cached_batch(self):
+        assert self._batch_size <= self.size(), \
+        "batch_size cannot be larger than data size"
+
+        start = self._data_id
+        end = min(start + self._batch_size, self.size())
+        idxs = np.sort(self._perm[start:end])
+        batch_data = [np.array(data[idxs]) for data in self._cache]
+
+        self._data_id = end
+        if self._data_id >= self.size():
+            self._epochs_completed += 1
+            self._data_id = 0
+            self._reset_perm()
+        return batch_data
+
+    def _get_state(self):
+        state = super(FeatureCache, self)._get_state()
+        if self.is_cached:
+            state['data_id'] = self._data_id
+            state['perm'] = self._perm
+        return state
+
+    def _load_state(self, state):
+        super(FeatureCache, self)._load_state(state)
+        # cache is not resumed if it was not complete
+        if self.is_cached and 'perm' in state:
+            self._data_id = state['data_id']
+            self._perm = state['perm']
+
+    def _get_features(self, feed_data):
+        sess = tf.get_default_session()
+        inputs, feature = self._model.get_cache_feature()
+        if not isinstance(inputs, list):
+            inputs = [inputs]
+        feats = sess.run(feature, feed_dict=dict(zip(inputs, feed_data)))
+        return feats.astype(self._dtype)
+
+    def _add_to_cache(self, batch_data):
+        if self._fill_list is None:
+            self._fill_list = [[] for _ in batch_data]
+            self._fill_cnt = 0
+            if self._cache_path is not None:
+                # disk cache is allocated once for the whole dataflow
+                self._fill_list = [
+                    np.lib.format.open_memmap(
+                        self._get_cache_file(idx), mode='w+',
+                        dtype=np.asarray(data).dtype,
+                        shape=(self._dataflow.size(),)
+                              + np.asarray(data).shape[1:])
+                    for idx, data in enumerate(batch_data)]
+
+        batch_len = len(batch_data[0])
+        for cache_list, data in zip(self._fill_list, batch_data):
+            if self._cache_path is None:
+                cache_list.append(np.asarray(data))
+            else:
+                cache_list[self._fill_cnt: self._fill_cnt + batch_len] = data
+        self._fill_cnt += batch_len
+
+    def _finish_cache(self):
+        if self._cache_path is None:
+            self._cache = [np.concatenate(cache_list, axis=0)
+                           for cache_list in self._fill_list]
+        else:
+            for cache_list in self._fill_list:
+                cache_list.flush()
+            # count file marks a complete cache
+            np.save(self._get_count_file(), np.array(self._fill_cnt))
+            self._cache = [cache_list[:self._fill_cnt]
+                           for cache_list in self._fill_list]
+        self._fill_list = None
+        self.after_reading()
+        self._data_id = 0
+        self._reset_perm()
+        print('[FeatureCache] {} samples are cached.'.format(self.size()))
+
+    def _load_cache(self):
+        if self._cache_path is None\
+            or not os.path.isfile(self._get_count_file()):
+            return
+        cnt = int(np.load(self._get_count_file()))
+        self._cache = []
+        idx = 0
+        while os.path.isfile(self._get_cache_file(idx)):
+            self._cache.append(
+                np.load(self._get_cache_file(idx), mmap_mode='r')[:cnt])
+            idx += 1
+        self._reset_perm()
+        print('[FeatureCache] Load {} cached samples from {}.'.\
+            format(cnt, self._cache_path))
+
+    def _get_cache_file(self, idx):
+        return '{}_{}.npy'.format(self._cache_path, idx)
+
+    def _get_count_file(self):
+        return '{}_count.npy'.format(self._cache_path)
+
+    def _reset_perm(self):
+        if self._shuffle:
+            self._perm = self.rng.permutation(self.size())
+        else:
+            self._perm = np.arange(self.size())
@@ -95,6 +95,19 @@ class BSDS500(ImageFromFile):
         except AttributeError:
             pass
 
+    def get_data_list(self):
+        if self._is_mask:
+            return [self._im_list, self._gt_list, self._mask_list]
+        return [self._im_list, self._gt_list]
+
+    def set_data_list(self, new_data_list):
+        assert isinstance(new_data_list, list)
+        assert len(new_data_list) == len(self.get_data_list())
+        self._im_list = np.array(new_data_list[0])
+        self._gt_list = np.array(new_data_list[1])
+        if self._is_mask:
+            self._mask_list = np.array(new_data_list[2])
+
 class BSDS500HED(BSDS500):
     def _load_file_list(self, _):
         im_dir = os.path.join(self.data_dir, 'images', self._load_name)
@@ -39,19 +39,40 @@ class CIFAR(RNGDataFlow):
             self._epochs_completed += 1
         else:
             self._batch_file_id += 1
+        self._load_batch_file()
+
+        if self.shuffle:
+            self._suffle_files()
+
+    def _load_batch_file(self):
         self._image = np.array(unpickle(self._file_list[self._batch_file_id]))
         # TODO to be modified
         if self._normalize == 'tanh':
             self._image = (self._image*1. - 128)/128.0
-
-        if self.shuffle:
-            self._suffle_files()
+        # order of images in the file, used for resuming
+        self._order = np.arange(len(self._image))
 
     def _suffle_files(self):
         idxs = np.arange(len(self._image))
 
         self.rng.shuffle(idxs)
         self._image = self._image[idxs]
+        self._order = self._order[idxs]
+
+    def _get_state(self):
+        state = super(CIFAR, self)._get_state()
+        state['batch_file_id'] = self._batch_file_id
+        state['image_id'] = self._image_id
+        state['order'] = self._order
+        return state
+
+    def _load_state(self, state):
+        super(CIFAR, self)._load_state(state)
+        self._batch_file_id = state['batch_file_id']
+        self._load_batch_file()
+        self._image = self._image[state['order']]
+        self._order = np.array(state['order'])
+        self._image_id = state['image_id']
 
     def size(self):
         try:
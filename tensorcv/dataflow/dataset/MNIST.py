@@ -58,6 +58,8 @@ class MNIST(RNGDataFlow):
             self.label_list.append(label)
         self.im_list = np.array(self.im_list)
         self.label_list = np.array(self.label_list)
+        # index of each sample in the loaded order
+        self._order = np.arange(self.size())
 
         if self.shuffle:
             self._suffle_files()
@@ -68,10 +70,38 @@ class MNIST(RNGDataFlow):
         self.rng.shuffle(idxs)
         self.im_list = self.im_list[idxs]
         self.label_list = self.label_list[idxs]
+        self._order = self._order[idxs]
 
     def size(self):
         return self.im_list.shape[0]
 
+    def get_data_list(self):
+        return [self.im_list, self.label_list]
+
+    def set_data_list(self, new_data_list):
+        assert isinstance(new_data_list, list)
+        assert len(new_data_list) == 2
+        self.im_list = np.array(new_data_list[0])
+        self.label_list = np.array(new_data_list[1])
+        self._num_image = self.size()
+        self._image_id = 0
+        self._order = np.arange(self.size())
+
+    def _get_state(self):
+        state = super(MNIST, self)._get_state()
+        state['image_id'] = self._image_id
+        state['order'] = self._order
+        return state
+
+    def _load_state(self, state):
+        super(MNIST, self)._load_state(state)
+        # back to the loaded order, then to the saved order
+        idxs = np.argsort(self._order)[state['order']]
+        self.im_list = self.im_list[idxs]
+        self.label_list = self.label_list[idxs]
+        self._order = self._order[idxs]
+        self._image_id = state['image_id']
+
     def next_batch(self):
         assert self._batch_size <= self.size(), \
           "batch_size {} cannot be larger than data size {}".\
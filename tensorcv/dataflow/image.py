@@ -57,6 +57,18 @@ class DataFromFile(RNGDataFlow):
     def _suffle_file_list(self):
         pass
 
+    def _get_state(self):
+        state = super(DataFromFile, self)._get_state()
+        # file lists are kept in the current shuffled order
+        state['data_id'] = self._data_id
+        state['data_list'] = self.get_data_list()
+        return state
+
+    def _load_state(self, state):
+        super(DataFromFile, self)._load_state(state)
+        self.set_data_list(state['data_list'])
+        self._data_id = state['data_id']
+
     def next_batch(self):
         assert self._batch_size <= self.size(), \
         "batch_size cannot be larger than data size"
@@ -560,13 +572,17 @@ class ImageDenseLabel(ImageFromFile):
         return self._gt_list
 
     def get_data_list(self):
+        if self._mask_pre is not None:
+            return [self._im_list, self._gt_list, self._mask_list]
         return [self._im_list, self._gt_list]
 
     def set_data_list(self, new_data_list):
         assert isinstance(new_data_list, list)
-        assert len(new_data_list) == 2
+        assert len(new_data_list) == len(self.get_data_list())
         self._im_list = np.array(new_data_list[0])
         self._gt_list = np.array(new_data_list[1])
+        if self._mask_pre is not None:
+            self._mask_list = np.array(new_data_list[2])
 
 
 ## TODO Add batch size
@@ -662,6 +678,17 @@ class ImageData(RNGDataFlow):
         self.rng.shuffle(idxs)
         self.im_list = self.im_list[idxs]
 
+    def _get_state(self):
+        state = super(ImageData, self)._get_state()
+        state['data_id'] = self._data_id
+        state['im_list'] = self.im_list
+        return state
+
+    def _load_state(self, state):
+        super(ImageData, self)._load_state(state)
+        self.im_list = np.array(state['im_list'])
+        self._data_id = state['data_id']
+
     def size(self):
         return self.im_list.shape[0]  
 
@@ -63,6 +63,19 @@ class MatlabData(RNGDataFlow):
         if self.shuffle:
             self._suffle_file_list()
 
+    def _get_state(self):
+        state = super(MatlabData, self)._get_state()
+        # file list is kept in the current shuffled order
+        state['image_id'] = self._image_id
+        state['file_list'] = self.file_list
+        return state
+
+    def _load_state(self, state):
+        super(MatlabData, self)._load_state(state)
+        self.file_list = np.array(state['file_list'])
+        self._num_image = self.size()
+        self._image_id = state['image_id']
+
     def next_batch(self):
         assert self._batch_size <= self.size(), \
         "batch_size cannot be larger than data size"
@@ -18,7 +18,7 @@ class RandomVec(DataFlow):
 
     def next_batch(self):
         self._epochs_completed += 1
-        return [np.random.normal(size=(self._batch_size, self._len_vec))]
+        return [self.rng.normal(size=(self._batch_size, self._len_vec))]
         
     def size(self):
         return self._batch_size
@@ -29,6 +29,12 @@ class RandomVec(DataFlow):
     def _reset_state(self):
         self.rng = get_rng(self)
 
+    def _get_state(self):
+        return {'rng_state': self.rng.get_state()}
+
+    def _load_state(self, state):
+        self.rng.set_state(state['rng_state'])
+
 if __name__ == '__main__':
     vec = RandomVec()
     print(vec.next_batch())
@@ -80,6 +80,12 @@ class SeqDataflow(DataFlow):
     def _batch_transform(self, batch_data):
         return batch_data
 
+    def _get_state(self):
+        return {'data_id': self._data_id}
+
+    def _load_state(self, state):
+        self._data_id = state['data_id']
+
         # if len(np.array(batch_data).shape) == 3:
         #     return np.array(batch_data).transpose(1, 0, 2)
         # else:
@@ -4,6 +4,7 @@ import tensorflow as tf
 import numpy as np
 
 from .losses import *
+from ..utils.xla import jit_scope
 
 
 __all__ = ['ModelDes', 'BaseModel', 'GANBaseModel']
@@ -58,6 +59,12 @@ class ModelDes(object):
             plhs = [plhs]
         self._train_plhs = plhs
 
+    def get_inference_placeholder(self):
+        """ Placeholders fed by validation data during training.
+        Default to be the same as train placeholders.
+        """
+        return self.get_train_placeholder()
+
     # TODO to be modified
     def get_prediction_placeholder(self):
         default_plh = self._get_prediction_placeholder()
@@ -99,9 +106,18 @@ class ModelDes(object):
         # self._setup_graph()
 
         self._create_input()
-        self._create_model()
+        try:
+            is_jit = self._is_jit_scope
+        except AttributeError:
+            is_jit = False
+        with jit_scope(enable=is_jit):
+            self._create_model()
         self._ex_setup_graph()
 
+    def set_jit_scope(self, is_jit=True):
+        """ compile ops of _create_model() by XLA """
+        self._is_jit_scope = is_jit
+
     def create_model(self, inputs=None):
         print('**[warning]** consider use dictionary input.')
         """ only called when defined inside other model"""
@@ -211,10 +227,22 @@ class GANBaseModel(ModelDes):
         return 'default_d'
 
     def get_random_vec_placeholder(self):
+        """ Random vectors are sampled from N(0, 1) inside the graph
+        if batch size is set, otherwise they have to be fed.
+        """
         try:
             return self.Z
         except AttributeError:
-            self.Z = tf.placeholder(tf.float32, [None, self.input_vec_length])
+            try:
+                random_vec = tf.random_normal(
+                    [self.get_batch_size(), self.input_vec_length])
+                self.Z = tf.placeholder_with_default(
+                    random_vec, shape=[None, self.input_vec_length])
+                self._random_vec_in_graph = True
+            except AttributeError:
+                self.Z = tf.placeholder(tf.float32, 
+                                        [None, self.input_vec_length])
+                self._random_vec_in_graph = False
         return self.Z
 
     def _get_prediction_placeholder(self):
@@ -227,6 +255,9 @@ class GANBaseModel(ModelDes):
         return default_feed
 
     def _get_random_input_feed(self):
+        self.get_random_vec_placeholder()
+        if self._random_vec_in_graph:
+            return {}
         feed = {self.get_random_vec_placeholder(): 
                 np.random.normal(size = (self.get_batch_size(), 
                                  self.input_vec_length))}
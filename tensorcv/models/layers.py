@@ -6,6 +6,16 @@ import tensorflow as tf
 from tensorflow.contrib.framework import add_arg_scope
 import numpy as np
 
+# collection of 'layer_type:name_scope' of layers, used for profiling
+LAYER_SCOPE_KEY = 'layer_scopes'
+
+def add_layer_scope(layer_type, name_scope=None):
+    """ record name scope of a layer. Default to current name scope. """
+    if name_scope is None:
+        name_scope = tf.get_default_graph().get_name_scope()
+    tf.add_to_collection(LAYER_SCOPE_KEY,
+                         '{}:{}'.format(layer_type, name_scope))
+
 @add_arg_scope
 def conv(x, filter_size, out_dim, 
          name='conv', stride=1, 
@@ -47,6 +57,7 @@ def conv(x, filter_size, out_dim,
     convolve = lambda i, k: tf.nn.conv2d(i, k, strid_shape, padding)
 
     with tf.variable_scope(name) as scope:
+        add_layer_scope('conv')
         weights = new_weights('weights', 0, filter_shape, initializer=init_w,
                               data_dict=data_dict, trainable=trainable, wd=wd)
         out = convolve(x, weights)
@@ -125,7 +136,7 @@ def dconv(x, filter_size, out_dim=None,
     filter_shape = get_shape2D(filter_size) + [out_dim, in_dim]
 
     with tf.variable_scope(name) as scope:
-
+        add_layer_scope('dconv')
         weights = new_weights('weights', 0, filter_shape, initializer=init_w,
                              data_dict=data_dict, trainable=trainable, wd=wd)
         biases = new_biases('biases', 1, [out_dim], initializer=init_b,
@@ -174,6 +185,7 @@ def fc(x, out_dim, name='fc', nl=tf.identity,
     in_dim = x_shape[1]
 
     with tf.variable_scope(name) as scope:
+        add_layer_scope('fc')
         weights = new_weights('weights', 0, [in_dim, out_dim], initializer=init_w,
                               data_dict=data_dict, trainable=trainable, wd=wd)
         biases = new_biases('biases', 1, [out_dim], initializer=init_b,
@@ -278,10 +290,16 @@ def batch_norm(x, train=True, name='bn'):
     Returns:
         tf.tensor with name 'name'
     """
-    return tf.contrib.layers.batch_norm(x, decay=0.9, 
+    cur_name_scope = tf.get_default_graph().get_name_scope()
+    output = tf.contrib.layers.batch_norm(x, decay=0.9, 
                           updates_collections=None,
                           epsilon=1e-5, scale=False,
                           is_training=train, scope=name)
+    # name scope of batch_norm may be uniquified (e.g. bn_1)
+    prefix = cur_name_scope + '/' if cur_name_scope else ''
+    bn_scope = output.op.name[len(prefix):].split('/')[0]
+    add_layer_scope('batch_norm', prefix + bn_scope)
+    return output
 
 def leaky_relu(x, leak=0.2, name='LeakyRelu'):
     """ 
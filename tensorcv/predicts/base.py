@@ -10,6 +10,7 @@ import tensorflow as tf
 from .config import PridectConfig
 from ..utils.sesscreate import ReuseSessionCreator
 from ..utils.common import assert_type
+from ..utils.checkpoint import restore_checkpoint
 from ..callbacks.hooks import Prediction2Hook
 
 __all__ = ['Predictor']
@@ -59,14 +60,11 @@ class Predictor(object):
         # load pre-trained parameters
         load_model_path = os.path.join(self._config.model_dir,
                                        self._config.model_name)
-        if self._restore_vars is not None:
-            # variables = tf.contrib.framework.get_variables_to_restore()
-            # variables_to_restore = [v for v in variables if v.name.split('/')[0] in self._restore_vars]
-            # print(variables_to_restore) 
-            saver = tf.train.Saver(self._restore_vars)
-        else:
-            saver = tf.train.Saver()
-        saver.restore(self.sess, load_model_path)
+        # variables = tf.contrib.framework.get_variables_to_restore()
+        # variables_to_restore = [v for v in variables if v.name.split('/')[0] in self._restore_vars]
+        # print(variables_to_restore) 
+        restore_checkpoint(self.sess, load_model_path, 
+                           var_list=self._restore_vars)
 
     def run_predict(self):
         """
@@ -1,11 +1,13 @@
 import scipy.misc
 import os
 import numpy as np
+import tensorflow as tf
 
 from ..dataflow.base import DataFlow
 from ..models.base import ModelDes
 from ..utils.default import get_default_session_config
 from ..utils.sesscreate import NewSessionCreator
+from ..utils.xla import setup_xla
 from .predictions import PredictionBase
 from ..utils.common import check_dir
 
@@ -23,9 +25,16 @@ class PridectConfig(object):
                  session_creator=None,
                  predictions=None,
                  batch_size=1,
+                 xla=None,
                  default_dirs=None):
         """
         Args:
+            dataflow (DataFlow): data for prediction. Can be None for
+                predicts.server.PredictServer.
+            session_creator (tf.train.SessionCreator): Default to be
+                NewSessionCreator with default session config.
+            xla (str): XLA JIT compilation. None, 'global' or 'scoped'.
+                See train.config.TrainConfig.
         """
         self.model_name = model_name
         try:
@@ -46,12 +55,11 @@ class PridectConfig(object):
         self.restore_vars = restore_vars
 
 
-        assert dataflow is not None, "dataflow cannot be None!"
-        assert_type(dataflow, DataFlow)
-        self.dataflow = dataflow
-        
         assert batch_size > 0
-        self.dataflow.set_batch_size(batch_size)
+        if dataflow is not None:
+            assert_type(dataflow, DataFlow)
+            dataflow.set_batch_size(batch_size)
+        self.dataflow = dataflow
         self.batch_size = batch_size
         
         assert model is not None, "model cannot be None!"
@@ -73,8 +81,9 @@ class PridectConfig(object):
             self.session_creator = \
                  NewSessionCreator(config=get_default_session_config())
         else:
-            raise ValueError('custormer session creator is \
-                               not allowed at this point!')
+            assert_type(session_creator, tf.train.SessionCreator)
+            self.session_creator = session_creator
+        setup_xla(xla, self.session_creator, model)
         
     @property
     def callbacks(self):
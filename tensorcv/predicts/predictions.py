@@ -2,14 +2,13 @@
 # Author: Qian Ge <geqian1001@gmail.com>
 
 import os
-import scipy.io
-import scipy.misc
 
 import tensorflow as tf
 import numpy as np
 
 from ..utils.common import get_tensors_by_names
 from ..utils.viz import *
+from ..utils.writer import *
 
 __all__ = ['PredictionImage', 'PredictionScalar', 'PredictionMat', 'PredictionMeanScalar', 'PredictionOverlay']
 
@@ -59,6 +58,21 @@ class PredictionBase(object):
     def get_predictions(self):
         return self._predictions
 
+    def get_prefix_list(self):
+        return self._prefix_list
+
+    @property
+    def writer(self):
+        """ ResultWriter for saving results in background.
+        Default to be the writer shared by all predictions. """
+        try:
+            if self._writer is not None:
+                return self._writer
+        except AttributeError:
+            pass
+        self._writer = get_default_writer()
+        return self._writer
+
     def after_prediction(self, results):
         """ process after predition
             default to save predictions
@@ -71,6 +85,13 @@ class PredictionBase(object):
     def after_finish_predict(self):
         """ process after all prediction steps """
         self._after_finish_predict()
+        # wait for results saved in background
+        try:
+            writer = self._writer
+        except AttributeError:
+            return
+        if writer is not None:
+            writer.drain()
 
     def _after_finish_predict(self):
         pass
@@ -84,17 +105,29 @@ class PredictionImage(PredictionBase):
     """
     def __init__(self, prediction_image_tensors, 
                 save_prefix, merge_im=False, 
-                tanh=False, color=False):
+                tanh=False, color=False,
+                file_format='png', compress_level=None, writer=None):
         """
         Args:
             prediction_image_tensors (list): a list of tensor names
             save_prefix (list): a list of file prefix for saving 
                                 each tensor in prediction_image_tensors
             merge_im (bool): merge output of one batch or not
+            file_format (str): 'png', or 'npy' and 'npz' for saving
+                               raw results without merging and coloring
+            compress_level (int): png compression level from 0 to 9.
+                                  Lower is faster but larger.
+            writer (ResultWriter): writer for saving in background.
+                                   Default to be the shared writer.
         """
+        assert file_format in IMAGE_FORMATS, \
+        'file_format has to be one of {}'.format(IMAGE_FORMATS)
         self._merge = merge_im
         self._tanh = tanh
         self._color = color
+        self._file_format = file_format
+        self._compress_level = compress_level
+        self._writer = writer
         super(PredictionImage, self).__init__(prediction_tensors=prediction_image_tensors, 
                                              save_prefix=save_prefix)
 
@@ -105,18 +138,21 @@ class PredictionImage(PredictionBase):
             if self._merge and re.shape[0] > 1:
                 grid_size = self._get_grid_size(re.shape[0])
                 save_path = os.path.join(self._save_dir, 
-                               str(cur_global_ind) + '_' + prefix + '.png')
-                save_merge_images(np.squeeze(re), 
+                               str(cur_global_ind) + '_' + prefix)
+                self.writer.write(save_merge_result, np.squeeze(re), 
                                 [grid_size, grid_size], save_path, 
-                                tanh=self._tanh, color=self._color)
+                                tanh=self._tanh, color=self._color,
+                                file_format=self._file_format,
+                                compress_level=self._compress_level)
                 cur_global_ind += 1
             else:
                 for im in re:
                     save_path = os.path.join(self._save_dir, 
-                               str(cur_global_ind) + '_' + prefix + '.png')
-                    if self._color:
-                        im = intensity_to_rgb(np.squeeze(im), normalize=True)
-                    scipy.misc.imsave(save_path, np.squeeze(im))
+                               str(cur_global_ind) + '_' + prefix)
+                    self.writer.write(save_result, save_path, np.squeeze(im),
+                                      file_format=self._file_format,
+                                      compress_level=self._compress_level,
+                                      color=self._color)
                     cur_global_ind += 1
         self._global_ind = cur_global_ind
 
@@ -130,7 +166,8 @@ class PredictionImage(PredictionBase):
 class PredictionOverlay(PredictionImage):
     def __init__(self, prediction_image_tensors, 
                 save_prefix, merge_im=False, 
-                tanh=False, color=False):
+                tanh=False, color=False,
+                file_format='png', compress_level=None, writer=None):
         if not isinstance(prediction_image_tensors, list):
             prediction_image_tensors = [prediction_image_tensors]
         assert len(prediction_image_tensors) == 2,\
@@ -139,7 +176,10 @@ class PredictionOverlay(PredictionImage):
 
         super(PredictionOverlay, self).__init__(prediction_image_tensors, 
                                             save_prefix, merge_im=merge_im, 
-                                            tanh=tanh, color=color)
+                                            tanh=tanh, color=color,
+                                            file_format=file_format,
+                                            compress_level=compress_level,
+                                            writer=writer)
 
         self._overlay_prefix = '{}_{}'.format(self._prefix_list[0], self._prefix_list[1])
 
@@ -147,24 +187,27 @@ class PredictionOverlay(PredictionImage):
         cur_global_ind = self._global_ind
 
         if self._merge and results[0].shape[0] > 1:
-            overlay_im_list = []
-            for im_1, im_2 in zip(results[0], results[1]):
-                overlay_im = image_overlay(im_1, im_2, color=self._color)
-                overlay_im_list.append(overlay_im)
+            overlay_ims = batch_image_overlay(results[0], results[1],
+                                              color=self._color)
 
             grid_size = self._get_grid_size(results[0].shape[0])
             save_path = os.path.join(self._save_dir, 
-                    str(cur_global_ind) + '_' + self._overlay_prefix + '.png')
-            save_merge_images(np.squeeze(overlay_im_list), 
-                                [grid_size, grid_size], save_path, 
-                                tanh=self._tanh, color=False)
+                    str(cur_global_ind) + '_' + self._overlay_prefix)
+            self.writer.write(save_merge_result, np.squeeze(overlay_ims), 
+                              [grid_size, grid_size], save_path, 
+                              tanh=self._tanh, color=False,
+                              file_format=self._file_format,
+                              compress_level=self._compress_level)
             cur_global_ind += 1
         else:
             for im_1, im_2 in zip(results[0], results[1]):
                 overlay_im = image_overlay(im_1, im_2, color=self._color)
                 save_path = os.path.join(self._save_dir, 
-                    str(cur_global_ind) + '_' + self._overlay_prefix + '.png')
-                scipy.misc.imsave(save_path, np.squeeze(overlay_im))
+                    str(cur_global_ind) + '_' + self._overlay_prefix)
+                self.writer.write(save_result, save_path,
+                                  np.squeeze(overlay_im),
+                                  file_format=self._file_format,
+                                  compress_level=self._compress_level)
                 cur_global_ind += 1
         self._global_ind = cur_global_ind
 
@@ -205,11 +248,28 @@ class PredictionMeanScalar(PredictionScalar):
 
 
 class PredictionMat(PredictionBase):
+    def __init__(self, prediction_tensors, save_prefix,
+                 file_format='mat', writer=None):
+        """
+        Args:
+            file_format (str): 'mat' or 'npz'
+            writer (ResultWriter): writer for saving in background.
+                                   Default to be the shared writer.
+        """
+        assert file_format in ARRAY_FORMATS, \
+        'file_format has to be one of {}'.format(ARRAY_FORMATS)
+        self._file_format = file_format
+        self._writer = writer
+        super(PredictionMat, self).__init__(prediction_tensors=prediction_tensors,
+                                            save_prefix=save_prefix)
+
     def _save_prediction(self, results):
         save_path = os.path.join(self._save_dir, 
-                               str(self._global_ind) + '_' + 'batch_test' + '.mat')
-        scipy.io.savemat(save_path, {name: np.squeeze(val) for name, val 
-              in zip(self._prefix_list, results)})
+                               str(self._global_ind) + '_' + 'batch_test')
+        self.writer.write(save_arrays, save_path,
+                          {name: np.squeeze(val) for name, val 
+                           in zip(self._prefix_list, results)},
+                          file_format=self._file_format)
 
         self._global_ind += 1
 
@@ -0,0 +1,589 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: server.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import json
+import time
+import socket
+import threading
+from collections import deque
+try:
+    import queue
+    from http.client import HTTPConnection
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn, UnixStreamServer
+except ImportError:
+    import Queue as queue
+    from httplib import HTTPConnection
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn, UnixStreamServer
+
+import numpy as np
+
+from .base import Predictor
+
+__all__ = ['PredictServer', 'PredictClient']
+
+
+class _PredictRequest(object):
+    """ One request waiting in the queue of PredictServer """
+    def __init__(self, inputs, size):
+        self.inputs = inputs
+        self.size = size
+        self.enqueue_time = time.time()
+        self.start_time = None
+        self.done = threading.Event()
+        self.outputs = None
+        self.error = None
+        self.batch_size = 0
+        self.run_secs = 0
+        # set when the client stops waiting before the request is run
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """ Abandon the request if it has not been started """
+        with self._lock:
+            if self.start_time is None:
+                self.cancelled = True
+
+    def start(self, start_time):
+        """ Mark the request as started. Return False if cancelled. """
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.start_time = start_time
+            return True
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # concurrent clients connecting at the same time
+    request_queue_size = 128
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _PredictHandler(BaseHTTPRequestHandler):
+    # keep connections of clients alive between requests
+    protocol_version = 'HTTP/1.1'
+
+    def _send_json(self, code, obj):
+        body = json.dumps(obj).encode('utf-8')
+        self._send_body(code, body, 'application/json')
+
+    def _send_body(self, code, body, content_type):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/metrics':
+            body = self.server.predictor.render_metrics().encode('utf-8')
+            self._send_body(200, body, 'text/plain; version=0.0.4')
+        elif path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.split('?')[0] != '/predict':
+            self._send_json(404, {'error': 'not found'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            inputs = request['inputs']
+        except (ValueError, KeyError, TypeError) as e:
+            self._send_json(400, {'error': 'invalid request: {}'.format(e)})
+            return
+        code, response = self.server.predictor.predict_request(inputs)
+        self._send_json(code, response)
+
+    def address_string(self):
+        # client address of unix socket is empty
+        return str(self.client_address)
+
+    def log_message(self, *args):
+        pass
+
+
+class _TCPPredictHandler(_PredictHandler):
+    # headers and body of responses are written separately
+    disable_nagle_algorithm = True
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    return float(np.percentile(values, q))
+
+
+class PredictServer(Predictor):
+    """ Long-lived prediction service.
+
+    Graph is created and parameters are restored once. Requests are
+    posted to http://host:port/predict (or a unix socket) as JSON
+    {"inputs": [input_1, input_2, ...]} with one array for each
+    prediction placeholder of the model, or a dict of placeholder
+    names and arrays. Arrays of a request can contain one example or
+    a batch of examples.
+
+    Concurrent requests are queued and coalesced into one batch until
+    max_batch_size examples are collected or the first request has
+    waited max_latency_ms. Each batch is one session.run(), and results
+    are split back to requests as
+    {"outputs": {prefix: array}, "latency_ms": {...}, "batch_size": n}.
+    Outputs are the tensors of predictions in config, named by their
+    save_prefix. Outputs without batch dimension are returned to all
+    requests of the batch. Predictions are not saved by the server.
+
+    Latency of requests (queueing, session run and total), queue size
+    and batch sizes are served at /metrics in Prometheus text format.
+    """
+    def __init__(self, config, max_batch_size=32, max_latency_ms=5,
+                 max_queue_size=256, timeout_secs=30,
+                 host='127.0.0.1', port=0, unix_socket=None,
+                 history_size=1000):
+        """
+        Args:
+            config (PridectConfig): config of predictor. dataflow
+                is not used.
+            max_batch_size (int): maximum number of examples in one
+                batch. If batch size of prediction placeholders is fixed,
+                batches are padded to that size.
+            max_latency_ms (float): maximum time a request waits for
+                more requests to be batched with.
+            max_queue_size (int): maximum number of waiting requests.
+                Requests are rejected with 503 when the queue is full.
+            timeout_secs (float): requests not finished in timeout_secs
+                are returned with 504, and are not run if they are
+                still in queue.
+            host (str): address of server. Default to be localhost only.
+            port (int): port of server. 0 for any free port.
+            unix_socket (str): path of unix socket. If it is not None,
+                the server listens on the socket instead of host:port.
+            history_size (int): number of recent requests for latency
+                metrics
+        """
+        super(PredictServer, self).__init__(config)
+        placeholders = self._model.get_prediction_placeholder()
+        if not isinstance(placeholders, list):
+            placeholders = [placeholders]
+        self._plhs = placeholders
+        self._plh_names = [plh.op.name for plh in placeholders]
+
+        self._outputs = []
+        self._output_keys = []
+        for pred in self._config.predictions:
+            self._outputs += pred.get_predictions()
+            self._output_keys += pred.get_prefix_list()
+
+        fixed_sizes = set(plh.get_shape()[0].value for plh in placeholders
+                          if plh.get_shape().ndims)
+        fixed_sizes.discard(None)
+        assert len(fixed_sizes) <= 1, \
+        'Batch sizes of prediction placeholders are different: {}'.\
+        format(fixed_sizes)
+        if fixed_sizes:
+            self._fixed_batch_size = fixed_sizes.pop()
+            max_batch_size = self._fixed_batch_size
+        else:
+            self._fixed_batch_size = None
+        assert max_batch_size > 0
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency_ms / 1000.
+        self._timeout_secs = timeout_secs
+        self._host = host
+        self._port = port
+        self._unix_socket = unix_socket
+
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._carry = None
+        self._stop_event = threading.Event()
+        self._server = None
+
+        self._metrics_lock = threading.Lock()
+        self._queue_secs = deque(maxlen=history_size)
+        self._run_secs = deque(maxlen=history_size)
+        self._total_secs = deque(maxlen=history_size)
+        self._batch_sizes = deque(maxlen=history_size)
+        self._counts = {'requests': 0, 'examples': 0, 'batches': 0,
+                        'rejected': 0, 'timeouts': 0, 'errors': 0,
+                        'cancelled': 0}
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def address(self):
+        """ unix socket path or (host, port) of server """
+        if self._unix_socket is not None:
+            return self._unix_socket
+        return (self._host, self._port)
+
+    def start(self):
+        """ Start serving in background threads """
+        if self._unix_socket is not None:
+            if os.path.exists(self._unix_socket):
+                os.remove(self._unix_socket)
+            self._server = _ThreadingUnixHTTPServer(self._unix_socket,
+                                                    _PredictHandler)
+        else:
+            self._server = _ThreadingHTTPServer((self._host, self._port),
+                                                _TCPPredictHandler)
+            self._port = self._server.server_address[1]
+        self._server.predictor = self
+
+        self._stop_event.clear()
+        self._batch_thread = threading.Thread(target=self._batch_loop)
+        self._batch_thread.daemon = True
+        self._batch_thread.start()
+        self._server_thread = threading.Thread(
+            target=self._server.serve_forever)
+        self._server_thread.daemon = True
+        self._server_thread.start()
+        print('[PredictServer] serving predictions at {}'.format(
+            self._unix_socket or 'http://{}:{}/predict'.format(
+                self._host, self._port)))
+
+    def stop(self):
+        """ Stop server. Waiting requests are finished first. """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server_thread.join()
+        self._stop_event.set()
+        self._batch_thread.join()
+        self._server = None
+        if self._unix_socket is not None and\
+            os.path.exists(self._unix_socket):
+            os.remove(self._unix_socket)
+
+    def run_predict(self):
+        """ Serve until interrupted """
+        self.start()
+        try:
+            while not self._stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+        self.after_prediction()
+
+    def _parse_inputs(self, inputs):
+        """ Returns (list of arrays for placeholders, number of examples) """
+        if isinstance(inputs, dict):
+            inputs = [inputs[name] for name in self._plh_names]
+        if not isinstance(inputs, list) or len(inputs) != len(self._plhs):
+            raise ValueError('Expect {} inputs for {}'.format(
+                len(self._plhs), self._plh_names))
+        arrays = []
+        for plh, val in zip(self._plhs, inputs):
+            val = np.asarray(val, dtype=plh.dtype.as_numpy_dtype)
+            ndims = plh.get_shape().ndims
+            if ndims is not None and val.ndim == ndims - 1:
+                # one example without batch dimension
+                val = np.expand_dims(val, 0)
+            if ndims is not None:
+                # check here, so one invalid request does not fail
+                # all the requests batched with it
+                dims = [plh.get_shape()[i].value for i in range(1, ndims)]
+                if val.ndim != ndims or any(
+                        d is not None and d != v
+                        for d, v in zip(dims, val.shape[1:])):
+                    raise ValueError('Input {} has shape {}, expect {}'
+                                     .format(plh.op.name, val.shape,
+                                             [None] + dims))
+            arrays.append(val)
+        sizes = set(len(val) for val in arrays)
+        if len(sizes) != 1:
+            raise ValueError('Inputs have different numbers of examples')
+        size = sizes.pop()
+        if size < 1 or size > self._max_batch_size:
+            raise ValueError('Number of examples has to be in [1, {}]'
+                             .format(self._max_batch_size))
+        return arrays, size
+
+    def predict_request(self, inputs):
+        """ Queue one request and wait for the results.
+
+        Returns:
+            (int, dict): HTTP status code and response
+        """
+        try:
+            arrays, size = self._parse_inputs(inputs)
+        except (ValueError, KeyError, TypeError) as e:
+            return 400, {'error': 'invalid inputs: {}'.format(e)}
+
+        request = _PredictRequest(arrays, size)
+        try:
+            self._queue.put_nowait(request)
+        except queue.Full:
+            self._add_count('rejected')
+            return 503, {'error': 'request queue is full'}
+
+        if not request.done.wait(self._timeout_secs):
+            # not run later if it is still in queue
+            request.cancel()
+            self._add_count('timeouts')
+            return 504, {'error': 'request timeout'}
+        if request.error is not None:
+            return 500, {'error': request.error}
+
+        finish_time = time.time()
+        queue_secs = request.start_time - request.enqueue_time
+        total_secs = finish_time - request.enqueue_time
+        with self._metrics_lock:
+            self._queue_secs.append(queue_secs)
+            self._run_secs.append(request.run_secs)
+            self._total_secs.append(total_secs)
+        return 200, {'outputs': {key: val.tolist() for key, val
+                                 in request.outputs.items()},
+                     'batch_size': request.batch_size,
+                     'latency_ms': {'queue': queue_secs * 1000,
+                                    'run': request.run_secs * 1000,
+                                    'total': total_secs * 1000}}
+
+    def _add_count(self, key, val=1):
+        with self._metrics_lock:
+            self._counts[key] += val
+
+    def _next_request(self, timeout):
+        if self._carry is not None:
+            request, self._carry = self._carry, None
+            return request
+        end_time = time.time() + timeout
+        while True:
+            request = self._queue.get(
+                timeout=max(end_time - time.time(), 0))
+            if not request.cancelled:
+                return request
+            self._add_count('cancelled')
+
+    def _batch_loop(self):
+        while not (self._stop_event.is_set() and self._carry is None
+                   and self._queue.empty()):
+            try:
+                first = self._next_request(timeout=0.1)
+            except queue.Empty:
+                continue
+            batch = [first]
+            num_examples = first.size
+            deadline = first.enqueue_time + self._max_latency
+            while num_examples < self._max_batch_size:
+                # requests already in queue are batched even if
+                # the first request has waited longer than max_latency
+                remaining = max(deadline - time.time(), 0)
+                try:
+                    request = self._next_request(timeout=remaining)
+                except queue.Empty:
+                    break
+                if num_examples + request.size > self._max_batch_size:
+                    # run in the next batch
+                    self._carry = request
+                    break
+                batch.append(request)
+                num_examples += request.size
+            self._run_batch(batch, num_examples)
+
+    def _run_batch(self, batch, num_examples):
+        start_time = time.time()
+        started = [request for request in batch if request.start(start_time)]
+        if len(started) < len(batch):
+            # cancelled while the batch was collected
+            self._add_count('cancelled', len(batch) - len(started))
+            batch = started
+            num_examples = sum(request.size for request in batch)
+            if not batch:
+                return
+        try:
+            feed = self._model.get_graph_feed()
+            for idx, plh in enumerate(self._plhs):
+                val = np.concatenate([r.inputs[idx] for r in batch], axis=0)
+                if self._fixed_batch_size is not None\
+                    and num_examples < self._fixed_batch_size:
+                    # pad with the last example
+                    pad = np.repeat(val[-1:],
+                                    self._fixed_batch_size - num_examples,
+                                    axis=0)
+                    val = np.concatenate((val, pad), axis=0)
+                feed[plh] = val
+            results = self.sess.run(self._outputs, feed_dict=feed)
+        except Exception as e:
+            for request in batch:
+                request.error = str(e)
+                request.done.set()
+            self._add_count('errors', len(batch))
+            return
+
+        run_secs = time.time() - start_time
+        padded_size = self._fixed_batch_size or num_examples
+        start = 0
+        for request in batch:
+            outputs = {}
+            for key, val in zip(self._output_keys, results):
+                val = np.asarray(val)
+                if val.ndim > 0 and len(val) == padded_size:
+                    val = val[start:start + request.size]
+                outputs[key] = val
+            start += request.size
+            request.outputs = outputs
+            request.batch_size = num_examples
+            request.run_secs = run_secs
+            request.done.set()
+
+        with self._metrics_lock:
+            self._batch_sizes.append(num_examples)
+            self._counts['requests'] += len(batch)
+            self._counts['examples'] += num_examples
+            self._counts['batches'] += 1
+
+    def get_metrics(self):
+        """ Counts and latency percentiles (in seconds) of recent requests.
+        Requests of 'timeouts' which are not run yet are skipped and
+        counted as 'cancelled'.
+        """
+        with self._metrics_lock:
+            metrics = dict(self._counts)
+            metrics['queue_size'] = self._queue.qsize()
+            batch_sizes = list(self._batch_sizes)
+            metrics['mean_batch_size'] = float(np.mean(batch_sizes))\
+                if batch_sizes else None
+            for name, values in [('queue', self._queue_secs),
+                                 ('run', self._run_secs),
+                                 ('total', self._total_secs)]:
+                values = list(values)
+                for q in [50, 90, 99]:
+                    metrics['latency_{}_p{}'.format(name, q)] =\
+                        _percentile(values, q)
+        return metrics
+
+    def render_metrics(self, prefix='tensorcv_predict'):
+        """ Metrics in Prometheus text format """
+        lines = []
+        for name, value in sorted(self.get_metrics().items()):
+            if value is None:
+                continue
+            metric_type = 'gauge'
+            if name in self._counts:
+                # counts only increase
+                metric_type = 'counter'
+                name = name + '_total'
+            elif name.startswith('latency_'):
+                name = name + '_seconds'
+            name = '{}_{}'.format(prefix, name)
+            lines += ['# TYPE {} {}'.format(name, metric_type),
+                      '{} {}'.format(name, float(value))]
+        return '\n'.join(lines) + '\n'
+
+
+class _UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path, timeout):
+        HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+class PredictClient(object):
+    """ Client of PredictServer.
+
+    Example:
+        server = PredictServer(config)
+        server.start()
+        client = PredictClient(port=server.port)
+        outputs = client.predict([image])
+        server.stop()
+
+    One client keeps one connection, so use one client for
+    each thread.
+    """
+    def __init__(self, host='127.0.0.1', port=None, unix_socket=None,
+                 timeout_secs=60):
+        """
+        Args:
+            host (str): address of server
+            port (int): port of server
+            unix_socket (str): path of unix socket of server. Used
+                instead of host and port if it is not None.
+            timeout_secs (float): timeout of connection
+        """
+        assert port is not None or unix_socket is not None, \
+        'port or unix_socket has to be given!'
+        self._host = host
+        self._port = port
+        self._unix_socket = unix_socket
+        self._timeout_secs = timeout_secs
+        self._conn = None
+        self.last_response = None
+
+    def _get_connection(self):
+        if self._conn is None:
+            if self._unix_socket is not None:
+                self._conn = _UnixHTTPConnection(self._unix_socket,
+                                                 self._timeout_secs)
+            else:
+                self._conn = HTTPConnection(self._host, self._port,
+                                            timeout=self._timeout_secs)
+        return self._conn
+
+    def _request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'} if body else {}
+        conn = self._get_connection()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read().decode('utf-8')
+        except Exception:
+            self.close()
+            raise
+        return response.status, data
+
+    def predict(self, inputs):
+        """ Predict one example or a batch of examples.
+
+        Args:
+            inputs (list or dict): arrays for prediction placeholders
+
+        Returns:
+            dict: output arrays by names. The whole response including
+            latency is kept in last_response.
+        """
+        if isinstance(inputs, dict):
+            inputs = {key: np.asarray(val).tolist()
+                      for key, val in inputs.items()}
+        else:
+            inputs = [np.asarray(val).tolist() for val in inputs]
+        body = json.dumps({'inputs': inputs}).encode('utf-8')
+        status, data = self._request('POST', '/predict', body)
+        response = json.loads(data)
+        if status != 200:
+            raise RuntimeError('[PredictClient] {}: {}'.format(
+                status, response.get('error')))
+        self.last_response = response
+        return {key: np.asarray(val)
+                for key, val in response['outputs'].items()}
+
+    def metrics(self):
+        """ Metrics of server in Prometheus text format """
+        return self._request('GET', '/metrics')[1]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
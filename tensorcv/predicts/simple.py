@@ -15,6 +15,7 @@ class SimpleFeedPredictor(Predictor):
     """ predictor with feed input """
     # set_is_training
     def __init__(self, config):
+        assert config.dataflow is not None, "dataflow cannot be None!"
         super(SimpleFeedPredictor, self).__init__(config)
         # TODO change len_input to other
         placeholders = self._model.get_prediction_placeholder()
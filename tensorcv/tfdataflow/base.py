@@ -9,6 +9,15 @@ from tensorflow.python.lib.io import file_io
 from ..dataflow.base import DataFlow
 from ..dataflow.normalization import identity
 from ..utils.utils import assert_type
+from .convert import get_tfrecord_options
+
+
+def _remove_queue_runners(runners):
+    """ Queue runners of a replaced pipeline are not started """
+    collection = tf.get_collection_ref(tf.GraphKeys.QUEUE_RUNNERS)
+    for runner in runners:
+        if runner in collection:
+            collection.remove(runner)
 
 
 class DataFromTfrecord(DataFlow):
@@ -21,7 +30,13 @@ class DataFromTfrecord(DataFlow):
                  shuffle=True,
                  data_shape=[],
                  feature_len_list=None,
-                 pf=identity):
+                 pf=identity,
+                 compression=None):
+        """
+        Args:
+            compression (str): None, 'GZIP' or 'ZLIB'. Compression of 
+                tfrecord files.
+        """
 
         if not isinstance(tfname, list):
             tfname = [tfname]
@@ -57,6 +72,7 @@ class DataFromTfrecord(DataFlow):
         self.data_shape = data_shape
         self._tfname = tfname
         self._batch_dict_name = batch_dict_name
+        self._options = get_tfrecord_options(compression)
 
         self._shuffle = shuffle
 
@@ -74,41 +90,65 @@ class DataFromTfrecord(DataFlow):
 
     def updata_data_op(self, batch_size):
         try:
-            if self._shuffle is True:
-                self._data = tf.train.shuffle_batch(
-                    self._decode_data,
-                    batch_size=batch_size,
-                    capacity=batch_size * 4,
-                    num_threads=2,
-                    min_after_dequeue=batch_size * 2)
-            else:
-                print('***** data is not shuffled *****')
-                self._data = tf.train.batch(
-                    self._decode_data,
-                    batch_size=batch_size,
-                    capacity=batch_size,
-                    num_threads=1,
-                    allow_smaller_final_batch=False)
-            # self._data = self._decode_data[0]
-            # print(self._data)
+            decode_data = self._decode_data
+        except AttributeError:
+            return
+        # batch queue of the previous batch size is not used anymore
+        try:
+            _remove_queue_runners(self._batch_runners)
         except AttributeError:
             pass
+        num_runners = len(tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS))
+        if self._shuffle is True:
+            self._data = tf.train.shuffle_batch(
+                decode_data,
+                batch_size=batch_size,
+                capacity=batch_size * 4,
+                num_threads=2,
+                min_after_dequeue=batch_size * 2)
+        else:
+            print('***** data is not shuffled *****')
+            self._data = tf.train.batch(
+                decode_data,
+                batch_size=batch_size,
+                capacity=batch_size,
+                num_threads=1,
+                allow_smaller_final_batch=False)
+        self._batch_runners = tf.get_collection(
+            tf.GraphKeys.QUEUE_RUNNERS)[num_runners:]
+        # self._data = self._decode_data[0]
+        # print(self._data)
 
     def reset_epochs_completed(self, val):
         self._epochs_completed  = val
         self._batch_step = 0
 
+    def _get_state(self):
+        # records are read by queue runners, so only counters are resumed
+        return {'batch_step': self._batch_step}
+
+    def _load_state(self, state):
+        self._batch_step = state['batch_step']
+
     # def _setup(self, **kwargs):
     def setup_decode_data(self):    
         # n_epoch = kwargs['num_epoch']
-        
+        # reading files of the previous pipeline (e.g. before shard())
+        try:
+            _remove_queue_runners(self._input_runners)
+        except AttributeError:
+            pass
+        num_runners = len(tf.get_collection(tf.GraphKeys.QUEUE_RUNNERS))
+
         feature = {}
         for record_name, r_type, cur_size in zip(self.record_names, self.record_types, self._feat_len_list):
             feature[record_name] = tf.FixedLenFeature(cur_size, r_type)
         # filename_queue = tf.train.string_input_producer(self._tfname, num_epochs=n_epoch)
         filename_queue = tf.train.string_input_producer(self._tfname)
-        reader = tf.TFRecordReader()
+        reader = tf.TFRecordReader(options=self._options)
         _, serialized_example = reader.read(filename_queue)
+        self._input_runners = tf.get_collection(
+            tf.GraphKeys.QUEUE_RUNNERS)[num_runners:]
         features = tf.parse_single_example(serialized_example, features=feature)
         decode_data = [decode_fnc(features[record_name], raw_type)
                        for decode_fnc, record_name, raw_type
@@ -133,21 +173,27 @@ class DataFromTfrecord(DataFlow):
         self.coord = tf.train.Coordinator()
         self.threads = tf.train.start_queue_runners(coord=self.coord)
 
-    def next_batch(self):
-        sess = tf.get_default_session()
-        batch_data = sess.run(self._data)
+    def get_batch_tensors(self):
+        """ batch tensors for building model directly on them """
+        return self._data
+
+    def count_batch(self):
+        """ update epoch counter after one batch is consumed """
         self._batch_step += 1
         if self._batch_step % self._step_per_epoch == 0:
             self._epochs_completed += 1
+
+    def next_batch(self):
+        sess = tf.get_default_session()
+        batch_data = sess.run(self._data)
+        self.count_batch()
         # print(batch_data[2])
         return batch_data
 
     def next_batch_dict(self):
         sess = tf.get_default_session()
         batch_data = sess.run(self._data)
-        self._batch_step += 1
-        if self._batch_step % self._step_per_epoch == 0:
-            self._epochs_completed += 1
+        self.count_batch()
         batch_dict = {name: data for name, data in zip(self._batch_dict_name, batch_data)}
         return batch_dict
 
@@ -155,10 +201,29 @@ class DataFromTfrecord(DataFlow):
         self.coord.request_stop()
         self.coord.join(self.threads)
 
+    def shard(self, num_shards, shard_id):
+        """ Only keep the shard_id-th of num_shards parts of tfrecord files.
+        Data pipeline is rebuilt, so it has to be called before
+        building the model. Queue runners of the old pipeline are
+        removed, so they are not started by before_read_setup().
+        """
+        assert 0 <= shard_id < num_shards
+        assert len(self._tfname) >= num_shards,\
+        'Number of tfrecord files {} is less than number of shards {}!'.\
+            format(len(self._tfname), num_shards)
+        self._tfname = self._tfname[shard_id::num_shards]
+        try:
+            del self._size
+        except AttributeError:
+            pass
+        self.setup_decode_data()
+
     def size(self):
         try:
             return self._size
         except AttributeError:
-            self._size = sum(1 for f in self._tfname for _ in tf.python_io.tf_record_iterator(f))
+            self._size = sum(1 for f in self._tfname
+                             for _ in tf.python_io.tf_record_iterator(
+                                 f, options=self._options))
             return self._size
         
\ No newline at end of file
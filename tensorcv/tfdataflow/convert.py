@@ -3,6 +3,7 @@
 # File: convert.py
 # Author: Qian Ge <geqian1001@gmail.com>
 
+import numpy as np
 import tensorflow as tf
 
 from ..utils.utils import assert_type 
@@ -25,6 +26,34 @@ def float_feature(value):
     return tf.train.Feature(float_list=tf.train.FloatList(value=value))
 
 
+def float_bytes_feature(value, dtype=np.float32):
+    """ Store float array as raw bytes, which is much faster than 
+    float_feature for large arrays. Decode by decode_float_bytes. 
+    """
+    return bytes_feature(np.asarray(value, dtype=dtype).tobytes())
+
+
+def decode_float_bytes(feature, raw_type):
+    """ Decode function of DataFromTfrecord for float_bytes_feature.
+    The record type of feature is tf.string, and raw_type is the
+    dtype used for writing (tf.float32 or tf.float16).
+    Returns a flat tf.float32 tensor.
+    """
+    return tf.cast(tf.decode_raw(feature, raw_type), tf.float32)
+
+
+def get_tfrecord_options(compression=None):
+    """ tf.python_io.TFRecordOptions for compression None, 'GZIP' 
+    or 'ZLIB'. Files have to be read with the same compression.
+    """
+    if compression is None:
+        return None
+    compression_type = {
+        'GZIP': tf.python_io.TFRecordCompressionType.GZIP,
+        'ZLIB': tf.python_io.TFRecordCompressionType.ZLIB}
+    return tf.python_io.TFRecordOptions(compression_type[compression.upper()])
+
+
 def dataflow2tfrecord(dataflow, tfname, record_names, c_fncs):
     assert_type(dataflow, DataFlow)
     dataflow.setup(epoch_val=0, batch_size=1)
@@ -3,17 +3,50 @@
 # File: write.py
 # Author: Qian Ge <geqian1001@gmail.com>
 
+import threading
+import queue
+import time
+
+import numpy as np
 import tensorflow as tf
 
 from ..dataflow.base import DataFlow
 from ..models.base import BaseModel
 from ..utils.utils import assert_type
-from .convert import float_feature
+from .convert import float_feature, float_bytes_feature, get_tfrecord_options
+
+
+def get_shard_names(tfname, num_shards):
+    """ Names of sharded tfrecord files.
+
+    Args:
+        tfname (str): name of tfrecord file
+        num_shards (int): number of shards
+
+    Returns:
+        list of str: [tfname] if num_shards is 1, otherwise
+        tfname-00000-of-0000N, ...
+    """
+    if num_shards == 1:
+        return [tfname]
+    return ['{}-{:05d}-of-{:05d}'.format(tfname, shard_id, num_shards)
+            for shard_id in range(0, num_shards)]
 
 
 class Bottleneck2TFrecord(object):
     def __init__(self, nets, record_feat_names,
-                 feat_preprocess=tf.identity):
+                 feat_preprocess=tf.identity,
+                 feat_dtype=None):
+        """
+        Args:
+            feat_dtype: None, np.float32 or np.float16. If None, features
+                are saved as FloatList, which is read by DataFromTfrecord
+                with record_types tf.float32 and feature_len_list.
+                Otherwise features are saved as raw bytes of feat_dtype,
+                which is much faster for large features. Read them by
+                record_types tf.string, raw_types of the same type and
+                decode_fncs convert.decode_float_bytes.
+        """
         if not isinstance(nets, list):
             nets = [nets]
         for net in nets:
@@ -22,6 +55,9 @@ class Bottleneck2TFrecord(object):
             record_feat_names = [record_feat_names]
         assert len(nets) == len(record_feat_names)
         self._w_f_names = record_feat_names
+        assert feat_dtype in [None, np.float32, np.float16],\
+        'feat_dtype has to be None, np.float32 or np.float16!'
+        self._feat_dtype = feat_dtype
 
         self._feat_ops = []
         self._feed_plh_keys = []
@@ -34,7 +70,30 @@ class Bottleneck2TFrecord(object):
             self._feat_ops.append(feat_preprocess(net.layer['conv_out']))
 
     def write(self, tfname, dataflow,
-              record_dataflow_keys=[], record_dataflow_names=[], c_fncs=[]):
+              record_dataflow_keys=[], record_dataflow_names=[], c_fncs=[],
+              num_shards=1, compression=None,
+              max_queue_batch=10, print_periodic=10):
+        """ Write bottleneck features of dataflow to tfrecord files.
+
+        Features of all nets are computed by one session run per batch,
+        while examples are serialized and written by a background thread.
+
+        Args:
+            num_shards (int): number of output files. Examples are 
+                distributed to shards in turn.
+            compression (str): None, 'GZIP' or 'ZLIB'. Read the files by
+                DataFromTfrecord with the same compression.
+            max_queue_batch (int): max number of computed batches waiting
+                for writing
+            print_periodic (int): print progress every print_periodic 
+                batches
+
+        Writing stops at the first error, and files of a failed run
+        are closed and removed.
+
+        Returns:
+            list of str: names of written tfrecord files
+        """
         assert_type(dataflow, DataFlow)
         dataflow.setup(epoch_val=0, batch_size=1)
 
@@ -46,51 +105,115 @@ class Bottleneck2TFrecord(object):
             record_dataflow_keys = [record_dataflow_keys]
         assert len(c_fncs) == len(record_dataflow_names)
         assert len(record_dataflow_keys) == len(record_dataflow_names)
+        assert num_shards > 0
+
+        options = get_tfrecord_options(compression)
 
-        tfrecords_filename = tfname
-        writer = tf.python_io.TFRecordWriter(tfrecords_filename)
+        tfrecords_filenames = get_shard_names(tfname, num_shards)
+        writers = [tf.python_io.TFRecordWriter(filename, options=options)
+                   for filename in tfrecords_filenames]
+
+        batch_queue = queue.Queue(maxsize=max_queue_batch)
+        self._write_error = None
+        write_thread = threading.Thread(
+            target=self._write_loop,
+            args=(batch_queue, writers, record_dataflow_names, 
+                  c_fncs, record_dataflow_keys))
+        write_thread.daemon = True
+        write_thread.start()
 
         with tf.Session() as sess:
             sess.run(tf.local_variables_initializer())
             sess.run(tf.global_variables_initializer())
             dataflow.before_read_setup()
             cnt = 0
-            while dataflow.epochs_completed < 1:
-                print('Writing data {}...'.format(cnt))
-                batch_data = dataflow.next_batch_dict()
-
-                feats = []
-                for feat_op, feed_plh_key, net_input_dict in zip(self._feat_ops, self._feed_plh_keys, self._net_input_dicts):
-                    feed_dict = {net_input_dict[key]: batch_data[key]
-                                 for key in feed_plh_key}
-                    feats.append(sess.run(feat_op, feed_dict=feed_dict))
-
-                # feature = {}
-                # for record_name, convert_fnc, key in zip(record_dataflow_names, c_fncs, record_dataflow_keys):
-                #     feature[record_name] = convert_fnc(batch_data[key][0])
-
-
-                # for record_name, feat in zip(self._w_f_names, feats):
-                #     feature[record_name] = float_feature(feat.reshape(-1).tolist())
-
-                # feature_list = []
-                batch_size = len(feats[0])
-                for idx in range(0, batch_size):
-                    feature = {}
-                    for record_name, convert_fnc, key in zip(record_dataflow_names, c_fncs, record_dataflow_keys):
-                        feature[record_name] = convert_fnc(
-                            batch_data[key][idx])
-
-                    for record_name, feat in zip(self._w_f_names, feats):
-                        feature[record_name] =\
-                            float_feature(feat[idx].reshape(-1).tolist())
-
-                    example = tf.train.Example(
-                        features=tf.train.Features(feature=feature))
-                    writer.write(example.SerializeToString())
-
-                cnt += 1
-            dataflow.after_reading()
-
-        writer.flush()
-        writer.close()
+            sample_cnt = 0
+            start_time = time.time()
+            success = False
+            try:
+                while dataflow.epochs_completed < 1:
+                    # stop computing features if writing fails
+                    if self._write_error is not None:
+                        break
+                    batch_data = dataflow.next_batch_dict()
+
+                    feed_dict = {}
+                    for feed_plh_key, net_input_dict in\
+                        zip(self._feed_plh_keys, self._net_input_dicts):
+                        feed_dict.update({net_input_dict[key]: batch_data[key]
+                                          for key in feed_plh_key})
+                    feats = sess.run(self._feat_ops, feed_dict=feed_dict)
+
+                    batch_queue.put((batch_data, feats))
+
+                    cnt += 1
+                    sample_cnt += len(feats[0])
+                    if cnt % print_periodic == 0:
+                        print('[Bottleneck2TFrecord] {} samples '
+                              '({:.1f} samples/sec)'.format(
+                               sample_cnt,
+                               sample_cnt / (time.time() - start_time)))
+                success = True
+            finally:
+                batch_queue.put(None)
+                write_thread.join()
+                try:
+                    dataflow.after_reading()
+                finally:
+                    for writer in writers:
+                        writer.flush()
+                        writer.close()
+                    if not success or self._write_error is not None:
+                        # do not leave truncated files
+                        for filename in tfrecords_filenames:
+                            if tf.gfile.Exists(filename):
+                                tf.gfile.Remove(filename)
+
+        if self._write_error is not None:
+            raise self._write_error
+        print('[Bottleneck2TFrecord] {} samples are written to {}.'.\
+            format(sample_cnt, tfrecords_filenames))
+        return tfrecords_filenames
+
+    def _write_loop(self, batch_queue, writers, 
+                    record_dataflow_names, c_fncs, record_dataflow_keys):
+        example_id = 0
+        while True:
+            item = batch_queue.get()
+            if item is None:
+                break
+            # keep consuming after error, so the main loop is not blocked
+            if self._write_error is not None:
+                continue
+            try:
+                example_id = self._write_batch(
+                    item, writers, example_id, record_dataflow_names, 
+                    c_fncs, record_dataflow_keys)
+            except Exception as e:
+                self._write_error = e
+
+    def _write_batch(self, item, writers, example_id, 
+                     record_dataflow_names, c_fncs, record_dataflow_keys):
+        num_shards = len(writers)
+        batch_data, feats = item
+        batch_size = len(feats[0])
+        for idx in range(0, batch_size):
+            feature = {}
+            for record_name, convert_fnc, key in\
+                zip(record_dataflow_names, c_fncs, record_dataflow_keys):
+                feature[record_name] = convert_fnc(batch_data[key][idx])
+
+            for record_name, feat in zip(self._w_f_names, feats):
+                if self._feat_dtype is None:
+                    feature[record_name] =\
+                        float_feature(feat[idx].reshape(-1).tolist())
+                else:
+                    feature[record_name] =\
+                        float_bytes_feature(feat[idx], dtype=self._feat_dtype)
+
+            example = tf.train.Example(
+                features=tf.train.Features(feature=feature))
+            writers[example_id % num_shards].write(
+                example.SerializeToString())
+            example_id += 1
+        return example_id
@@ -0,0 +1,96 @@
+# File: accumulate.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import tensorflow as tf
+
+from .simple import SimpleFeedTrainer
+
+__all__ = ['AccumGradTrainer']
+
+class AccumGradTrainer(SimpleFeedTrainer):
+    """ Trainer accumulating gradients over several micro-batches.
+
+    Gradients of num_accum batches are summed into non-trainable
+    accumulators, and the averaged gradients are applied once
+    at the last batch, so the effective batch size is
+    batch_size * num_accum while only one batch is in memory.
+
+    One training step is one optimizer step: callbacks, summaries and
+    global step only see the last batch of every num_accum batches.
+    The other batches are read from the input callback and run
+    without going through callback hooks.
+    """
+    def __init__(self, config, num_accum=2):
+        """
+        Args:
+            num_accum (int): number of batches accumulated for
+                one optimizer step
+        """
+        assert num_accum > 0
+        self._num_accum = num_accum
+        super(AccumGradTrainer, self).__init__(config)
+        self._batch_per_step = num_accum
+
+    def _setup(self):
+        assert self.config.steps_per_run == 1, \
+        "[AccumGradTrainer] steps_per_run is not supported!"
+        cbs = self.get_train_input()
+        self.config.callbacks.insert(0, cbs)
+
+        grads = [(grad, var) for grad, var in self.model.get_grads()
+                 if grad is not None]
+        opt = self.model.get_optimizer()
+
+        with tf.variable_scope('accum_grads'):
+            # local variables are not saved in checkpoints
+            accums = [tf.Variable(tf.zeros(var.get_shape(),
+                                           dtype=var.dtype.base_dtype),
+                                  trainable=False,
+                                  collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                                  name=var.op.name.replace('/', '_'))
+                      for _, var in grads]
+            accum_ops = []
+            for accum, (grad, _) in zip(accums, grads):
+                if isinstance(grad, tf.IndexedSlices):
+                    accum_ops.append(
+                        tf.scatter_add(accum, grad.indices, grad.values))
+                else:
+                    accum_ops.append(tf.assign_add(accum, grad))
+            self._accum_op = tf.group(*accum_ops, name='accumulate')
+
+        with tf.control_dependencies([self._accum_op]):
+            # read_value() creates the read inside control_dependencies,
+            # so the gradient of this step is included
+            apply_op = opt.apply_gradients(
+                [(accum.read_value() / self._num_accum, var)
+                 for accum, (_, var) in zip(accums, grads)])
+        with tf.control_dependencies([apply_op]):
+            self.train_op = tf.group(
+                *[tf.assign(accum, tf.zeros_like(accum)) for accum in accums],
+                name='train')
+
+    def _run_step(self):
+        with self.step_timer.timeit('get_feed'):
+            model_feed = self.model.get_graph_feed()
+        with self.step_timer.timeit('accum_run'):
+            for _ in range(0, self._num_accum - 1):
+                self._run_accum_step(model_feed)
+        self._run_hooked_sess(self.hooked_sess, self.train_op,
+                              feed_dict=model_feed)
+
+    def _run_accum_step(self, model_feed):
+        """ accumulate gradients of one batch without callback hooks """
+        feed = dict(model_feed) if model_feed else {}
+        fetches = [self._accum_op]
+        run_args = self._train_input.before_run(None)
+        if run_args is not None:
+            if run_args.feed_dict:
+                feed.update(run_args.feed_dict)
+            if run_args.fetches is not None:
+                fetches.append(run_args.fetches)
+        results = self.sess.run(fetches, feed_dict=feed)
+        # data_wait is added by trainer at the end of step
+        val = tf.train.SessionRunValues(
+            results=results[1] if len(results) > 1 else None,
+            options=None, run_metadata=None)
+        self._train_input.after_run(None, val)
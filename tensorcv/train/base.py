@@ -1,13 +1,20 @@
 from abc import abstractmethod
 import weakref
 import os
+import time
 
 import tensorflow as tf
 
 from .config import TrainConfig
 from ..callbacks.base import Callback
 from ..callbacks.group import Callbacks
+from ..callbacks.inputs import FeedInput, QueueInput, TensorInput
 from ..utils.sesscreate import ReuseSessionCreator
+from ..utils.session import CallableHookedSession
+from ..utils.timer import StepTimer
+from ..utils.resource import apply_resource_profile
+from ..utils.checkpoint import restore_checkpoint, load_train_state,\
+    get_frozen_variables
 from ..callbacks.monitors import TrainingMonitor, Monitors
 
 
@@ -30,6 +37,12 @@ class Trainer(object):
         self._global_step = 0
         self._callbacks = []
         self.monitors = []
+        self._train_input = None
+        # number of batches consumed by one training step
+        self._batch_per_step = 1
+        # number of training steps run by one session.run
+        self._steps_per_run = config.steps_per_run
+        self.step_timer = StepTimer(window_size=config.profile_window)
 
         self.default_dirs = config.default_dirs
 
@@ -41,6 +54,10 @@ class Trainer(object):
     def get_global_step(self):
         return self._global_step
 
+    @property
+    def steps_per_run(self):
+        return self._steps_per_run
+
     def register_callback(self, cb):
         assert_type(cb, Callback)
         assert not isinstance(self._callbacks, Callbacks), \
@@ -55,42 +72,143 @@ class Trainer(object):
         self.register_callback(monitor)
 
 
+    def get_train_input(self):
+        """ input callback for training data based on config.input_mode """
+        placeholders = self.model.get_train_placeholder()
+        if self.config.input_mode == 'queue':
+            self._train_input = QueueInput(self.dataflow, placeholders,
+                                   capacity=self.config.queue_capacity)
+        elif self.config.input_mode == 'tensor':
+            self._train_input = TensorInput(self.dataflow, placeholders)
+        else:
+            self._train_input = FeedInput(self.dataflow, placeholders)
+        return self._train_input
+
+    def get_dataflow_state(self):
+        """ state of training dataflow for resuming training """
+        if self._train_input is None:
+            return self.dataflow.state_dict()
+        return self._train_input.dataflow_state()
+
     def _create_session(self):
-        hooks = self._callbacks.get_hooks()
+        hooks = self._callbacks.get_hooks(timer=self.step_timer)
         self.sess = self.config.session_creator.create_session()
         
-        self.hooked_sess = tf.train.MonitoredSession(
-            session_creator=ReuseSessionCreator(self.sess), hooks=hooks)
+        self.hooked_sess = self._create_hooked_sess(hooks)
 
         if self._is_load:
             load_model_path = os.path.join(self.config.model_dir, 
                                         self.config.model_name)
-            saver = tf.train.Saver()
-            saver.restore(self.sess, load_model_path)
+            restore_checkpoint(self.sess, load_model_path)
+            self._load_train_state(load_model_path)
+
+    def _create_hooked_sess(self, hooks):
+        """ hooked session of self.sess for running training steps """
+        if self.config.fast_step:
+            return CallableHookedSession(self.sess, hooks=hooks)
+        return tf.train.MonitoredSession(
+            session_creator=ReuseSessionCreator(self.sess), hooks=hooks)
+
+    def _load_train_state(self, load_model_path):
+        """ resume global step and dataflow saved by ModelSaver """
+        state = load_train_state(load_model_path)
+        if state is None:
+            return
+        self._global_step = state['global_step']
+        self.dataflow.load_state_dict(state['dataflow'])
+        print('Resume from step {}, epoch {}.'.format(
+            self._global_step, self.epochs_completed))
 
     def main_loop(self):
         with self.sess.as_default():
             self._callbacks.before_train()
+            self._last_report_time = time.time()
+            self._last_report_step = self._global_step
             while self.epochs_completed <= self.config.max_epoch:
-                self._global_step += 1
-                print('Epoch: {}. Step: {}'.\
-                    format(self.epochs_completed, self._global_step))
+                self._global_step += self._steps_per_run
+                self.step_timer.start_step()
                 # self._callbacks.before_epoch()
                 # TODO to be modified
                 self.model.set_is_training(True)
                 self._run_step() 
                 # self._callbacks.after_epoch()
-                self._callbacks.trigger_step()
+                with self.step_timer.timeit('trigger_step'):
+                    self._callbacks.trigger_step()
+                self._end_step_timer()
+                self._report_step()
             self._callbacks.after_train()
 
+    def _run_hooked_sess(self, hooked_sess, fetches, feed_dict=None):
+        """ run hooked_sess and record time of session.run """
+        hook_time = self.step_timer.get_step_time('callback/')
+        start_time = time.time()
+        try:
+            re = hooked_sess.run(fetches, feed_dict=feed_dict)
+        except tf.errors.OutOfRangeError:
+            # queue of QueueInput is closed when reading data fails
+            if isinstance(self._train_input, QueueInput):
+                self._train_input.check_error()
+            raise
+        run_time = time.time() - start_time
+        hook_time = self.step_timer.get_step_time('callback/') - hook_time
+        self.step_timer.add('session_run', run_time - hook_time)
+        return re
+
+    def _end_step_timer(self):
+        # input of all the runs of this step (e.g. n_critic of GAN)
+        try:
+            stats = self._train_input.pop_input_stats()
+        except AttributeError:
+            stats = {}
+        for name, val in stats.items():
+            self.step_timer.add(name, val)
+        self.step_timer.end_step()
+
+    def _report_step(self):
+        """ Print a summary line and report timing statistics to 
+        monitors every config.report_secs seconds.
+        """
+        cur_time = time.time()
+        elapsed_time = cur_time - self._last_report_time
+        if elapsed_time < self.config.report_secs:
+            return
+        im_per_sec = (self._global_step - self._last_report_step)\
+            * self.config.batch_size * self._batch_per_step / elapsed_time
+        self._last_report_time = cur_time
+        self._last_report_step = self._global_step
+
+        stats = self.step_timer.get_stats()
+        if 'input_queue_size' in stats:
+            input_str = 'input_queue_size: {:.0f}'.format(
+                stats['input_queue_size'][0])
+        else:
+            input_str = 'data_wait: {:.4f}s'.format(
+                stats.get('data_wait', (0, 0, 0))[0])
+        print('Epoch: {}. Step: {}. {:.1f} images/sec. '
+              'step: {:.4f}s (p95 {:.4f}s), {}, '
+              'session_run: {:.4f}s'.format(
+               self.epochs_completed, self._global_step, im_per_sec,
+               stats['step'][0], stats['step'][1], input_str,
+               stats.get('session_run', (0, 0, 0))[0]))
+
+        s = tf.Summary()
+        s.value.add(tag='profile/images_per_sec', simple_value=im_per_sec)
+        for name, stat in stats.items():
+            for stat_name, val in zip(['p50', 'p95', 'max'], stat):
+                s.value.add(tag='profile/{}/{}'.format(name, stat_name),
+                            simple_value=val)
+        self.monitors.process_summary(s)
+
     def train(self):
         self.setup()
         self.main_loop()
 
     @abstractmethod
     def _run_step(self):
-        model_feed = self.model.get_graph_feed()
-        self.hooked_sess.run(self.train_op, feed_dict=model_feed)
+        with self.step_timer.timeit('get_feed'):
+            model_feed = self.model.get_graph_feed()
+        self._run_hooked_sess(self.hooked_sess, self.train_op, 
+                              feed_dict=model_feed)
 
     def setup(self):
         # setup graph from model
@@ -104,6 +222,9 @@ class Trainer(object):
         self._callbacks = Callbacks(self._callbacks)
         self._callbacks.setup_graph(weakref.proxy(self))
         self.monitors = Monitors(self.monitors)
+        # limit BLAS threads of dataflow before reading starts
+        if self.config.use_resource_profile:
+            apply_resource_profile()
         # create session
         self._create_session()
 
@@ -115,6 +236,9 @@ class Trainer(object):
         self.model.create_graph()
         self._setup()
         self.model.setup_summary()
+        # variables of model which are not updated by training,
+        # found after train ops are created
+        self.frozen_variables = get_frozen_variables()
         
     def _setup(self):
         pass
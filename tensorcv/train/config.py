@@ -1,12 +1,14 @@
 import scipy.misc
 import os
 import numpy as np
+import tensorflow as tf
 
 from ..dataflow.base import DataFlow
 from ..models.base import ModelDes, GANBaseModel
 from ..utils.default import get_default_session_config
 from ..utils.sesscreate import NewSessionCreator
-from ..callbacks.monitors import TFSummaryWriter
+from ..utils.xla import setup_xla
+from ..callbacks.monitors import TrainingMonitor
 from ..callbacks.summary import TrainSummary
 from ..utils.common import check_dir
 
@@ -26,13 +28,56 @@ class TrainConfig(object):
                  summary_periodic=None,
                  is_load=False,
                  model_name=None,
+                 input_mode='feed',
+                 queue_capacity=50,
+                 report_secs=10,
+                 profile_window=100,
+                 xla=None,
+                 fast_step=False,
+                 steps_per_run=1,
                  default_dirs=None):
+        """
+        Args:
+            session_creator (tf.train.SessionCreator): Default to be
+                NewSessionCreator with default session config. BLAS
+                threads of the resource profile (utils.resource) are
+                only applied with the default session creator.
+            input_mode (str): how training data get into the graph.
+                'feed': feed batches through placeholders.
+                'queue': enqueue batches by a background thread and 
+                build model on the dequeued tensors.
+                'tensor': build model on the batch tensors of dataflow
+                (e.g. DataFromTfrecord).
+            queue_capacity (int): capacity of queue for 'queue' mode
+            report_secs (float): print training speed and report step 
+                timing to monitors every report_secs seconds
+            profile_window (int): number of recent steps used for 
+                timing statistics
+            xla (str): XLA JIT compilation. None for no compilation,
+                'global' for auto-clustering the whole graph (requires
+                session_creator with attribute config) and 'scoped' for 
+                compiling ops created by model._create_model(). 
+                Ops not supported by XLA are not compiled. Run without
+                compilation if XLA is not available.
+            fast_step (bool): run training steps by callables of 
+                Session.make_callable() instead of MonitoredSession.
+                Steps at which callbacks request extra fetches or run
+                options fall back to Session.run(). Useful for small
+                models limited by Python overhead.
+            steps_per_run (int): number of training steps run by 
+                tf.while_loop in one session.run. Only for input_mode
+                'queue' and 'tensor'. Global step advances by
+                steps_per_run for each session.run. Only loss is
+                aggregated over the steps (summary 'loss_per_run'). 
+                Other summaries and the fetches of callbacks and hooks
+                describe only the last of the steps_per_run steps.
+        """
         self.default_dirs = default_dirs
 
-        assert_type(monitors, TFSummaryWriter), \
-        "monitors has to be TFSummaryWriter at this point!"
         if not isinstance(monitors, list):
             monitors = [monitors]
+        for monitor in monitors:
+            assert_type(monitor, TrainingMonitor)
         self.monitors = monitors
 
         assert dataflow is not None, "dataflow cannot be None!"
@@ -49,6 +94,18 @@ class TrainConfig(object):
         self.batch_size = batch_size
         self.max_epoch = max_epoch 
 
+        assert input_mode in ['feed', 'queue', 'tensor'],\
+        "input_mode has to be 'feed', 'queue' or 'tensor'!"
+        self.input_mode = input_mode
+        self.queue_capacity = queue_capacity
+        self.report_secs = report_secs
+        self.profile_window = profile_window
+        self.fast_step = fast_step
+        assert steps_per_run > 0
+        assert steps_per_run == 1 or input_mode in ['queue', 'tensor'], \
+        "steps_per_run > 1 requires input_mode 'queue' or 'tensor'!"
+        self.steps_per_run = steps_per_run
+
         self.is_load = is_load
         if is_load:
             assert not model_name is None,\
@@ -72,11 +129,15 @@ class TrainConfig(object):
                 TrainSummary(key=model.default_collection, 
                             periodic=summary_periodic))
 
+        # resource profile is used by default session config
+        self.use_resource_profile = session_creator is None
         if session_creator is None:
             self.session_creator = \
                NewSessionCreator(config=get_default_session_config())
         else:
-            raise ValueError('custormer session creator is not allowed at this point!')
+            assert_type(session_creator, tf.train.SessionCreator)
+            self.session_creator = session_creator
+        setup_xla(xla, self.session_creator, model)
   
     @property
     def callbacks(self):
@@ -93,9 +154,29 @@ class GANTrainConfig(TrainConfig):
                  batch_size=1, max_epoch=100,
                  summary_d_periodic=None, 
                  summary_g_periodic=None,
+                 input_mode='feed',
+                 queue_capacity=50,
+                 report_secs=10,
+                 profile_window=100,
+                 n_critic=1,
+                 n_gen=2,
+                 fused_step=False,
+                 xla=None,
+                 fast_step=False,
                  default_dirs=None):
-
+        """
+        Args:
+            n_critic (int): number of discriminator updates per step
+            n_gen (int): number of generator updates per step
+            fused_step (bool): run one discriminator update and one 
+                generator update in a single session.run. Gradients
+                of both are computed before any of them is updated.
+        """
         assert_type(model, GANBaseModel)
+        assert n_critic > 0 and n_gen > 0
+        self.n_critic = n_critic
+        self.n_gen = n_gen
+        self.fused_step = fused_step
 
         if not isinstance(discriminator_callbacks, list):
             discriminator_callbacks = [discriminator_callbacks]
@@ -121,7 +202,13 @@ class GANTrainConfig(TrainConfig):
                     callbacks=callbacks,
                     session_creator=session_creator,
                     monitors=monitors,
-                    batch_size=batch_size, max_epoch=ßmax_epoch,
+                    batch_size=batch_size, max_epoch=max_epoch,
+                    input_mode=input_mode,
+                    queue_capacity=queue_capacity,
+                    report_secs=report_secs,
+                    profile_window=profile_window,
+                    xla=xla,
+                    fast_step=fast_step,
                     default_dirs=default_dirs)
     @property
     def dis_callbacks(self):
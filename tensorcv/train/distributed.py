@@ -0,0 +1,180 @@
+# File: distributed.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import multiprocessing
+
+import tensorflow as tf
+
+from .simple import SimpleFeedTrainer
+from ..utils.checkpoint import restore_checkpoint, load_train_state
+from ..utils.sesscreate import get_session_config
+
+__all__ = ['DistributedTrainer', 'get_local_cluster', 'run_local_cluster']
+
+def get_local_cluster(num_workers=2, num_ps=1, start_port=2222):
+    """ Cluster of num_ps parameter servers and num_workers workers
+    on localhost with consecutive ports starting from start_port.
+
+    Returns:
+        dict: cluster definition for tf.train.ClusterSpec
+    """
+    hosts = ['localhost:{}'.format(start_port + idx)
+             for idx in range(0, num_ps + num_workers)]
+    return {'ps': hosts[:num_ps], 'worker': hosts[num_ps:]}
+
+def run_local_cluster(train_fnc, num_workers=2, num_ps=1, start_port=2222):
+    """ Run a distributed training as several processes on localhost.
+
+    Args:
+        train_fnc: function called as train_fnc(cluster, job_name, task_index)
+            in each process. It has to be picklable (defined at the top
+            level of a module) and build the config and
+            DistributedTrainer inside itself.
+        num_workers (int): number of worker processes
+        num_ps (int): number of parameter server processes
+
+    Returns:
+        list: exit codes of workers
+    """
+    cluster = get_local_cluster(num_workers, num_ps, start_port)
+    # fork is not safe once tensorflow runtime has been started
+    ctx = multiprocessing.get_context('spawn')
+    ps_procs = [ctx.Process(target=train_fnc, args=(cluster, 'ps', idx))
+                for idx in range(0, num_ps)]
+    worker_procs = [ctx.Process(target=train_fnc,
+                                args=(cluster, 'worker', idx))
+                    for idx in range(0, num_workers)]
+    for proc in ps_procs:
+        proc.daemon = True
+        proc.start()
+    for proc in worker_procs:
+        proc.start()
+
+    for proc in worker_procs:
+        proc.join()
+    # parameter servers never stop by themselves
+    for proc in ps_procs:
+        proc.terminate()
+        proc.join()
+    return [proc.exitcode for proc in worker_procs]
+
+class DistributedTrainer(SimpleFeedTrainer):
+    """ Asynchronous data-parallel trainer over a tf.train.ClusterSpec
+    with parameter servers (between-graph replication).
+
+    One DistributedTrainer is created in each process of the cluster.
+    Variables are placed on 'ps' jobs by tf.train.replica_device_setter
+    and each 'worker' builds its own replica of the model and applies
+    its gradients independently. Worker 0 is the chief, which
+    initializes or restores variables and is the only one that runs
+    callbacks with chief_only=True (e.g. ModelSaver, TrainSummary,
+    inference and TFSummaryWriter). By default the dataflow of each
+    worker is sharded by dataflow.shard(num_workers, task_index).
+
+    See run_local_cluster() for running a cluster on localhost.
+    """
+    def __init__(self, config, cluster, job_name, task_index=0,
+                 shard_data=True):
+        """
+        Args:
+            cluster (dict or tf.train.ClusterSpec): cluster with 'ps' and
+                'worker' jobs
+            job_name (str): 'ps' or 'worker'
+            task_index (int): index of task in job_name
+            shard_data (bool): whether shard dataflow among workers
+        """
+        assert job_name in ['ps', 'worker']
+        self._cluster = tf.train.ClusterSpec(cluster)
+        self._job_name = job_name
+        self._task_index = task_index
+        self.is_chief = job_name == 'worker' and task_index == 0
+        self._worker_device = '/job:{}/task:{}'.format(job_name, task_index)
+
+        self._sess_config = tf.ConfigProto()
+        self._sess_config.CopyFrom(get_session_config(config.session_creator))
+        if job_name == 'worker':
+            # do not depend on other workers
+            self._sess_config.device_filters.extend(
+                ['/job:ps', self._worker_device])
+        self.server = tf.train.Server(self._cluster,
+                                      job_name=job_name,
+                                      task_index=task_index,
+                                      config=self._sess_config)
+        if job_name == 'ps':
+            self.config = config
+            return
+
+        if shard_data:
+            config.dataflow.shard(self._cluster.num_tasks('worker'),
+                                  task_index)
+        super(DistributedTrainer, self).__init__(config)
+
+    def register_callback(self, cb):
+        if cb.chief_only and not self.is_chief:
+            return
+        super(DistributedTrainer, self).register_callback(cb)
+
+    def register_monitor(self, monitor):
+        if monitor.chief_only and not self.is_chief:
+            return
+        super(DistributedTrainer, self).register_monitor(monitor)
+
+    def train(self):
+        if self._job_name == 'ps':
+            self.server.join()
+        else:
+            super(DistributedTrainer, self).train()
+
+    def setup(self):
+        with tf.device(tf.train.replica_device_setter(
+                worker_device=self._worker_device, cluster=self._cluster)):
+            super(DistributedTrainer, self).setup()
+
+    def _create_session(self):
+        hooks = self._callbacks.get_hooks(timer=self.step_timer)
+        session_manager = tf.train.SessionManager(
+            local_init_op=tf.local_variables_initializer(),
+            ready_op=tf.report_uninitialized_variables())
+
+        if self.is_chief:
+            init_fn = None
+            if self._is_load:
+                load_model_path = os.path.join(self.config.model_dir,
+                                               self.config.model_name)
+                init_fn = lambda sess: restore_checkpoint(
+                    sess, load_model_path)
+                self._load_train_state(load_model_path)
+            self.sess = session_manager.prepare_session(
+                self.server.target,
+                init_op=tf.global_variables_initializer(),
+                init_fn=init_fn,
+                config=self._sess_config)
+        else:
+            if self._is_load:
+                self._load_train_state(os.path.join(self.config.model_dir,
+                                                    self.config.model_name))
+            # wait until variables are initialized by chief
+            self.sess = session_manager.wait_for_session(
+                self.server.target, config=self._sess_config)
+
+        self.hooked_sess = self._create_hooked_sess(hooks)
+
+    def _load_train_state(self, load_model_path):
+        """ Every worker resumes global step and epoch, so triggers 
+        and end of training agree with the chief. Dataflow state saved
+        by the chief belongs to its own data shard, so other workers 
+        read their shards from the beginning.
+        """
+        if self.is_chief:
+            super(DistributedTrainer, self)._load_train_state(
+                load_model_path)
+            return
+        state = load_train_state(load_model_path)
+        if state is None:
+            return
+        self._global_step = state['global_step']
+        self.dataflow.reset_epochs_completed(
+            state['dataflow']['epochs_completed'])
+        print('Resume from step {}, epoch {}.'.format(
+            self._global_step, self.epochs_completed))
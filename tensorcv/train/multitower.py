@@ -0,0 +1,146 @@
+# File: multitower.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import tensorflow as tf
+from tensorflow.contrib import graph_editor
+
+from .simple import SimpleFeedTrainer
+
+__all__ = ['SyncMultiTowerTrainer']
+
+def average_grads(tower_grads):
+    """ Average gradients of all the towers.
+
+    Args:
+        tower_grads (list): list of (gradient, variable) lists,
+            one for each tower
+
+    Returns:
+        list of (gradient, variable)
+    """
+    if len(tower_grads) == 1:
+        return tower_grads[0]
+    avg_grads = []
+    with tf.name_scope('average_grads'):
+        for grad_and_vars in zip(*tower_grads):
+            var = grad_and_vars[0][1]
+            grads = [g for g, _ in grad_and_vars if g is not None]
+            if len(grads) == 0:
+                avg_grads.append((None, var))
+                continue
+            grad = tf.multiply(tf.add_n(grads), 1.0 / len(grads))
+            avg_grads.append((grad, var))
+    return avg_grads
+
+def split_batch(tensor, num_split):
+    """ Split tensor along the first dimension into num_split parts.
+    The batch size does not need to be divisible by num_split.
+    """
+    with tf.name_scope('split_batch'):
+        batch_size = tf.shape(tensor)[0]
+        sizes = [batch_size // num_split
+                 + tf.cast(tf.less(idx, batch_size % num_split), tf.int32)
+                 for idx in range(0, num_split)]
+        return tf.split(tensor, tf.stack(sizes), num=num_split)
+
+class SyncMultiTowerTrainer(SimpleFeedTrainer):
+    """ Synchronous data-parallel trainer over several CPU devices.
+
+    The model is replicated on num_towers devices, and each tower
+    takes one shard of the batch, so the input (feed, queue or tensor)
+    is the same as SimpleFeedTrainer and sharded automatically inside
+    the graph. Gradients of all towers are averaged and applied once.
+
+    The model built by create_graph() is kept on the full batch without
+    being trained directly, so tensors used by callbacks, summaries and
+    inference have the same names and meanings as in SimpleFeedTrainer.
+    """
+    def __init__(self, config, num_towers=2, devices=None):
+        """
+        Args:
+            num_towers (int): number of model replicas
+            devices (list): devices of towers. Default to be
+                ['/cpu:0', ..., '/cpu:num_towers-1']. Number of CPU
+                devices of the session will be set accordingly.
+        """
+        assert num_towers > 0
+        if devices is None:
+            devices = ['/cpu:{}'.format(idx) for idx in range(0, num_towers)]
+        assert len(devices) == num_towers,\
+        'Length of devices has to be equal to num_towers!'
+        self._num_towers = num_towers
+        self._devices = devices
+
+        num_cpu = len([d for d in devices if 'cpu' in d.lower()])
+        if num_cpu > 1:
+            try:
+                sess_config = config.session_creator.config
+            except AttributeError:
+                sess_config = None
+            if sess_config is not None:
+                sess_config.device_count['CPU'] = max(
+                    num_cpu, sess_config.device_count.get('CPU', 1))
+            else:
+                print('[SyncMultiTowerTrainer] session_creator has no '
+                      'config. Sessions it creates need {} CPU devices.'
+                      .format(num_cpu))
+        super(SyncMultiTowerTrainer, self).__init__(config)
+
+    def _setup(self):
+        assert self.config.steps_per_run == 1, \
+        "[SyncMultiTowerTrainer] steps_per_run is not supported!"
+        cbs = self.get_train_input()
+        self.config.callbacks.insert(0, cbs)
+
+        opt = self.model.get_optimizer()
+        # loss and summaries of the model on full batch
+        self.model.get_loss()
+
+        placeholders = self.model.get_train_placeholder()
+        shards = [split_batch(plh, self._num_towers) for plh in placeholders]
+
+        tower_grads = []
+        for idx, device in enumerate(self._devices):
+            tower_inputs = [shard[idx] for shard in shards]
+            tower_grads.append(
+                self._build_tower(idx, device, placeholders, tower_inputs))
+
+        with tf.name_scope('train'):
+            grads = average_grads(tower_grads)
+            [tf.summary.histogram('gradient/' + var.name, grad,
+                collections=[self.model.default_collection])
+                for grad, var in grads if grad is not None]
+        self.train_op = opt.apply_gradients(grads, name='train')
+
+    def _build_tower(self, idx, device, placeholders, tower_inputs):
+        """ Build one replica on tower_inputs and compute its gradients
+        by model.get_grads(). Attributes of model and graph collections
+        (e.g. summaries and update ops) are not changed by building towers.
+        """
+        graph = tf.get_default_graph()
+        model_state = dict(self.model.__dict__)
+        collections = {key: list(graph.get_collection(key))
+                       for key in graph.get_all_collection_keys()}
+        num_ops = len(graph.get_operations())
+
+        # loss and gradients are computed again on this tower
+        for key in ['_loss', 'grads']:
+            self.model.__dict__.pop(key, None)
+        with tf.device(device), tf.name_scope('tower{}'.format(idx)),\
+            tf.variable_scope(tf.get_variable_scope(), reuse=True):
+            self.model._create_model()
+            grads = self.model.get_grads()
+
+        # only ops of this tower take the shard of inputs
+        tower_ops = graph.get_operations()[num_ops:]
+        graph_editor.reroute_ts(tower_inputs, placeholders,
+                                can_modify=tower_ops)
+
+        self.model.__dict__.clear()
+        self.model.__dict__.update(model_state)
+        for key, values in collections.items():
+            graph.get_collection_ref(key)[:] = values
+        for key in graph.get_all_collection_keys():
+            if key not in collections:
+                del graph.get_collection_ref(key)[:]
+        return grads
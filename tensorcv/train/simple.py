@@ -1,10 +1,11 @@
 from abc import abstractmethod
+import weakref
 
 import tensorflow as tf
+from tensorflow.contrib import graph_editor
 
 from .config import TrainConfig, GANTrainConfig
 from .base import Trainer
-from ..callbacks.inputs import FeedInput
 from ..callbacks.group import Callbacks
 from ..callbacks.hooks import Callback2Hook
 from ..models.base import BaseModel, GANBaseModel
@@ -24,15 +25,104 @@ class SimpleFeedTrainer(Trainer):
         super(SimpleFeedTrainer, self).__init__(config)
 
     def _setup(self):
-        # TODO to be modified
-        cbs = FeedInput(self.dataflow, self.model.get_train_placeholder())
-
-        self.config.callbacks.append(cbs)
+        # input has to be setup before other callbacks,
+        # since the placeholders may be replaced.
+        cbs = self.get_train_input()
+        self.config.callbacks.insert(0, cbs)
 
         grads = self.model.get_grads()
         opt = self.model.get_optimizer()
         self.train_op = opt.apply_gradients(grads, name='train')
 
+        if self.config.steps_per_run > 1:
+            # batch tensors of input are required by the loop
+            with tf.name_scope(None):
+                cbs.setup_graph(weakref.proxy(self))
+            self.train_op = self._create_loop_train_op(
+                cbs, opt, [var for _, var in grads])
+
+    def _create_loop_train_op(self, train_input, opt, var_list):
+        """ Run config.steps_per_run training steps in one session.run
+        by tf.while_loop.
+
+        The model is built again inside the loop with variables reused,
+        in the same way as towers of SyncMultiTowerTrainer, and takes a 
+        new batch from train_input at each iteration. Variables are read
+        again at each iteration, so every step uses the values updated
+        by the previous one. Outside the loop, the model takes the last 
+        batch of the loop, so loss and summaries fetched with the train 
+        op are computed on the last batch. Mean of losses of all the steps
+        is added as summary 'loss_per_run'. Other summaries and fetches
+        of callbacks and hooks describe only the last step of the loop.
+
+        Returns:
+            train op running the loop
+        """
+        graph = tf.get_default_graph()
+        num_steps = self.config.steps_per_run
+        model_state = dict(self.model.__dict__)
+        # summaries and update ops created in the loop cannot be fetched
+        collections = {key: list(graph.get_collection(key))
+                       for key in graph.get_all_collection_keys()}
+
+        def read_variable(getter, *args, **kwargs):
+            return getter(*args, **kwargs).read_value()
+
+        def body(step, loss_sum, *last_batch):
+            # reads and dequeues of this step wait for the last step
+            with tf.control_dependencies([step]):
+                num_ops = len(graph.get_operations())
+                batch = train_input.get_loop_batch()
+                with tf.variable_scope(tf.get_variable_scope(), reuse=True,
+                                       custom_getter=read_variable):
+                    self.model._create_model()
+                    loss = self.model._get_loss()
+                    grads = opt.compute_gradients(loss, var_list=var_list)
+                train_op = opt.apply_gradients(grads)
+                loop_ops = graph.get_operations()[num_ops:]
+                # model placeholders enter the loop by Enter ops
+                for plh, tensor in zip(train_input.model_placeholders, batch):
+                    enter_ts = [op.outputs[0] for op in loop_ops
+                                if op.type in ['Enter', 'RefEnter']
+                                and op.inputs[0] is plh]
+                    for enter_t in enter_ts:
+                        graph_editor.reroute_ts([tensor], [enter_t],
+                                                can_modify=loop_ops)
+            with tf.control_dependencies([train_op]):
+                return [step + 1, loss_sum + tf.cast(loss, tf.float32)]\
+                    + [tf.identity(tensor) for tensor in batch]
+
+        init_batch = [tf.zeros([dim if dim is not None else 0
+                                for dim in t.get_shape().as_list()], t.dtype)
+                      for t in train_input.batch_tensors]
+        with tf.name_scope('steps_per_run'):
+            outputs = tf.while_loop(
+                lambda step, *_: step < num_steps, body,
+                [tf.constant(0), tf.constant(0.)] + init_batch,
+                shape_invariants=[tf.TensorShape([]), tf.TensorShape([])]
+                    + [t.get_shape() for t in train_input.batch_tensors],
+                parallel_iterations=1, back_prop=False)
+
+        self.model.__dict__.clear()
+        self.model.__dict__.update(model_state)
+        for key, values in collections.items():
+            graph.get_collection_ref(key)[:] = values
+        for key in graph.get_all_collection_keys():
+            if key not in collections:
+                del graph.get_collection_ref(key)[:]
+
+        # model outside the loop takes the last batch
+        last_batch = outputs[2:]
+        for tensor, batch_tensor in zip(last_batch, train_input.batch_tensors):
+            tensor.set_shape(batch_tensor.get_shape())
+        graph_editor.reroute_ts(
+            last_batch, train_input.batch_tensors,
+            can_modify=[plh.op for plh in train_input.placeholders])
+
+        tf.summary.scalar('loss_per_run', outputs[1] / num_steps,
+                          collections=[self.model.default_collection])
+        return tf.group(*outputs, name='train_loop')
+
 class GANFeedTrainer(Trainer):
     def __init__(self, config):
         assert_type(config, GANTrainConfig)
@@ -43,12 +133,13 @@ class GANFeedTrainer(Trainer):
         super(GANFeedTrainer, self).__init__(config)
 
     def _setup(self):
-        # TODO to be modified
-        # Since FeedInput only have before_run,
-        # it is safe to put this cb only in hooks.
-        cbs = FeedInput(self.dataflow, self.model.get_train_placeholder())
-        # self.config.callbacks.append(cbs)
-        self.feed_input_hook = [Callback2Hook(cbs)]
+        # Input is only used by discriminator step, but it has to be
+        # setup and triggered with all the callbacks as well.
+        assert self.config.steps_per_run == 1, \
+        "[GANFeedTrainer] steps_per_run is not supported!"
+        cbs = self.get_train_input()
+        self.config.callbacks.insert(0, cbs)
+        self.feed_input_hook = [Callback2Hook(cbs, timer=self.step_timer)]
 
         dis_grads = self.model.get_discriminator_grads()
         dis_opt = self.model.get_discriminator_optimizer()
@@ -60,29 +151,48 @@ class GANFeedTrainer(Trainer):
         self.gen_train_op = gen_opt.apply_gradients(gen_grads, 
                                         name='generator_train')
 
+        if self.config.fused_step:
+            # both gradients are computed on the same forward pass 
+            # before discriminator is updated
+            gen_grad_ops = [grad.op for grad, _ in gen_grads 
+                            if grad is not None]
+            with tf.control_dependencies(gen_grad_ops):
+                fused_dis_op = dis_opt.apply_gradients(dis_grads)
+            with tf.control_dependencies([fused_dis_op]):
+                self.fused_train_op = gen_opt.apply_gradients(
+                    gen_grads, name='fused_train')
+
     def _create_session(self):
         self._dis_callbacks = Callbacks([cb 
                             for cb in self.config.dis_callbacks])
         self._gen_callbacks = Callbacks([cb 
                             for cb in self.config.gen_callbacks])
-        dis_hooks = self._dis_callbacks.get_hooks()
-        gen_hooks = self._gen_callbacks.get_hooks()
+        dis_hooks = self._dis_callbacks.get_hooks(timer=self.step_timer)
+        gen_hooks = self._gen_callbacks.get_hooks(timer=self.step_timer)
 
         self.sess = self.config.session_creator.create_session()
-        self.dis_hooked_sess = tf.train.MonitoredSession(
-            session_creator=ReuseSessionCreator(self.sess), 
-            hooks=dis_hooks + self.feed_input_hook)
-        self.gen_hooked_sess = tf.train.MonitoredSession(
-            session_creator=ReuseSessionCreator(self.sess), 
-            hooks=gen_hooks)
+        self.dis_hooked_sess = self._create_hooked_sess(
+            dis_hooks + self.feed_input_hook)
+        self.gen_hooked_sess = self._create_hooked_sess(gen_hooks)
+        if self.config.fused_step:
+            self.fused_hooked_sess = self._create_hooked_sess(
+                dis_hooks + gen_hooks + self.feed_input_hook)
 
     def _run_step(self):
-        model_feed = self.model.get_graph_feed()
-        self.dis_hooked_sess.run(self.dis_train_op, feed_dict=model_feed)
-
-        for k in range(0,2):
+        n_fused = 0
+        if self.config.fused_step:
+            n_fused = min(self.config.n_critic, self.config.n_gen)
+        for k in range(0, n_fused):
+            self._run_train_op(self.fused_hooked_sess, self.fused_train_op)
+        for k in range(0, self.config.n_critic - n_fused):
+            self._run_train_op(self.dis_hooked_sess, self.dis_train_op)
+        for k in range(0, self.config.n_gen - n_fused):
+            self._run_train_op(self.gen_hooked_sess, self.gen_train_op)
+
+    def _run_train_op(self, hooked_sess, train_op):
+        with self.step_timer.timeit('get_feed'):
             model_feed = self.model.get_graph_feed()
-            self.gen_hooked_sess.run(self.gen_train_op, feed_dict=ßmodel_feed)
+        self._run_hooked_sess(hooked_sess, train_op, feed_dict=model_feed)
 
 
 
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: checkpoint.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import pickle
+
+import tensorflow as tf
+
+__all__ = ['restore_checkpoint', 'get_base_checkpoint', 'set_base_checkpoint',
+           'save_train_state', 'load_train_state', 'get_frozen_variables']
+
+# file recording the base of delta checkpoints in a checkpoint directory
+BASE_FILE_NAME = 'base_checkpoint'
+
+# ops writing values of their variable inputs
+WRITE_OP_TYPES = ['Assign', 'AssignAdd', 'AssignSub', 'AssignVariableOp',
+                  'AssignAddVariableOp', 'AssignSubVariableOp', 'CountUpTo']
+WRITE_OP_PREFIXES = ('Apply', 'ResourceApply', 'SparseApply',
+                     'ResourceSparseApply', 'Scatter', 'ResourceScatter')
+# ops passing variable refs to ops inside control flow
+PASS_OP_TYPES = ['Enter', 'RefEnter', 'Identity', 'RefIdentity',
+                 'Switch', 'RefSwitch', 'Merge', 'RefMerge']
+
+
+def _get_variable_op(tensor):
+    op = tensor.op
+    while op.type in PASS_OP_TYPES and op.inputs:
+        op = op.inputs[0].op
+    return op
+
+
+def get_frozen_variables(graph=None):
+    """ Global variables which are not written by any op of graph
+    except their initializers, e.g. pre-trained weights created with
+    trainable=False. Variables updated during training but not by
+    gradients (moving averages of batch_norm, optimizer slots and
+    global step) are not frozen.
+
+    Args:
+        graph (tf.Graph): Default to be the default graph.
+
+    Returns:
+        list of frozen tf.Variable
+    """
+    if graph is None:
+        graph = tf.get_default_graph()
+    with graph.as_default():
+        variables = tf.global_variables()
+    initializers = set(v.initializer for v in variables)
+
+    written_ops = set()
+    for op in graph.get_operations():
+        if op in initializers:
+            continue
+        if op.type in WRITE_OP_TYPES or op.type.startswith(WRITE_OP_PREFIXES):
+            for inp in op.inputs:
+                written_ops.add(_get_variable_op(inp))
+    return [v for v in variables if v.op not in written_ops]
+
+
+def set_base_checkpoint(checkpoint_dir, base_path):
+    """ Record base_path as the base of all the checkpoints in checkpoint_dir.
+
+    Args:
+        checkpoint_dir (str): directory of delta checkpoints
+        base_path (str): tensorflow checkpoint or .npy pre-trained file
+            containing variables which are not saved in delta checkpoints
+    """
+    with tf.gfile.GFile(os.path.join(checkpoint_dir, BASE_FILE_NAME), 'w') as f:
+        f.write(base_path)
+
+
+def get_base_checkpoint(checkpoint_path):
+    """ Base of checkpoint_path, or None if it is not a delta checkpoint """
+    base_file = os.path.join(os.path.dirname(checkpoint_path), BASE_FILE_NAME)
+    if not tf.gfile.Exists(base_file):
+        return None
+    with tf.gfile.GFile(base_file, 'r') as f:
+        return f.read().strip()
+
+
+def restore_checkpoint(sess, checkpoint_path, var_list=None):
+    """ Restore variables from checkpoint_path.
+
+    For delta checkpoints, variables not in checkpoint_path are
+    restored from the base checkpoint first. If the base is a .npy file,
+    they have to be initialized from the same file when the model
+    is built (e.g. VGG19 with is_load=True).
+
+    Args:
+        sess (tf.Session): session variables are restored to
+        checkpoint_path (str): path of checkpoint
+        var_list (list): variables to be restored. Default to be all
+            the global variables.
+    """
+    if var_list is None:
+        var_list = tf.global_variables()
+    base_path = get_base_checkpoint(checkpoint_path)
+    if base_path is None:
+        tf.train.Saver(var_list).restore(sess, checkpoint_path)
+        return
+
+    saved_names = set(name for name, _
+                      in tf.train.list_variables(checkpoint_path))
+    delta_list = [v for v in var_list if v.op.name in saved_names]
+    rest_list = [v for v in var_list if v.op.name not in saved_names]
+    if rest_list:
+        if base_path.endswith('.npy'):
+            print('[restore_checkpoint] {} variables are expected to be '
+                  'initialized from {}.'.format(len(rest_list), base_path))
+        else:
+            tf.train.Saver(rest_list).restore(sess, base_path)
+    if delta_list:
+        tf.train.Saver(delta_list).restore(sess, checkpoint_path)
+
+
+def save_train_state(checkpoint_path, state):
+    """ Save training state (e.g. global step and dataflow state)
+    next to checkpoint_path.
+
+    Args:
+        checkpoint_path (str): path of checkpoint
+        state (dict): picklable state
+    """
+    with tf.gfile.GFile(checkpoint_path + '.state', 'wb') as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_train_state(checkpoint_path):
+    """ Training state saved with checkpoint_path, or None if not exists """
+    state_path = checkpoint_path + '.state'
+    if not tf.gfile.Exists(state_path):
+        return None
+    with tf.gfile.GFile(state_path, 'rb') as f:
+        return pickle.load(f)
@@ -5,14 +5,23 @@
 
 import tensorflow as tf
 
+from .resource import load_resource_profile, get_session_config_from_plan
+
 __all__ = ['get_default_session_config']
 
 
-def get_default_session_config(memory_fraction=1):
+def get_default_session_config(memory_fraction=1, profile_path=None):
     """Default config of a TensorFlow session
 
+    CPU thread pools are set by the resource profile saved by
+    :func:`utils.resource.autotune_session_config()` if it exists.
+    BLAS threads of the profile are not applied here, but by
+    :func:`utils.resource.apply_resource_profile()` called by the trainer.
+
     Args:
         memory_fraction (float): Memory fraction of GPU for this session
+        profile_path (str): path of resource profile. Default to be
+            :func:`utils.resource.get_default_profile_path()`.
 
     Return:
         tf.ConfigProto(): Config of session.
@@ -21,4 +30,8 @@ def get_default_session_config(memory_fraction=1):
     conf.gpu_options.per_process_gpu_memory_fraction = memory_fraction
     conf.gpu_options.allow_growth = True
 
+    plan = load_resource_profile(profile_path)
+    if plan is not None:
+        get_session_config_from_plan(plan, conf)
+
     return conf
@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: resource.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+import json
+import time
+import argparse
+import importlib
+
+import tensorflow as tf
+
+__all__ = ['plan_cpu_resources', 'get_candidate_plans', 'apply_blas_threads',
+           'get_session_config_from_plan', 'save_resource_profile',
+           'load_resource_profile', 'get_default_profile_path',
+           'apply_resource_profile', 'autotune_session_config']
+
+# environment variable for the path of resource profile
+PROFILE_ENV = 'TENSORCV_SESSION_PROFILE'
+BLAS_ENVS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']
+
+
+def get_num_cores():
+    """ Number of cores available to this process """
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan_cpu_resources(num_cores=None, data_workers=1, inter_op=None,
+                       blas_threads=1):
+    """ Split cores among TF intra-op threads, TF inter-op threads
+    and BLAS threads used by dataflow, so they do not compete for the
+    same cores.
+
+    Data workers are not started or configured by the plan. Cores of
+    data_workers * blas_threads are only kept out of TF thread pools.
+
+    Args:
+        num_cores (int): number of cores. Default to be all the cores
+            available to this process.
+        data_workers (int): number of threads or processes reading data
+            (e.g. 1 for the thread of QueueInput)
+        inter_op (int): number of TF inter-op threads. Default to be
+            2 if there are more than 4 cores, otherwise 1.
+        blas_threads (int): number of BLAS threads in each data worker
+
+    Returns:
+        dict: plan with keys 'num_cores', 'intra_op', 'inter_op'
+        and 'blas_threads'
+    """
+    if num_cores is None:
+        num_cores = get_num_cores()
+    if inter_op is None:
+        inter_op = 2 if num_cores > 4 else 1
+    intra_op = max(1, num_cores - inter_op - data_workers * blas_threads)
+    return {'num_cores': num_cores,
+            'intra_op': intra_op,
+            'inter_op': inter_op,
+            'blas_threads': blas_threads}
+
+
+def get_candidate_plans(num_cores=None):
+    """ A few plans worth benchmarking on num_cores cores """
+    if num_cores is None:
+        num_cores = get_num_cores()
+    plans = []
+    for data_workers in [1, 2]:
+        for inter_op in [1, 2]:
+            plan = plan_cpu_resources(num_cores, data_workers=data_workers,
+                                      inter_op=inter_op)
+            if plan not in plans:
+                plans.append(plan)
+    # leave half of the cores to other processes (e.g. hyper-threading)
+    half_plan = plan_cpu_resources(num_cores, inter_op=1)
+    half_plan['intra_op'] = max(1, num_cores // 2)
+    if half_plan not in plans:
+        plans.append(half_plan)
+    return plans
+
+
+def apply_blas_threads(num_threads):
+    """ Limit threads of BLAS used by numpy in dataflow.
+
+    This changes environment variables and thread pools of the whole
+    process. Environment variables only take effect for libraries
+    loaded later, so threadpoolctl is used for loaded libraries if it
+    is installed.
+    """
+    for env in BLAS_ENVS:
+        os.environ[env] = str(num_threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=num_threads, user_api='blas')
+    except ImportError:
+        pass
+
+
+def get_session_config_from_plan(plan, config=None):
+    """ Set thread pools of config (tf.ConfigProto) based on plan """
+    if config is None:
+        config = tf.ConfigProto()
+    config.intra_op_parallelism_threads = plan['intra_op']
+    config.inter_op_parallelism_threads = plan['inter_op']
+    return config
+
+
+def get_default_profile_path():
+    return os.environ.get(
+        PROFILE_ENV,
+        os.path.join(os.path.expanduser('~'), '.tensorcv',
+                     'session_profile.json'))
+
+
+def save_resource_profile(plan, path=None):
+    if path is None:
+        path = get_default_profile_path()
+    profile_dir = os.path.dirname(path)
+    if profile_dir and not os.path.isdir(profile_dir):
+        os.makedirs(profile_dir)
+    with open(path, 'w') as f:
+        json.dump(plan, f, indent=2, sort_keys=True)
+
+
+def load_resource_profile(path=None):
+    """ Plan saved by save_resource_profile(), or None if not exists """
+    if path is None:
+        path = get_default_profile_path()
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def apply_resource_profile(path=None):
+    """ Limit BLAS threads of this process by the resource profile.
+    Called by the trainer before training starts.
+
+    Args:
+        path (str): path of profile. Default to be
+            get_default_profile_path().
+
+    Returns:
+        the plan applied, or None if profile does not exist
+    """
+    plan = load_resource_profile(path)
+    if plan is not None:
+        apply_blas_threads(plan['blas_threads'])
+    return plan
+
+
+def autotune_session_config(model, dataflow, candidates=None,
+                            num_steps=20, warmup_steps=5,
+                            profile_path=None, save_profile=True):
+    """ Benchmark training steps of model on dataflow with each
+    candidate plan and save the fastest one as resource profile,
+    which is loaded by utils.default.get_default_session_config().
+
+    Args:
+        model (BaseModel): model with single optimizer. Batch size
+            has to be set.
+        dataflow (DataFlow): training data
+        candidates (list): plans to be compared. Default to be
+            get_candidate_plans().
+        num_steps (int): number of timed steps for each plan
+        warmup_steps (int): number of steps before timing
+        profile_path (str): path of profile. Default to be
+            get_default_profile_path().
+
+    Attributes of model (e.g. cached optimizer and gradients) are
+    restored after benchmarking, so model can be used for training
+    in the same process.
+
+    Returns:
+        best plan and list of (plan, steps per second)
+    """
+    if candidates is None:
+        candidates = get_candidate_plans()
+
+    # tensors of the benchmark graph cached by model are dropped later
+    model_state = dict(model.__dict__)
+    try:
+        results = _benchmark_plans(model, dataflow, candidates,
+                                   num_steps, warmup_steps)
+    finally:
+        model.__dict__.clear()
+        model.__dict__.update(model_state)
+
+    best_plan = max(results, key=lambda result: result[1])[0]
+    if save_profile:
+        save_resource_profile(best_plan, profile_path)
+    return best_plan, results
+
+
+def _benchmark_plans(model, dataflow, candidates, num_steps, warmup_steps):
+    """ list of (plan, steps per second) of candidates """
+    graph = tf.Graph()
+    with graph.as_default():
+        model.ex_init_model(dataflow, None)
+        model.create_graph()
+        train_op = model.get_optimizer().apply_gradients(model.get_grads())
+        placeholders = model.get_train_placeholder()
+        init_op = tf.global_variables_initializer()
+        local_init_op = tf.local_variables_initializer()
+    graph.finalize()
+
+    model.set_is_training(True)
+    dataflow.before_read_setup()
+    results = []
+    for plan in candidates:
+        apply_blas_threads(plan['blas_threads'])
+        config = get_session_config_from_plan(plan)
+        # thread pools are not shared with other candidates
+        config.use_per_session_threads = True
+        with tf.Session(graph=graph, config=config) as sess:
+            sess.run([init_op, local_init_op])
+            for step in range(0, warmup_steps + num_steps):
+                if step == warmup_steps:
+                    start_time = time.time()
+                feed = dict(zip(placeholders, dataflow.next_batch()))
+                feed.update(model.get_graph_feed())
+                sess.run(train_op, feed_dict=feed)
+            step_per_sec = num_steps / (time.time() - start_time)
+        results.append((plan, step_per_sec))
+        print('[autotune] intra_op: {}, inter_op: {}, blas_threads: {}: '
+              '{:.2f} steps/sec'.format(plan['intra_op'], plan['inter_op'],
+                                        plan['blas_threads'], step_per_sec))
+    dataflow.after_reading()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark session configs and save the best profile.')
+    parser.add_argument('build', type=str,
+                        help='module:function returning (model, dataflow) '
+                             'with batch size set')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--output', type=str, default=None,
+                        help='path of profile')
+    args = parser.parse_args()
+
+    module_name, fnc_name = args.build.split(':')
+    build_fnc = getattr(importlib.import_module(module_name), fnc_name)
+    model, dataflow = build_fnc()
+    best_plan, _ = autotune_session_config(
+        model, dataflow, num_steps=args.steps, warmup_steps=args.warmup,
+        profile_path=args.output)
+    print('[autotune] best plan: {}'.format(best_plan))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,20 @@ import tensorflow as tf
 
 from .default import get_default_session_config
 
-__all__ = ['NewSessionCreator', 'ReuseSessionCreator']
+__all__ = ['NewSessionCreator', 'ReuseSessionCreator', 'get_session_config']
+
+
+def get_session_config(session_creator):
+    """ Config of session_creator, or the default session config
+    if session_creator does not have one (e.g. custom creators).
+    """
+    try:
+        config = session_creator.config
+    except AttributeError:
+        config = None
+    if config is None:
+        config = get_default_session_config()
+    return config
 
 
 class NewSessionCreator(tf.train.SessionCreator):
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: session.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import numpy as np
+import tensorflow as tf
+
+__all__ = ['CallableHookedSession', 'merge_run_options']
+
+
+def merge_run_options(options, new_options):
+    """ Merge RunOptions in the same way as tf.train.MonitoredSession.
+    Returns options updated by new_options.
+    """
+    if new_options is None:
+        return options
+    if options is None:
+        options = tf.RunOptions()
+    options.trace_level = max(options.trace_level, new_options.trace_level)
+    options.timeout_in_ms = max(options.timeout_in_ms,
+                                new_options.timeout_in_ms)
+    options.output_partition_graphs = options.output_partition_graphs\
+        or new_options.output_partition_graphs
+    return options
+
+
+def has_fetches(fetches):
+    """ Whether fetches contains anything other than empty lists
+    and dicts (e.g. [] requested by FeedInput only to feed data) """
+    if isinstance(fetches, (list, tuple)):
+        return any(has_fetches(f) for f in fetches)
+    if isinstance(fetches, dict):
+        return any(has_fetches(f) for f in fetches.values())
+    return fetches is not None
+
+
+def empty_results(fetches):
+    """ Results of fetches without anything to fetch """
+    if isinstance(fetches, (list, tuple)):
+        return [empty_results(f) for f in fetches]
+    if isinstance(fetches, dict):
+        return {k: empty_results(f) for k, f in fetches.items()}
+    return None
+
+
+class CallableHookedSession(object):
+    """ Lightweight replacement of tf.train.MonitoredSession for
+    training steps.
+
+    Hooks are called in the same way as MonitoredSession. When none
+    of the hooks requests extra fetches or run options, the step is run
+    through a callable precompiled by Session.make_callable() for the
+    fetches and the signature of feeds, which skips the feed validation
+    and fetch handling of Session.run(). Otherwise the step falls back
+    to Session.run() with the merged fetches of hooks.
+    """
+    def __init__(self, sess, hooks=None):
+        """
+        Args:
+            sess (tf.Session): session with variables initialized
+            hooks (list): list of tf.train.SessionRunHook
+        """
+        self._sess = sess
+        self._hooks = hooks or []
+        self._callables = {}
+        for hook in self._hooks:
+            hook.begin()
+        for hook in self._hooks:
+            hook.after_create_session(self._sess, None)
+
+    def should_stop(self):
+        return False
+
+    def close(self):
+        for hook in self._hooks:
+            hook.end(self._sess)
+
+    def _get_callable(self, fetches, feed_keys):
+        """ Callable for fetches and feed_keys, or None if fetches
+        cannot be made into a callable. """
+        try:
+            key = (fetches, feed_keys)
+            hash(key)
+        except TypeError:
+            # e.g. fetches is a list
+            return None
+        try:
+            return self._callables[key]
+        except KeyError:
+            try:
+                run_fnc = self._sess.make_callable(
+                    fetches, feed_list=list(feed_keys))
+            except (AttributeError, TypeError, tf.errors.OpError):
+                # not supported by the session (e.g. old or remote session)
+                run_fnc = None
+            self._callables[key] = run_fnc
+            return run_fnc
+
+    def _run_callable(self, run_fnc, feed_keys, feed_dict):
+        args = []
+        for key in feed_keys:
+            val = feed_dict[key]
+            try:
+                args.append(np.asarray(val, dtype=key.dtype.as_numpy_dtype))
+            except AttributeError:
+                args.append(val)
+        return run_fnc(*args)
+
+    def run(self, fetches, feed_dict=None, options=None, run_metadata=None):
+        """ Same as tf.train.MonitoredSession.run() """
+        run_context = tf.train.SessionRunContext(
+            original_args=tf.train.SessionRunArgs(fetches, feed_dict, options),
+            session=self._sess)
+
+        feed = dict(feed_dict) if feed_dict else {}
+        hook_fetches = []
+        fetch_idxs = []
+        hook_options = None
+        for hook in self._hooks:
+            args = hook.before_run(run_context)
+            fetch_idx = None
+            if args is not None:
+                if args.fetches is not None:
+                    fetch_idx = len(hook_fetches)
+                    hook_fetches.append(args.fetches)
+                if args.feed_dict:
+                    for key in args.feed_dict:
+                        if key in feed:
+                            raise RuntimeError(
+                                'Same tensor is fed by multiple hooks: {}'
+                                .format(key))
+                    feed.update(args.feed_dict)
+                hook_options = merge_run_options(hook_options, args.options)
+            fetch_idxs.append(fetch_idx)
+
+        run_fnc = None
+        if not has_fetches(hook_fetches) and hook_options is None\
+            and options is None and run_metadata is None:
+            feed_keys = tuple(feed.keys())
+            run_fnc = self._get_callable(fetches, feed_keys)
+
+        if run_fnc is not None:
+            results = self._run_callable(run_fnc, feed_keys, feed)
+            hook_results = empty_results(hook_fetches)
+        else:
+            options = merge_run_options(
+                merge_run_options(None, options), hook_options)
+            if run_metadata is None:
+                run_metadata = tf.RunMetadata()
+            results, hook_results = self._sess.run(
+                [fetches, hook_fetches], feed_dict=feed,
+                options=options, run_metadata=run_metadata)
+
+        for hook, fetch_idx in zip(self._hooks, fetch_idxs):
+            hook_val = None if fetch_idx is None else hook_results[fetch_idx]
+            hook.after_run(run_context, tf.train.SessionRunValues(
+                results=hook_val, options=options,
+                run_metadata=run_metadata))
+        return results
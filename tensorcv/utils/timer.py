@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: timer.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+__all__ = ['StepTimer']
+
+
+class StepTimer(object):
+    """ Timing breakdown of steps with rolling window statistics.
+
+    Time of each named part is accumulated within a step and pushed to
+    a window of the last window_size steps when the step ends.
+    Statistics are only computed when requested, so it is cheap
+    enough to be always on.
+    """
+    def __init__(self, window_size=100):
+        """
+        Args:
+            window_size (int): number of recent steps used for statistics
+        """
+        self._window_size = window_size
+        self._records = {}
+        self._cur_step = {}
+        self._step_start = None
+
+    def start_step(self):
+        self._cur_step = {}
+        self._step_start = time.time()
+
+    def end_step(self):
+        """ End current step and push timing of all parts to windows. """
+        if self._step_start is not None:
+            self.add('step', time.time() - self._step_start)
+            self._step_start = None
+        for name, val in self._cur_step.items():
+            try:
+                self._records[name].append(val)
+            except KeyError:
+                self._records[name] = deque([val], maxlen=self._window_size)
+
+    def add(self, name, seconds):
+        """ Add time to part name of current step. """
+        self._cur_step[name] = self._cur_step.get(name, 0) + seconds
+
+    @contextmanager
+    def timeit(self, name):
+        """ Context manager for timing part name of current step. """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start)
+
+    def get_step_time(self, prefix=''):
+        """ Total time of parts starting with prefix in current step. """
+        return sum(val for name, val in self._cur_step.items()
+                   if name.startswith(prefix))
+
+    def get_mean(self, name):
+        try:
+            return float(np.mean(self._records[name]))
+        except KeyError:
+            return 0.
+
+    def get_stats(self):
+        """ Statistics of all parts over the window.
+
+        Returns:
+            dict: name -> (p50, p95, max) in seconds
+        """
+        stats = {}
+        for name, records in self._records.items():
+            p50, p95 = np.percentile(records, [50, 95])
+            stats[name] = (float(p50), float(p95), float(np.amax(records)))
+        return stats
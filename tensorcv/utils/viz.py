@@ -6,6 +6,51 @@ import matplotlib.pyplot as plt
 import numpy as np
 import scipy.misc
 
+# number of entries of colormap lookup tables
+LUT_SIZE = 256
+_COLORMAP_LUTS = {}
+
+
+def get_colormap_lut(cmap='jet'):
+    """ Lookup table of a matplotlib colormap.
+
+    Args:
+        cmap (str): name of the colormap
+
+    Returns:
+        np.ndarray: uint8 array of size [256, 3]. Entry i is the RGB
+        color of intensities in [i / 256, (i + 1) / 256).
+    """
+    try:
+        return _COLORMAP_LUTS[cmap]
+    except KeyError:
+        colors = plt.get_cmap(cmap)(np.arange(LUT_SIZE) / (LUT_SIZE - 1.0))
+        _COLORMAP_LUTS[cmap] = (colors[:, :3] * 255 + 0.5).astype(np.uint8)
+        return _COLORMAP_LUTS[cmap]
+
+
+def _lut_index(intensity):
+    """ Index of lookup table for intensities in [0, 1] """
+    index = np.asarray(intensity, dtype=np.float32) * LUT_SIZE
+    # NaN is mapped to 0
+    index = np.nan_to_num(index)
+    return np.clip(index, 0, LUT_SIZE - 1).astype(np.uint8)
+
+
+def bytescale(im):
+    """ Scale image to uint8 by its minimum and maximum in the same
+    way as scipy.misc.imsave. uint8 image is returned unchanged.
+    """
+    im = np.asarray(im)
+    if im.dtype == np.uint8:
+        return im
+    low = im.min()
+    scale = float(im.max() - low)
+    if scale == 0:
+        scale = 1.
+    im = (im - low) * (255. / scale)
+    return (im.clip(0, 255) + 0.5).astype(np.uint8)
+
 
 def intensity_to_rgb(intensity, cmap='jet', normalize=False):
     """
@@ -37,13 +82,76 @@ def intensity_to_rgb(intensity, cmap='jet', normalize=False):
     if intensity.ndim == 3:
         return intensity.astype('float32') * 255.0
 
-    cmap = plt.get_cmap(cmap)
-    intensity = cmap(intensity)[..., :3]
-    return intensity.astype('float32') * 255.0
+    return get_colormap_lut(cmap)[_lut_index(intensity)].astype('float32')
+
+
+def batch_intensity_to_rgb(images, cmap='jet', normalize=False):
+    """ Convert a batch of 1-channel images to RGB images employing
+    a colormap. Same as intensity_to_rgb() for each image, but
+    computed for the whole batch at once.
+
+    Args:
+        images (np.ndarray): [BATCH_SIZE, HEIGHT, WIDTH] or
+            [BATCH_SIZE, HEIGHT, WIDTH, CHANNEL]. Images with more
+            than 1 channel are only scaled to [0, 255].
+        cmap (str): name of the colormap to use.
+        normalize (bool): if True, will normalize each image so that
+            it has minimum 0 and maximum 1.
+
+    Returns:
+        np.ndarray: uint8 images of [BATCH_SIZE, HEIGHT, WIDTH, 3]
+    """
+    images = np.asarray(images, dtype=np.float32)
+    if images.ndim == 4 and images.shape[-1] == 1:
+        images = images[..., 0]
+
+    if normalize:
+        axis = tuple(range(1, images.ndim))
+        low = images.min(axis=axis, keepdims=True)
+        scale = images.max(axis=axis, keepdims=True) - low
+        images = (images - low) / np.where(scale > 0, scale, 1.)
+
+    if images.ndim == 4:
+        return (np.clip(images, 0, 1) * 255 + 0.5).astype(np.uint8)
+
+    return get_colormap_lut(cmap)[_lut_index(images)]
+
+
+def tile_images(images, merge_grid):
+    """ Tile a batch of images into a grid by a single reshape and
+    transpose. Empty cells of the grid are filled with 0.
+
+    Args:
+        images (np.ndarray): [BATCH_SIZE, HEIGHT, WIDTH, CHANNEL]
+        merge_grid (list): [rows, columns] of the grid
+
+    Returns:
+        np.ndarray: [rows * HEIGHT, columns * WIDTH, CHANNEL] with the
+        same dtype as images
+    """
+    rows, cols = int(merge_grid[0]), int(merge_grid[1])
+    num_cells = rows * cols
+    bsize, h, w, c = images.shape
+    if bsize < num_cells:
+        pad = np.zeros((num_cells - bsize, h, w, c), dtype=images.dtype)
+        images = np.concatenate((images, pad), axis=0)
+    else:
+        images = images[:num_cells]
+    return images.reshape(rows, cols, h, w, c)\
+                 .transpose(0, 2, 1, 3, 4)\
+                 .reshape(rows * h, cols * w, c)
 
 
 def save_merge_images(images, merge_grid, save_path, color=False, tanh=False):
     """Save multiple images with same size into one larger image.
+    See merge_images().
+    """
+    scipy.misc.imsave(save_path, merge_images(images, merge_grid,
+                                              color=color, tanh=tanh))
+
+
+def merge_images(images, merge_grid, color=False, tanh=False):
+    """Merge multiple images with same size into one larger image.
 
     The best size number is
     int(max(sqrt(image.shape[0]),sqrt(image.shape[1]))) + 1
@@ -52,45 +160,39 @@ def save_merge_images(images, merge_grid, save_path, color=False, tanh=False):
         images (np.ndarray): A batch of image array to be merged with size
             [BATCH_SIZE, HEIGHT, WIDTH, CHANNEL].
         merge_grid (list): List of length 2. The grid size for merge images.
-        save_path (str): Path for saving the merged image.
         color (bool): Whether convert intensity image to color image.
         tanh (bool): If True, will normalize the image in range [-1, 1]
             to [0, 1] (for GAN models).
 
+    Returns:
+        np.ndarray: merged uint8 image with 3 channels. Images without
+        color are scaled by the minimum and maximum of all images.
+
     Example:
         The batch_size is 64, then the size is recommended [8, 8].
         The batch_size is 32, then the size is recommended [6, 6].
     """
 
+    img = np.asarray(images)
     # normalization of tanh output
-    img = images
-
     if tanh:
         img = (img + 1.0) / 2.0
 
-    if color:
-        # TODO
-        img_list = []
-        for im in np.squeeze(img):
-            im = intensity_to_rgb(np.squeeze(im), normalize=True)
-            img_list.append(im)
-        img = np.array(img_list)
-        # img = np.expand_dims(img, 0)
-
-    if len(img.shape) == 2 or (len(img.shape) == 3 and img.shape[2] <= 4):
+    if img.ndim == 2 or (img.ndim == 3 and img.shape[2] <= 4):
         img = np.expand_dims(img, 0)
-    # img = images
-    h, w = img.shape[1], img.shape[2]
-    merge_img = np.zeros((h * merge_grid[0], w * merge_grid[1], 3))
-    if len(img.shape) < 4:
+    if img.ndim < 4:
         img = np.expand_dims(img, -1)
 
-    for idx, image in enumerate(img):
-        i = idx % merge_grid[1]
-        j = idx // merge_grid[1]
-        merge_img[j*h:j*h+h, i*w:i*w+w, :] = image
+    if color:
+        img = batch_intensity_to_rgb(img, normalize=True)
+        merge_img = tile_images(img, merge_grid)
+    else:
+        # scale after tiling, so empty cells are counted as before
+        merge_img = bytescale(tile_images(img, merge_grid))
 
-    scipy.misc.imsave(save_path, merge_img)
+    if merge_img.shape[-1] == 1:
+        merge_img = np.repeat(merge_img, 3, axis=-1)
+    return merge_img
 
 
 def image_overlay(im_1, im_2, color=True, normalize=True):
@@ -107,7 +209,32 @@ def image_overlay(im_1, im_2, color=True, normalize=True):
         np.ndarray: an overlay image of im_1*0.5 + im_2*0.5
     """
     if color:
-        im_1 = intensity_to_rgb(np.squeeze(im_1), normalize=normalize)
-        im_2 = intensity_to_rgb(np.squeeze(im_2), normalize=normalize)
+        return batch_image_overlay(np.squeeze(im_1)[np.newaxis],
+                                   np.squeeze(im_2)[np.newaxis],
+                                   color=True, normalize=normalize)[0]
 
     return im_1*0.5 + im_2*0.5
+
+
+def batch_image_overlay(images_1, images_2, color=True, normalize=True):
+    """Overlay two batches of images with the same size.
+    Same as image_overlay() for each pair of images.
+
+    Args:
+        images_1 (np.ndarray): [BATCH_SIZE, HEIGHT, WIDTH(, CHANNEL)]
+        images_2 (np.ndarray): [BATCH_SIZE, HEIGHT, WIDTH(, CHANNEL)]
+        color (bool): Whether convert intensity images to color images.
+            If True, the overlay is a uint8 RGB batch.
+        normalize (bool): If both color and normalize are True, will
+            normalize each image so that it has minimum 0 and maximum 1.
+
+    Returns:
+        np.ndarray: overlay images of images_1*0.5 + images_2*0.5
+    """
+    if color:
+        images_1 = batch_intensity_to_rgb(images_1, normalize=normalize)
+        images_2 = batch_intensity_to_rgb(images_2, normalize=normalize)
+        return ((images_1.astype(np.uint16) + images_2 + 1) // 2)\
+            .astype(np.uint8)
+
+    return np.asarray(images_1)*0.5 + np.asarray(images_2)*0.5
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: writer.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import atexit
+import threading
+import concurrent.futures
+
+import numpy as np
+import scipy.io
+import scipy.misc
+
+from .viz import merge_images, batch_intensity_to_rgb, bytescale
+
+__all__ = ['ResultWriter', 'get_default_writer', 'save_result',
+           'save_merge_result', 'save_arrays', 'IMAGE_FORMATS',
+           'ARRAY_FORMATS']
+
+# formats of a single result array
+IMAGE_FORMATS = ['png', 'npy', 'npz']
+# formats of a dict of result arrays
+ARRAY_FORMATS = ['mat', 'npz']
+
+
+def save_png(save_path, im, compress_level=None):
+    """ Save image as png.
+
+    Args:
+        save_path (str): path of png file
+        im (np.ndarray): image of size [HEIGHT, WIDTH] or
+            [HEIGHT, WIDTH, CHANNEL]
+        compress_level (int): zlib compression level from 0 (no
+            compression, fastest) to 9. Default to be 6.
+    """
+    im = bytescale(np.squeeze(im))
+    try:
+        from PIL import Image
+    except ImportError:
+        scipy.misc.imsave(save_path, im)
+        return
+    if compress_level is None:
+        Image.fromarray(im).save(save_path)
+    else:
+        Image.fromarray(im).save(save_path, compress_level=compress_level)
+
+
+def save_result(save_path, im, file_format='png', compress_level=None,
+                color=False):
+    """ Save a result array.
+
+    Args:
+        save_path (str): path of file without extension
+        im (np.ndarray): result array
+        file_format (str): 'png' for image, 'npy' or 'npz' for
+            raw result array
+        compress_level (int): compression level of png
+        color (bool): whether convert intensity image to color
+            image (png only)
+    """
+    assert file_format in IMAGE_FORMATS, \
+    'file_format has to be one of {}'.format(IMAGE_FORMATS)
+    save_path = '{}.{}'.format(save_path, file_format)
+    if file_format == 'npy':
+        np.save(save_path, im)
+    elif file_format == 'npz':
+        np.savez_compressed(save_path, result=im)
+    else:
+        if color:
+            im = batch_intensity_to_rgb(np.squeeze(im)[np.newaxis],
+                                        normalize=True)[0]
+        save_png(save_path, im, compress_level=compress_level)
+
+
+def save_merge_result(images, merge_grid, save_path, color=False, tanh=False,
+                      file_format='png', compress_level=None):
+    """ Save a batch of results. Images are merged into one image
+    for png, and the raw batch array is saved for npy and npz.
+    See viz.merge_images() and save_result().
+    """
+    if file_format == 'png':
+        images = merge_images(images, merge_grid, color=color, tanh=tanh)
+    save_result(save_path, images, file_format=file_format,
+                compress_level=compress_level)
+
+
+def save_arrays(save_path, arrays, file_format='mat'):
+    """ Save a dict of result arrays.
+
+    Args:
+        save_path (str): path of file without extension
+        arrays (dict): dict of name and array
+        file_format (str): 'mat' or 'npz'
+    """
+    assert file_format in ARRAY_FORMATS, \
+    'file_format has to be one of {}'.format(ARRAY_FORMATS)
+    save_path = '{}.{}'.format(save_path, file_format)
+    if file_format == 'npz':
+        np.savez_compressed(save_path, **arrays)
+    else:
+        scipy.io.savemat(save_path, arrays)
+
+
+class ResultWriter(object):
+    """ Bounded pool for saving results in background.
+
+    Saving functions are run by worker threads or processes while
+    the session keeps running. At most max_pending results wait in
+    the pool, write() blocks when the pool is full, so memory stays
+    bounded when saving is slower than computing results.
+    Errors of saving are raised by drain().
+    """
+    def __init__(self, num_workers=2, max_pending=16, use_process=False):
+        """
+        Args:
+            num_workers (int): number of workers. 0 for saving in
+                the calling thread.
+            max_pending (int): maximum number of results queued
+                or being saved
+            use_process (bool): use processes instead of threads.
+                Useful when encoding holds the GIL.
+        """
+        self._num_workers = num_workers
+        self._use_process = use_process
+        self._slots = threading.BoundedSemaphore(max(max_pending, 1))
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._error = None
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self._use_process:
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._num_workers)
+            else:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self._num_workers)
+        return self._executor
+
+    def write(self, fnc, *args, **kwargs):
+        """ Run fnc(*args, **kwargs) in background. Block if there are
+        max_pending results in the pool. fnc has to be picklable
+        (defined at module level) if use_process is True.
+        """
+        if self._num_workers <= 0:
+            fnc(*args, **kwargs)
+            return
+        # back-pressure: wait for a free slot
+        self._slots.acquire()
+        try:
+            future = self._get_executor().submit(fnc, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._on_done)
+
+    def _on_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if self._error is None and not future.cancelled():
+                self._error = future.exception()
+        self._slots.release()
+
+    def num_pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    def drain(self):
+        """ Block until all results in the pool are saved.
+        Raise the first error of saving if any.
+        """
+        with self._lock:
+            pending = list(self._pending)
+        concurrent.futures.wait(pending)
+        with self._lock:
+            error = self._error
+            self._error = None
+        if error is not None:
+            raise error
+
+    def close(self):
+        """ Save all pending results and stop workers """
+        try:
+            self.drain()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+
+_DEFAULT_WRITER = None
+_DEFAULT_WRITER_LOCK = threading.Lock()
+
+
+def get_default_writer():
+    """ ResultWriter shared by predictions and inferencers """
+    global _DEFAULT_WRITER
+    with _DEFAULT_WRITER_LOCK:
+        if _DEFAULT_WRITER is None:
+            _DEFAULT_WRITER = ResultWriter()
+            atexit.register(_DEFAULT_WRITER.close)
+        return _DEFAULT_WRITER
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# File: xla.py
+# Author: Qian Ge <geqian1001@gmail.com>
+
+import os
+from contextlib import contextmanager
+
+import tensorflow as tf
+
+__all__ = ['is_xla_available', 'set_global_jit', 'jit_scope', 'setup_xla']
+
+
+def is_xla_available():
+    """ Whether TensorFlow is built with XLA """
+    try:
+        return tf.test.is_built_with_xla()
+    except AttributeError:
+        pass
+    try:
+        from tensorflow.python.client import device_lib
+        return any(d.device_type == 'XLA_CPU'
+                   for d in device_lib.list_local_devices())
+    except Exception:
+        return False
+
+
+def set_global_jit(config):
+    """ Turn on XLA auto-clustering for the whole graph.
+
+    Only ops supported by XLA are clustered and compiled, the others
+    run as usual. CPU clustering has to be enabled by TF_XLA_FLAGS
+    before the first session is created.
+
+    Args:
+        config (tf.ConfigProto): session config
+    """
+    config.graph_options.optimizer_options.global_jit_level =\
+        tf.OptimizerOptions.ON_1
+    xla_flags = os.environ.get('TF_XLA_FLAGS', '')
+    if '--tf_xla_cpu_global_jit' not in xla_flags:
+        os.environ['TF_XLA_FLAGS'] =\
+            (xla_flags + ' --tf_xla_cpu_global_jit').strip()
+
+
+@contextmanager
+def jit_scope(enable=True):
+    """ Ops created inside are compiled by XLA if enable is True and
+    XLA is available. Gradients of these ops are compiled as well.
+    """
+    if not enable:
+        yield
+        return
+    try:
+        from tensorflow.contrib.compiler import jit
+        scope = jit.experimental_jit_scope()
+    except (ImportError, AttributeError):
+        yield
+        return
+    with scope:
+        yield
+
+
+def setup_xla(xla, session_creator, model):
+    """ Setup XLA JIT mode for config of training or prediction.
+    Run without JIT if XLA is not available.
+
+    Args:
+        xla (str): None, 'global' for compiling whole graph
+            or 'scoped' for compiling model._create_model()
+        session_creator (tf.train.SessionCreator): session creator
+            with attribute config for 'global' mode
+        model (ModelDes): model for 'scoped' mode
+    """
+    if xla is None:
+        return
+    assert xla in ['global', 'scoped'], \
+    "xla has to be None, 'global' or 'scoped'!"
+    if not is_xla_available():
+        print('**[warning]** XLA is not available. Run without JIT compilation.')
+        return
+    if xla == 'global':
+        try:
+            set_global_jit(session_creator.config)
+        except AttributeError:
+            print('**[warning]** session_creator has no config. '
+                  'Run without JIT compilation.')
+    else:
+        model.set_jit_scope(True)
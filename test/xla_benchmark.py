@@ -0,0 +1,104 @@
+# File: xla_benchmark.py
+# Author: Qian Ge <geqian1001@gmail.com>
+# Compare training steps/sec on CPU with and without XLA JIT.
+# Example: python xla_benchmark.py --all
+
+import argparse
+import subprocess
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from tensorcv.algorithms.pretrained.VGG import VGG19
+from tensorcv.algorithms.GAN.DCGAN import Model as DCGAN
+from tensorcv.utils.default import get_default_session_config
+from tensorcv.utils.xla import setup_xla
+from tensorcv.utils.sesscreate import NewSessionCreator
+
+MODELS = ['vgg19', 'dcgan']
+XLA_MODES = ['none', 'global', 'scoped']
+
+def build_vgg19(FLAGS):
+    model = VGG19(num_class=1000, im_height=FLAGS.im_size,
+                  im_width=FLAGS.im_size, trainable=True)
+    model.set_batch_size(FLAGS.batch_size)
+    return model
+
+def build_dcgan(FLAGS):
+    model = DCGAN(input_vec_length=100, num_channels=1, im_size=[28, 28])
+    model.set_batch_size(FLAGS.batch_size)
+    return model
+
+def get_train_ops(model, name):
+    if name == 'dcgan':
+        d_op = model.get_discriminator_optimizer().apply_gradients(
+            model.get_discriminator_grads())
+        g_op = model.get_generator_optimizer().apply_gradients(
+            model.get_generator_grads())
+        return [d_op, g_op]
+    return [model.get_optimizer().apply_gradients(model.get_grads())]
+
+def get_random_feed(model, FLAGS):
+    feed = model.get_graph_feed()
+    for plh in model.get_train_placeholder():
+        shape = [FLAGS.batch_size] + plh.get_shape().as_list()[1:]
+        if plh.dtype.is_integer:
+            feed[plh] = np.random.randint(0, 1000, size=shape)
+        else:
+            feed[plh] = np.random.uniform(-1, 1, size=shape)
+    return feed
+
+def benchmark(FLAGS):
+    model = build_vgg19(FLAGS) if FLAGS.model == 'vgg19' else build_dcgan(FLAGS)
+    xla = None if FLAGS.xla == 'none' else FLAGS.xla
+    session_creator = NewSessionCreator(config=get_default_session_config())
+    setup_xla(xla, session_creator, model)
+
+    model.create_graph()
+    train_ops = get_train_ops(model, FLAGS.model)
+    sess = session_creator.create_session()
+    feed = get_random_feed(model, FLAGS)
+
+    for step in range(0, FLAGS.warmup + FLAGS.steps):
+        if step == FLAGS.warmup:
+            start_time = time.time()
+        for train_op in train_ops:
+            sess.run(train_op, feed_dict=feed)
+    step_per_sec = FLAGS.steps / (time.time() - start_time)
+    print('{} xla={}: {:.3f} steps/sec'.format(
+        FLAGS.model, FLAGS.xla, step_per_sec))
+
+def run_all(FLAGS):
+    # each mode runs in a new process since XLA flags are read once
+    for model_name in MODELS:
+        for xla in XLA_MODES:
+            subprocess.call([sys.executable, __file__,
+                             '--model', model_name, '--xla', xla,
+                             '--batch_size', str(FLAGS.batch_size),
+                             '--im_size', str(FLAGS.im_size),
+                             '--steps', str(FLAGS.steps),
+                             '--warmup', str(FLAGS.warmup)])
+
+def get_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model', default='vgg19', choices=MODELS)
+    parser.add_argument('--xla', default='none', choices=XLA_MODES)
+    parser.add_argument('--batch_size', default=8, type=int)
+    parser.add_argument('--im_size', default=224, type=int,
+                        help='Size of input images of VGG19')
+    parser.add_argument('--steps', default=20, type=int)
+    parser.add_argument('--warmup', default=5, type=int)
+    parser.add_argument('--all', action='store_true',
+                        help='Run all the models and XLA modes')
+
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    FLAGS = get_args()
+    if FLAGS.all:
+        run_all(FLAGS)
+    else:
+        benchmark(FLAGS)